@@ -0,0 +1,265 @@
+# rando_sim/benchmark.py
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import instrumentation
+import synthetic_data
+from compact_graph import CompactGraph
+from instrumentation import current_rss
+from isochrone import IsochroneBuilder
+from pipeline import Pipeline
+from routing import Router
+from snapping import SnapIndex
+
+# Échelles en nombre de segments du réseau
+SCALES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '5M': 5_000_000}
+DEFAULT_SCALES = ('10k', '100k')
+# Période d'échantillonnage de la mémoire résidente pendant une étape
+RSS_SAMPLE_S = 0.01
+RESULTS_DIR = Path("./data/benchmarks")
+
+
+class Measure:
+    """Mesure d'un bloc : durée, temps CPU et pic de mémoire résidente (échantillonné par un thread)."""
+
+    def __init__(self):
+        self.result = {}
+        self._stop = threading.Event()
+        self._peak = 0
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_S):
+            self._peak = max(self._peak, current_rss())
+
+    def __enter__(self):
+        self._start_rss = self._peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self._started = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._started
+        cpu_seconds = time.process_time() - self._cpu
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, current_rss())
+        self.result.update(seconds=seconds, cpu_seconds=cpu_seconds,
+                           peak_rss_mb=self._peak / 1024 ** 2,
+                           peak_rss_delta_mb=(self._peak - self._start_rss) / 1024 ** 2)
+        return False
+
+
+def _quiet(function, *args, verbose=False, **kwargs):
+    """Appelle une fonction en masquant ses messages de progression (sauf en mode verbeux)."""
+    if verbose:
+        return function(*args, **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def _measured(function, *args, verbose=False, **kwargs):
+    with Measure() as measure:
+        value = _quiet(function, *args, verbose=verbose, **kwargs)
+    return measure.result, value
+
+
+def benchmark_pipeline(workdir, verbose=False, **pipeline_kwargs):
+    """Chaque étape de la chaîne de traitement, mesurée séparément (données brutes dans workdir/raw).
+
+    Les sous-étapes et compteurs de l'instrumentation sont joints à chaque étape.
+    """
+    pipeline = Pipeline(workdir / "raw", workdir / "processed", **pipeline_kwargs)
+    results = {}
+    for stage in pipeline.stages:
+        run = stage.run
+
+        def measured_run(stage, run=run):
+            with Measure() as measure:
+                try:
+                    run(stage)
+                finally:
+                    results[stage.name] = measure.result
+            return None
+
+        stage.run = measured_run
+    with instrumentation.record(sample_interval=None) as run:
+        report = _quiet(pipeline.run, verbose=verbose)
+    for step in report:
+        results.setdefault(step['stage'], {})['status'] = step['status']
+    for stage_span in run.report()['spans']:
+        if stage_span['name'] in results:
+            results[stage_span['name']]['counters'] = stage_span.get('counters', {})
+            steps = results[stage_span['name']]['steps'] = {}
+            for child in stage_span.get('children', []):
+                steps[child['name']] = steps.get(child['name'], 0.0) + child['seconds']
+    return results
+
+
+def benchmark_queries(graph, index, n_queries=50, seed=0):
+    """Requêtes représentatives : itinéraires (A*, Dijkstra bidirectionnel), accrochage, isochrone."""
+    rng = np.random.default_rng(seed)
+    results = {}
+
+    with Measure() as measure:
+        router = Router(graph)
+    results['router_init'] = measure.result
+
+    pairs = rng.integers(0, graph.n_nodes, size=(n_queries, 2)).tolist()
+    for method in ('astar', 'bidirectional'):
+        found = 0
+        with Measure() as measure:
+            for source, target in pairs:
+                try:
+                    router.route(source, target, weight='time', method=method)
+                    found += 1
+                except ValueError:
+                    pass
+        results[f'route_{method}'] = dict(measure.result, n_queries=n_queries, found=found,
+                                          ms_per_query=1000 * measure.result['seconds'] / n_queries)
+
+    xmin, xmax, ymin, ymax = graph.x.min(), graph.x.max(), graph.y.min(), graph.y.max()
+    points = np.column_stack([rng.uniform(xmin, xmax, 1000), rng.uniform(ymin, ymax, 1000)])
+    with Measure() as measure:
+        index.nearest_edge(points[:, 0], points[:, 1])
+    results['snap_1000_points_first'] = measure.result
+    with Measure() as measure:
+        index.nearest_edge(points[:, 0], points[:, 1])
+    results['snap_1000_points'] = measure.result
+
+    builder = IsochroneBuilder(graph, router)
+    with Measure() as measure:
+        builder.compute([int(rng.integers(graph.n_nodes))], [900, 1800], weight='time')
+    results['isochrone_30min'] = measure.result
+    return results
+
+
+def benchmark_scale(name, n_segments, workdir, keep=False, n_queries=50, verbose=False, seed=0,
+                    dem_cell=25.0, **pipeline_kwargs):
+    """Génération, chaîne de traitement, sauvegarde / chargement et requêtes à une échelle donnée."""
+    workdir = Path(workdir) / name
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(f"=== {name} : {n_segments} segments ===")
+
+    result = {'n_segments': n_segments}
+    measure, summary = _measured(synthetic_data.generate, workdir / "raw", n_segments=n_segments,
+                                 dem_cell=dem_cell, seed=seed)
+    result['generate'] = dict(measure, **summary)
+    print(f"  génération : {measure['seconds']:.1f} s")
+
+    result['stages'] = benchmark_pipeline(workdir, verbose=verbose, **pipeline_kwargs)
+    for stage, values in result['stages'].items():
+        print(f"  {stage:<13} {values.get('status', '-'):<7} {values.get('seconds', 0.0):8.1f} s "
+              f"{values.get('peak_rss_mb', 0.0):8.0f} Mo")
+
+    graph_dir = workdir / "processed" / "routing_graph"
+    measure, graph = _measured(CompactGraph.load, graph_dir, mmap=False, verbose=verbose)
+    result['load'] = dict(measure, n_nodes=graph.n_nodes, n_edges=graph.n_edges, nbytes=graph.nbytes())
+    measure, _ = _measured(graph.save, workdir / "saved_graph", verbose=verbose)
+    result['save'] = measure
+    measure, index = _measured(SnapIndex.load, graph_dir, graph, verbose=verbose)
+    result['load_snap_index'] = measure
+    print(f"  chargement : {result['load']['seconds']:.2f} s, sauvegarde : {result['save']['seconds']:.2f} s")
+
+    result['queries'] = benchmark_queries(graph, index, n_queries=n_queries, seed=seed)
+    for query, values in result['queries'].items():
+        print(f"  {query:<24} {values['seconds'] * 1000:9.1f} ms")
+
+    if not keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales=DEFAULT_SCALES, workdir=None, output_dir=RESULTS_DIR, **kwargs):
+    """Lance les échelles demandées et écrit les résultats en JSON (un fichier par passage)."""
+    workdir = Path(workdir or output_dir / "work")
+    commit = _git_commit()
+    results = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scales': {},
+    }
+    for name in scales:
+        results['scales'][name] = benchmark_scale(name, SCALES[name], workdir, **kwargs)
+
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    path = output_dir / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}_{commit or 'nogit'}.json"
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Résultats écrits dans {path}")
+    return results, path
+
+
+def compare(baseline, candidate, threshold=0.1):
+    """Compare deux fichiers de résultats : écarts relatifs de durée et de mémoire par étape et requête.
+
+    Renvoie les lignes (échelle, mesure, avant, après, écart) dont l'écart dépasse `threshold`.
+    """
+    with open(baseline) as f:
+        before = json.load(f)
+    with open(candidate) as f:
+        after = json.load(f)
+
+    def flatten(scale):
+        rows = {'generate': scale.get('generate', {}), 'load': scale.get('load', {}), 'save': scale.get('save', {})}
+        rows.update({f"stage.{name}": values for name, values in scale.get('stages', {}).items()})
+        rows.update({f"query.{name}": values for name, values in scale.get('queries', {}).items()})
+        return rows
+
+    changes = []
+    for scale_name in sorted(set(before['scales']) & set(after['scales'])):
+        old, new = flatten(before['scales'][scale_name]), flatten(after['scales'][scale_name])
+        for row in sorted(set(old) & set(new)):
+            for metric in ('seconds', 'peak_rss_mb'):
+                a, b = old[row].get(metric), new[row].get(metric)
+                if not a or b is None:
+                    continue
+                change = (b - a) / a
+                if abs(change) >= threshold:
+                    changes.append((scale_name, f"{row}.{metric}", a, b, change))
+
+    print(f"{before.get('commit')} -> {after.get('commit')} : {len(changes)} écart(s) de plus de {threshold:.0%}")
+    for scale_name, metric, a, b, change in changes:
+        print(f"  {scale_name:<5} {metric:<40} {a:10.2f} -> {b:10.2f} ({change:+.0%})")
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc d'essai sur données synthétiques (BD TOPO / RGEALTI)")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(DEFAULT_SCALES))
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--cost-surface-resolution', type=float, default=25.0)
+    parser.add_argument('--output-dir', default=str(RESULTS_DIR))
+    parser.add_argument('--keep', action='store_true', help="Conserve les données générées et traitées")
+    parser.add_argument('--compare', nargs=2, metavar=('AVANT', 'APRES'), help="Compare deux fichiers de résultats")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(scales=args.scales, output_dir=Path(args.output_dir), keep=args.keep, n_queries=args.queries,
+            cost_surface_resolution=args.cost_surface_resolution)
@@ -1,37 +1,51 @@
 # scripts/build_graph.py
-from data_processor import DataProcessor
+import argparse
+
+import instrumentation
 from graph import GraphBuilder
+from instrumentation import progress
+from pipeline import Pipeline
+from rendering import NetworkRenderer
 from pathlib import Path
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Traitement des données et construction du graphe")
+    parser.add_argument('--profile', nargs='*', default=[], metavar='ETAPE',
+                        help="Étapes ou sous-étapes à profiler avec cProfile (ex. graph, unify, read_file)")
+    parser.add_argument('--trace-memory', nargs='*', default=[], metavar='ETAPE',
+                        help="Étapes dont les allocations sont suivies avec tracemalloc")
+    parser.add_argument('--report', default=None, help="Rapport JSON du passage (défaut : data/processed)")
+    parser.add_argument('--tiles', nargs='*', metavar='COULEUR',
+                        help="Pyramides de tuiles à écrire dans data/processed/tiles (ex. surface_type slope time)")
+    parser.add_argument('--min-zoom', type=int, default=8)
+    parser.add_argument('--max-zoom', type=int, default=15)
+    args = parser.parse_args()
+
+    raw_data_dir = Path("./data/raw")
     processed_data_dir = Path("./data/processed")
-    
-    # 1. Traitement des données
-    print("Traitement des données spatiales...")
-    processor = DataProcessor(processed_data_dir)
-    processor.load_processed_data()
-    network = processor.create_unified_network()
-    
-    try:
-        # Cette étape peut échouer si le MNT n'est pas disponible
-        network = processor.add_elevation_to_network()
-        print("Élévation ajoutée au réseau.")
-    except Exception as e:
-        print(f"Impossible d'ajouter l'élévation: {e}")
-        print("Utilisation du réseau sans information d'élévation.")
-    
-    # 2. Construction du graphe
-    print("\nConstruction du graphe de déplacement...")
-    builder = GraphBuilder(processed_data_dir)
-    graph = builder.build_graph()
-    
-    # 3. Sauvegarde du graphe
-    graph_path = builder.save_graph()
-    
-    # 4. Visualisation d'un échantillon
-    print("\nCréation d'une visualisation...")
-    viz_path = processed_data_dir / "graph_sample.png"
-    builder.visualize_sample(radius=20, output_file=viz_path)
-    
+
+    # Durées, mémoire et compteurs de chaque étape, enregistrés dans run_report.json
+    with instrumentation.record(profile=args.profile, trace_memory=args.trace_memory,
+                                output_dir=processed_data_dir / "profiles") as run:
+        # 1. Chaîne de traitement incrémentale : seules les étapes dont les entrées ou les
+        # paramètres ont changé sont relancées (voir data/processed/pipeline_manifest.json)
+        progress("Traitement des données spatiales et construction du graphe...")
+        pipeline = Pipeline(raw_data_dir, processed_data_dir, noding_tolerance=0.5)
+        pipeline.run()
+
+        # 2. Visualisation du réseau complet, et tuiles pour la carte Leaflet si demandé
+        progress("\nCréation d'une visualisation...")
+        builder = GraphBuilder(processed_data_dir)
+        graph = builder.load_compact_graph()
+        builder.visualize(output_file=processed_data_dir / "network.png")
+        if args.tiles:
+            for color_by in args.tiles:
+                NetworkRenderer(graph, color_by=color_by).write_tiles(
+                    processed_data_dir / "tiles" / color_by, min_zoom=args.min_zoom, max_zoom=args.max_zoom)
+
+    report_path = run.save(args.report or processed_data_dir / "run_report.json")
+    print()
+    print(run.summary())
+    print(f"\nRapport d'exécution : {report_path}")
     print("\nTraitement terminé!")
-    print(f"Graphe créé avec {len(graph.nodes())} nœuds et {len(graph.edges())} arêtes.")
\ No newline at end of file
+    print(f"Graphe créé avec {graph.n_nodes} nœuds et {graph.n_edges} arêtes.")
@@ -0,0 +1,479 @@
+# rando_sim/chains.py
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+from compact_graph import CompactGraph, replace_directory
+from enrichment import HYDRO_CROSSINGS
+from instrumentation import progress
+from routing import Route, Router, dijkstra
+
+CHAINS_FILE = "chains.npz"
+CHAINS_FORMAT_VERSION = 1
+
+# Agrégation des colonnes d'arêtes le long d'une chaîne : somme pour les grandeurs additives,
+# maximum pour les maxima, moyenne pondérée par la longueur pour les autres (pente, parts de végétation)
+SUM_PREFIXES = ('distance', 'time', 'effort', 'length', 'ascent', 'descent', HYDRO_CROSSINGS)
+MAX_PREFIXES = ('max_',)
+
+
+class ChainGeometries:
+    """Géométries des chaînes, assemblées à la demande à partir des segments du graphe d'origine."""
+
+    def __init__(self, original, chain_offsets, chain_members):
+        self.original = original
+        self.chain_offsets = chain_offsets
+        self.chain_members = chain_members
+
+    def __len__(self):
+        return len(self.chain_offsets) - 1
+
+    def __getitem__(self, chain):
+        edges = self.chain_members[self.chain_offsets[chain]:self.chain_offsets[chain + 1]].tolist()
+        # Même assemblage qu'un itinéraire : segments orientés mis bout à bout
+        return Route(self.original, [int(self.original.sources[edges[0]])], edges, None, 0.0).geometry
+
+    def materialize(self):
+        return np.array([self[chain] for chain in range(len(self))], dtype=object)
+
+
+class ChainContraction:
+    """Graphe simplifié : chaque chaîne de nœuds de degré 2 devient une seule arête par sens.
+
+    Les colonnes des arêtes fusionnées sont agrégées sens par sens ; chaque arête garde la
+    liste ordonnée des arêtes d'origine qu'elle remplace (`members`), ce qui permet de
+    déplier un itinéraire sur le graphe d'origine pour l'affichage. Les nœuds supprimés
+    restent utilisables comme départ ou arrivée (découpage virtuel de leur chaîne).
+    """
+
+    def __init__(self, original, graph, kept_nodes, member_offsets, members, chain_offsets, chain_members,
+                 chain_edges, node_chain, node_position, stats=None):
+        self.original = original
+        self.graph = graph
+        self.kept_nodes = np.asarray(kept_nodes, dtype=np.int64)
+        self.member_offsets = np.asarray(member_offsets, dtype=np.int64)
+        self.members = np.asarray(members, dtype=np.int64)
+        self.chain_offsets = np.asarray(chain_offsets, dtype=np.int64)
+        self.chain_members = np.asarray(chain_members, dtype=np.int64)
+        self.chain_edges = np.asarray(chain_edges, dtype=np.int64)
+        self.node_chain = np.asarray(node_chain, dtype=np.int64)
+        self.node_position = np.asarray(node_position, dtype=np.int64)
+        self.stats = stats or {}
+
+        self.node_map = np.full(original.n_nodes, -1, dtype=np.int64)
+        self.node_map[self.kept_nodes] = np.arange(len(self.kept_nodes))
+        self._router = None
+        self._original_weights = {}
+
+    # --- Construction ----------------------------------------------------------------
+
+    @staticmethod
+    def _segments(graph):
+        """Segments non orientés du graphe : extrémités et arêtes aller / retour."""
+        forward = np.flatnonzero(~graph.edge_reversed)
+        backward = np.flatnonzero(graph.edge_reversed)
+        n_segments = int(graph.segment_ids.max()) + 1 if graph.n_edges else 0
+        forward_edge = np.full(n_segments, -1, dtype=np.int64)
+        reverse_edge = np.full(n_segments, -1, dtype=np.int64)
+        forward_edge[graph.segment_ids[forward]] = forward
+        reverse_edge[graph.segment_ids[backward]] = backward
+        if (forward_edge < 0).any() or (reverse_edge < 0).any():
+            raise ValueError("Chaque segment doit avoir une arête aller et une arête retour")
+        return graph.sources[forward_edge].astype(np.int64), graph.targets[forward_edge].astype(np.int64), \
+            forward_edge, reverse_edge
+
+    @classmethod
+    def build(cls, graph):
+        """Fusionne les chaînes de nœuds de degré 2 (deux segments distincts vers deux voisins distincts)."""
+        started = time.perf_counter()
+        seg_start, seg_end, forward_edge, reverse_edge = cls._segments(graph)
+        n_segments = len(seg_start)
+
+        # Segments incidents à chaque nœud (CSR) et nœud à l'autre bout
+        ends = np.concatenate([seg_start, seg_end])
+        order = np.argsort(ends, kind='stable')
+        incident_segments = np.concatenate([np.arange(n_segments), np.arange(n_segments)])[order]
+        other_ends = np.concatenate([seg_end, seg_start])[order]
+        degree = np.bincount(ends, minlength=graph.n_nodes)
+        incident_offsets = np.zeros(graph.n_nodes + 1, dtype=np.int64)
+        incident_offsets[1:] = np.cumsum(degree)
+
+        # Nœud de passage : deux segments, ni boucle ni deux segments vers le même voisin
+        passable = degree == 2
+        passable[seg_start[seg_start == seg_end]] = False
+        candidates = np.flatnonzero(passable)
+        first = incident_offsets[candidates]
+        passable[candidates[other_ends[first] == other_ends[first + 1]]] = False
+
+        # Parcours des chaînes depuis chaque nœud conservé (listes Python : accès élément par élément)
+        starts_list, ends_list = seg_start.tolist(), seg_end.tolist()
+        forward_list, reverse_list = forward_edge.tolist(), reverse_edge.tolist()
+        offsets_list, incident_list = incident_offsets.tolist(), incident_segments.tolist()
+        passable_list = passable.tolist()
+        visited = [False] * n_segments
+        node_chain = [-1] * graph.n_nodes
+        node_position = [-1] * graph.n_nodes
+        chain_from, chain_to, chain_offsets, chain_members = [], [], [0], []
+
+        def walk(start, segment):
+            chain = len(chain_from)
+            node = start
+            while True:
+                visited[segment] = True
+                if starts_list[segment] == node:
+                    chain_members.append(forward_list[segment])
+                    node = ends_list[segment]
+                else:
+                    chain_members.append(reverse_list[segment])
+                    node = starts_list[segment]
+                if not passable_list[node] or node == start:
+                    break
+                # Nœud supprimé : arrivée de l'arête de rang `position` de sa chaîne
+                node_chain[node] = chain
+                node_position[node] = len(chain_members) - 1 - chain_offsets[-1]
+                a, b = incident_list[offsets_list[node]], incident_list[offsets_list[node] + 1]
+                segment = b if a == segment else a
+            chain_from.append(start)
+            chain_to.append(node)
+            chain_offsets.append(len(chain_members))
+
+        for node in np.flatnonzero(~passable).tolist():
+            for i in range(offsets_list[node], offsets_list[node + 1]):
+                if not visited[incident_list[i]]:
+                    walk(node, incident_list[i])
+        # Cycles isolés de nœuds de passage : un nœud de chaque cycle est conservé
+        for segment in range(n_segments):
+            if not visited[segment]:
+                passable_list[starts_list[segment]] = False
+                walk(starts_list[segment], segment)
+
+        kept_nodes = np.flatnonzero(~np.array(passable_list, dtype=bool))
+        chain_offsets = np.array(chain_offsets, dtype=np.int64)
+        chain_members = np.array(chain_members, dtype=np.int64)
+        opposite = np.empty(graph.n_edges, dtype=np.int64)
+        opposite[forward_edge] = reverse_edge
+        opposite[reverse_edge] = forward_edge
+
+        # Arêtes orientées : aller (2c) puis retour (2c + 1) de chaque chaîne c ; le retour
+        # parcourt les arêtes opposées dans l'ordre inverse
+        n_chains = len(chain_from)
+        lengths = np.diff(chain_offsets)
+        chain = np.repeat(np.arange(n_chains), lengths)
+        rank = np.arange(len(chain_members)) - chain_offsets[chain]
+        backward = opposite[chain_members[chain_offsets[chain + 1] - 1 - rank]]
+        directed_offsets = np.zeros(2 * n_chains + 1, dtype=np.int64)
+        directed_offsets[1:] = np.cumsum(np.repeat(lengths, 2))
+        directed_members = np.empty(2 * len(chain_members), dtype=np.int64)
+        directed_members[directed_offsets[2 * chain] + rank] = chain_members
+        directed_members[directed_offsets[2 * chain + 1] + rank] = backward
+
+        node_map = np.full(graph.n_nodes, -1, dtype=np.int64)
+        node_map[kept_nodes] = np.arange(len(kept_nodes))
+        sources = node_map[np.column_stack([chain_from, chain_to]).ravel()]
+        targets = node_map[np.column_stack([chain_to, chain_from]).ravel()]
+        edge_data = cls._aggregate(graph, directed_members, directed_offsets)
+        edge_categories = cls._dominant_categories(graph, directed_members, directed_offsets)
+        first_segments = graph.segment_ids[chain_members[chain_offsets[:-1]]]
+
+        contracted = CompactGraph._from_edge_list(
+            len(kept_nodes), sources, targets, graph.x[kept_nodes], graph.y[kept_nodes], edge_data,
+            np.repeat(np.arange(n_chains), 2), np.tile([False, True], n_chains),
+            ChainGeometries(graph, chain_offsets, chain_members), graph.segment_labels[first_segments],
+            edge_categories, node_labels=kept_nodes)
+
+        # Même tri stable que _from_edge_list : arêtes d'origine de chaque arête du graphe simplifié
+        order = np.argsort(sources, kind='stable')
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        sorted_lengths = np.diff(directed_offsets)[order]
+        member_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        member_offsets[1:] = np.cumsum(sorted_lengths)
+        gather = np.repeat(directed_offsets[order] - member_offsets[:-1], sorted_lengths) + \
+            np.arange(len(directed_members))
+        members = directed_members[gather]
+
+        stats = {
+            'build_time_s': time.perf_counter() - started,
+            'n_nodes': int(graph.n_nodes),
+            'n_edges': int(graph.n_edges),
+            'n_nodes_contracted': int(len(kept_nodes)),
+            'n_edges_contracted': int(contracted.n_edges),
+            'nbytes': int(graph.nbytes()),
+            'nbytes_contracted': int(contracted.nbytes()),
+        }
+        contraction = cls(graph, contracted, kept_nodes, member_offsets, members, chain_offsets, chain_members,
+                          position.reshape(-1, 2), node_chain, node_position, stats)
+        progress(f"Fusion des chaînes de degré 2 : {graph.n_nodes} -> {len(kept_nodes)} nœuds "
+                 f"(-{contraction.reduction('nodes'):.0%}), {graph.n_edges} -> {contracted.n_edges} arêtes "
+                 f"(-{contraction.reduction('edges'):.0%}) en {stats['build_time_s']:.1f} s")
+        return contraction
+
+    @staticmethod
+    def _aggregate(graph, members, offsets):
+        """Colonnes des arêtes fusionnées, agrégées sur les arêtes d'origine de chacune."""
+        starts = offsets[:-1]
+        length = graph.edge_data.get('distance', graph.edge_data.get('length_m'))
+        length = length[members].astype(np.float64) if length is not None else np.ones(len(members))
+        total_length = np.add.reduceat(length, starts)
+
+        edge_data = {}
+        for name, values in graph.edge_data.items():
+            values = values[members].astype(np.float64)
+            if name.startswith(SUM_PREFIXES):
+                edge_data[name] = np.add.reduceat(values, starts)
+            elif name.startswith(MAX_PREFIXES):
+                edge_data[name] = np.maximum.reduceat(values, starts)
+            else:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    mean = np.add.reduceat(values * length, starts) / total_length
+                # Chaîne de longueur nulle : simple moyenne
+                edge_data[name] = np.where(total_length > 0, mean,
+                                           np.add.reduceat(values, starts) / np.diff(offsets))
+        return edge_data
+
+    @staticmethod
+    def _dominant_categories(graph, members, offsets):
+        """Colonnes catégorielles : valeur de l'arête d'origine la plus longue de chaque chaîne."""
+        if not graph.edge_categories:
+            return {}
+        length = graph.edge_data.get('distance', graph.edge_data.get('length_m'))
+        length = length[members] if length is not None else np.zeros(len(members))
+        group = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        longest = np.lexsort((-length, group))[offsets[:-1]]
+        return {name: (codes[members[longest]], labels) for name, (codes, labels) in graph.edge_categories.items()}
+
+    # --- Statistiques ----------------------------------------------------------------
+
+    def reduction(self, what='nodes'):
+        """Part des nœuds ('nodes') ou des arêtes ('edges') supprimés par la fusion."""
+        before, after = self.stats[f'n_{what}'], self.stats[f'n_{what}_contracted']
+        return 1.0 - after / before if before else 0.0
+
+    def report(self):
+        """Résumé de la réduction du graphe (nœuds, arêtes, mémoire)."""
+        return {
+            **self.stats,
+            'node_reduction': self.reduction('nodes'),
+            'edge_reduction': self.reduction('edges'),
+            'mean_chain_length': float(np.mean(np.diff(self.chain_offsets))) if len(self.chain_offsets) > 1 else 0.0,
+        }
+
+    # --- Itinéraires -----------------------------------------------------------------
+
+    @property
+    def router(self):
+        if self._router is None:
+            self._router = Router(self.graph)
+        return self._router
+
+    def original_weights(self, weight):
+        """Poids des arêtes d'origine (float64), mis en cache par colonne."""
+        if weight not in self._original_weights:
+            if weight not in self.original.edge_data:
+                raise ValueError(f"Poids inconnu : {weight}")
+            self._original_weights[weight] = self.original.edge_data[weight].astype(np.float64)
+        return self._original_weights[weight]
+
+    def weights(self, weight):
+        """Poids des arêtes fusionnées, sommés en double précision à partir des arêtes d'origine.
+
+        La somme float32 stockée dans `graph.edge_data` suffit pour l'affichage ; la recherche
+        utilise celle-ci pour donner exactement les coûts du graphe d'origine.
+        """
+        key = ('contracted', weight)
+        if key not in self._original_weights:
+            values = self.original_weights(weight)[self.members]
+            self._original_weights[key] = np.add.reduceat(values, self.member_offsets[:-1]).tolist() \
+                if len(values) else []
+        return self._original_weights[key]
+
+    def _chain(self, node):
+        """Chaîne d'un nœud supprimé : (arêtes d'origine dans le sens aller, rang du nœud, extrémités)."""
+        chain = int(self.node_chain[node])
+        edges = self.chain_members[self.chain_offsets[chain]:self.chain_offsets[chain + 1]]
+        start = int(self.original.sources[edges[0]])
+        end = int(self.original.targets[edges[-1]])
+        return chain, edges, int(self.node_position[node]), start, end
+
+    def _opposite(self, edges):
+        """Arêtes de sens opposé (même segment), dans l'ordre inverse de parcours."""
+        chain_edges = []
+        for edge in edges[::-1].tolist():
+            segment = self.original.segment_ids[edge]
+            start = self.original.targets[edge]
+            for candidate in self.original.out_edges(start):
+                if self.original.segment_ids[candidate] == segment and candidate != edge:
+                    chain_edges.append(candidate)
+                    break
+        return chain_edges
+
+    def _departures(self, node, weights):
+        """Nœuds du graphe simplifié atteignables depuis un nœud d'origine : {nœud: (coût, arêtes)}."""
+        if self.node_map[node] >= 0:
+            return {int(self.node_map[node]): (0.0, [])}
+        _, edges, position, start, end = self._chain(node)
+        return self._ends([(end, edges[position + 1:].tolist()), (start, self._opposite(edges[:position + 1]))],
+                          weights)
+
+    def _arrivals(self, node, weights):
+        """Nœuds du graphe simplifié depuis lesquels on rejoint un nœud d'origine : {nœud: (coût, arêtes)}."""
+        if self.node_map[node] >= 0:
+            return {int(self.node_map[node]): (0.0, [])}
+        _, edges, position, start, end = self._chain(node)
+        return self._ends([(start, edges[:position + 1].tolist()), (end, self._opposite(edges[position + 1:]))],
+                          weights)
+
+    def _ends(self, candidates, weights):
+        """Coût et arêtes vers chaque extrémité de chaîne (la moins chère si la chaîne est un cycle)."""
+        ends = {}
+        for node, edges in candidates:
+            cost = float(weights[np.asarray(edges, dtype=np.int64)].sum())
+            node = int(self.node_map[node])
+            if node not in ends or cost < ends[node][0]:
+                ends[node] = (cost, edges)
+        return ends
+
+    def route(self, source, target, weight='time'):
+        """Itinéraire entre deux nœuds du graphe d'origine, calculé sur le graphe simplifié.
+
+        Le résultat est déplié : c'est un Route du graphe d'origine (nœuds, arêtes, géométrie).
+        """
+        if source == target:
+            return Route(self.original, [source], [], weight, 0.0)
+        weights = self.original_weights(weight)
+        departures = {node: value for node, value in self._departures(source, weights).items()
+                      if value[0] < math.inf}
+        arrivals = self._arrivals(target, weights)
+
+        router = self.router
+        settled, pred_edge = dijkstra(router._offsets, router._targets, self.weights(weight),
+                                      {node: cost for node, (cost, _) in departures.items()},
+                                      stop_at=[node for node, (cost, _) in arrivals.items() if cost < math.inf])
+        candidates = [(settled[node] + cost, node) for node, (cost, _) in arrivals.items() if node in settled]
+        best, end = min(candidates, default=(math.inf, None))
+
+        # Deux nœuds de la même chaîne : le trajet direct le long de la chaîne peut être meilleur
+        if self.node_map[source] < 0 and self.node_map[target] < 0 \
+                and self.node_chain[source] == self.node_chain[target]:
+            _, edges, i, _, _ = self._chain(source)
+            j = int(self.node_position[target])
+            direct_edges = edges[i + 1:j + 1].tolist() if j > i else self._opposite(edges[j + 1:i + 1])
+            direct = float(weights[np.asarray(direct_edges, dtype=np.int64)].sum())
+            if direct <= best:
+                return self._expanded(source, direct_edges, weight, direct)
+
+        if end is None or not math.isfinite(best):
+            raise ValueError(f"Aucun itinéraire entre les nœuds {source} et {target}")
+
+        contracted = []
+        node = end
+        # Un nœud de départ sans arête prédécesseur est l'une des extrémités de la chaîne d'origine
+        while node in pred_edge:
+            edge = pred_edge[node]
+            contracted.append(edge)
+            node = router._edge_source(edge)
+        contracted.reverse()
+        edges = departures[node][1] + self.expand_edges(contracted) + arrivals[end][1]
+        return self._expanded(source, edges, weight, best)
+
+    def _expanded(self, source, edges, weight, cost):
+        nodes = [int(source)] + self.original.targets[np.asarray(edges, dtype=np.int64)].tolist()
+        return Route(self.original, nodes, [int(edge) for edge in edges], weight, cost)
+
+    def expand_edges(self, edges):
+        """Arêtes d'origine (dans l'ordre de parcours) d'une suite d'arêtes du graphe simplifié."""
+        expanded = []
+        for edge in edges:
+            expanded.extend(self.members[self.member_offsets[edge]:self.member_offsets[edge + 1]].tolist())
+        return expanded
+
+    def expand(self, route):
+        """Déplie un itinéraire du graphe simplifié en itinéraire du graphe d'origine."""
+        edges = self.expand_edges(route.edges)
+        return self._expanded(int(self.kept_nodes[route.nodes[0]]), edges, route.weight, route.cost)
+
+    def benchmark(self, n_queries=100, weight='time', seed=0, rel_tol=1e-6):
+        """Compare temps de requête et coûts (Dijkstra) sur le graphe d'origine et le graphe simplifié.
+
+        Les paires de nœuds sont tirées au hasard parmi tous les nœuds d'origine, y compris
+        ceux supprimés par la fusion. Renvoie un dictionnaire de statistiques.
+        """
+        original = Router(self.original)
+        weights = original.weights(weight)
+        # Listes Python préparées hors chronométrage
+        self.router, self.weights(weight)
+        rng = np.random.default_rng(seed)
+        pairs = rng.integers(0, self.original.n_nodes, size=(n_queries, 2)).tolist()
+
+        timings = {'original': 0.0, 'contracted': 0.0}
+        mismatches = 0
+        for source, target in pairs:
+            started = time.perf_counter()
+            settled, _ = dijkstra(original._offsets, original._targets, weights, [source], stop_at=[target])
+            timings['original'] += time.perf_counter() - started
+            expected = settled.get(target, math.inf)
+
+            started = time.perf_counter()
+            try:
+                cost = self.route(source, target, weight).cost
+            except ValueError:
+                cost = math.inf
+            timings['contracted'] += time.perf_counter() - started
+            if not (cost == expected or math.isclose(cost, expected, rel_tol=rel_tol, abs_tol=1e-6)):
+                mismatches += 1
+
+        stats = {
+            'weight': weight,
+            'n_queries': n_queries,
+            'query_ms_original': 1000 * timings['original'] / n_queries,
+            'query_ms_contracted': 1000 * timings['contracted'] / n_queries,
+            'speedup': timings['original'] / timings['contracted'] if timings['contracted'] else math.inf,
+            'mismatches': mismatches,
+        }
+        progress(f"Requêtes ({weight}) : {stats['query_ms_original']:.2f} ms -> {stats['query_ms_contracted']:.2f} ms "
+                 f"(x{stats['speedup']:.1f}), {mismatches} écart(s) de coût sur {n_queries}")
+        return stats
+
+    # --- Persistance -----------------------------------------------------------------
+
+    def save(self, directory):
+        """Sauvegarde le graphe simplifié (format CompactGraph) et la correspondance avec le graphe d'origine."""
+        directory = Path(directory)
+        # Graphe et correspondance sont mis en place ensemble, jamais l'un sans l'autre
+        with replace_directory(directory) as tmp_directory:
+            self.graph.write_files(tmp_directory, metadata={**self.original.metadata, 'chains': self.report()})
+            np.savez(tmp_directory / CHAINS_FILE, version=CHAINS_FORMAT_VERSION, kept_nodes=self.kept_nodes,
+                     member_offsets=self.member_offsets, members=self.members, chain_offsets=self.chain_offsets,
+                     chain_members=self.chain_members, chain_edges=self.chain_edges, node_chain=self.node_chain,
+                     node_position=self.node_position, n_graph_nodes=self.original.n_nodes,
+                     n_graph_edges=self.original.n_edges)
+        return directory
+
+    @classmethod
+    def load(cls, directory, original, mmap=True):
+        """Charge un graphe simplifié et vérifie qu'il correspond au graphe d'origine."""
+        directory = Path(directory)
+        with np.load(directory / CHAINS_FILE) as data:
+            if int(data['version']) != CHAINS_FORMAT_VERSION:
+                raise ValueError(f"Le graphe simplifié {directory} est dans un format obsolète, il doit être recalculé")
+            if int(data['n_graph_nodes']) != original.n_nodes or int(data['n_graph_edges']) != original.n_edges:
+                raise ValueError(f"Le graphe simplifié {directory} ne correspond pas au graphe chargé")
+            arrays = {name: data[name] for name in ('kept_nodes', 'member_offsets', 'members', 'chain_offsets',
+                                                    'chain_members', 'chain_edges', 'node_chain', 'node_position')}
+        graph = CompactGraph.load(directory, mmap=mmap)
+        return cls(original, graph, stats=graph.metadata.get('chains'), **arrays)
+
+
+if __name__ == "__main__":
+    from graph import GraphBuilder
+
+    processed_data_dir = Path("./data/processed")
+    builder = GraphBuilder(processed_data_dir)
+    graph = builder.load_compact_graph()
+
+    contraction = ChainContraction.build(graph)
+    contraction.save(processed_data_dir / "routing_graph_chains")
+    for weight in ('distance', 'time', 'effort'):
+        contraction.benchmark(weight=weight)
@@ -0,0 +1,396 @@
+# rando_sim/compact_graph.py
+import contextlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import shapely
+
+# Format binaire sur disque : à incrémenter à chaque changement incompatible
+GRAPH_FORMAT = 'poseidon-compact-graph'
+GRAPH_FORMAT_VERSION = 1
+
+
+@contextlib.contextmanager
+def replace_directory(directory):
+    """Écrit un répertoire de fichiers dans un répertoire temporaire voisin, puis le met en place.
+
+    En cas d'échec, le répertoire existant est laissé intact. Un répertoire remplacé est
+    renommé puis supprimé, sans réécrire ses fichiers : les lecteurs qui les ont mappés en
+    mémoire gardent des données cohérentes. Les fichiers annexes qu'il contenait (index
+    d'accrochage, hiérarchies...) sont supprimés avec lui.
+    """
+    directory = Path(directory)
+    tmp_directory = directory.with_name(f".{directory.name}.tmp-{os.getpid()}")
+    old_directory = directory.with_name(f".{directory.name}.old-{os.getpid()}")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    try:
+        yield tmp_directory
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    if directory.exists():
+        shutil.rmtree(old_directory, ignore_errors=True)
+        os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+    else:
+        os.replace(tmp_directory, directory)
+
+
+class LazyGeometries:
+    """Table de géométries WKB décodées à la demande (fichier mappé en mémoire)."""
+
+    def __init__(self, wkb_buffer, offsets):
+        self.wkb_buffer = wkb_buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, segment):
+        start, end = self.offsets[segment], self.offsets[segment + 1]
+        if start == end:
+            return None
+        return shapely.from_wkb(self.wkb_buffer[start:end].tobytes())
+
+    def materialize(self):
+        """Décode toutes les géométries en une fois (vectorisé)."""
+        chunks = [self.wkb_buffer[start:end].tobytes() if end > start else None
+                  for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+        return shapely.from_wkb(np.array(chunks, dtype=object))
+
+
+class CompactGraph:
+    """Graphe de déplacement compact stocké en tableaux NumPy (format CSR).
+
+    - `offsets` / `targets` : arêtes sortantes du nœud i dans targets[offsets[i]:offsets[i + 1]]
+    - `x` / `y` : coordonnées des nœuds (float64)
+    - `edge_data` : colonnes numériques des arêtes (float32 : distance, time, effort, slope_percent...)
+    - `edge_categories` : colonnes catégorielles stockées en codes entiers (surface_type...)
+    - `segment_ids` / `edge_reversed` : chaque arête référence une géométrie partagée
+      par les deux sens de parcours dans la table des segments
+    """
+
+    def __init__(self, offsets, targets, x, y, edge_data, segment_ids, edge_reversed,
+                 geometries, segment_labels, edge_categories=None, node_labels=None):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.edge_data = {name: np.asarray(values, dtype=np.float32) for name, values in edge_data.items()}
+        self.segment_ids = np.asarray(segment_ids, dtype=np.int32)
+        self.edge_reversed = np.asarray(edge_reversed, dtype=bool)
+        self.geometries = geometries
+        self.segment_labels = np.asarray(segment_labels, dtype=object)
+        # {nom: (codes int8/int16, libellés)}
+        self.edge_categories = edge_categories or {}
+        self.node_labels = node_labels
+        self.metadata = {}
+
+        self._sources = None
+
+    @property
+    def n_nodes(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.targets)
+
+    @property
+    def sources(self):
+        """Nœud de départ de chaque arête (calculé à la demande)."""
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(self.n_nodes, dtype=np.int32), np.diff(self.offsets))
+        return self._sources
+
+    def out_edges(self, node):
+        """Renvoie l'intervalle des indices d'arêtes sortant d'un nœud."""
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def edge_index(self, u, v):
+        """Renvoie l'indice de l'arête u -> v (la dernière si plusieurs), ou None."""
+        start, end = self.offsets[u], self.offsets[u + 1]
+        matches = np.flatnonzero(self.targets[start:end] == v)
+        if len(matches) == 0:
+            return None
+        return int(start + matches[-1])
+
+    def geometry(self, edge):
+        """Renvoie la géométrie (non orientée) du segment parcouru par une arête."""
+        return self.geometries[self.segment_ids[edge]]
+
+    def geometry_array(self):
+        """Renvoie toutes les géométries des segments sous forme de tableau d'objets shapely."""
+        # Géométries décodées ou assemblées à la demande (LazyGeometries, chaînes fusionnées)
+        if hasattr(self.geometries, 'materialize'):
+            return self.geometries.materialize()
+        return np.asarray(self.geometries, dtype=object)
+
+    def category(self, name, edges=None):
+        """Renvoie les libellés d'une colonne catégorielle pour toutes les arêtes (ou une sélection)."""
+        codes, labels = self.edge_categories[name]
+        if edges is not None:
+            codes = codes[edges]
+        # Le code -1 (valeur manquante) pointe sur le None ajouté en fin de liste
+        return np.array(list(labels) + [None], dtype=object)[codes]
+
+    def categorical(self, name, edges=None):
+        """Renvoie une colonne catégorielle sous forme de pd.Categorical (sans matérialiser les libellés)."""
+        codes, labels = self.edge_categories[name]
+        if edges is not None:
+            codes = codes[edges]
+        return pd.Categorical.from_codes(np.asarray(codes), categories=labels)
+
+    def nbytes(self):
+        """Mémoire occupée par la topologie et les colonnes numériques (hors géométries)."""
+        arrays = [self.offsets, self.targets, self.x, self.y, self.segment_ids, self.edge_reversed]
+        arrays += list(self.edge_data.values())
+        arrays += [codes for codes, _ in self.edge_categories.values()]
+        return sum(array.nbytes for array in arrays)
+
+    @staticmethod
+    def _encode_categories(values):
+        """Encode un tableau de libellés en petits entiers (Categorical)."""
+        # Les valeurs manquantes ont le code -1 ; un Categorical garde ses catégories (et leurs codes)
+        if isinstance(values, pd.Categorical):
+            categorical = values
+        else:
+            categorical = pd.Categorical(pd.Series(values, dtype=object))
+        dtype = np.int8 if len(categorical.categories) < 128 else np.int16
+        return categorical.codes.astype(dtype), list(categorical.categories)
+
+    @classmethod
+    def from_segments(cls, node_coords, start_nodes, end_nodes, geometries, segment_labels,
+                      forward_data, reverse_data, categories=None):
+        """Construit le graphe à partir de segments non orientés et de leurs colonnes aller/retour.
+
+        Chaque segment donne deux arêtes (aller puis retour) qui partagent la même géométrie.
+        """
+        node_coords = np.asarray(node_coords, dtype=np.float64)
+        start_nodes = np.asarray(start_nodes, dtype=np.int64)
+        end_nodes = np.asarray(end_nodes, dtype=np.int64)
+        n_segments = len(start_nodes)
+
+        # Arêtes entrelacées aller / retour
+        sources = np.empty(2 * n_segments, dtype=np.int64)
+        sources[0::2], sources[1::2] = start_nodes, end_nodes
+        targets = np.empty(2 * n_segments, dtype=np.int64)
+        targets[0::2], targets[1::2] = end_nodes, start_nodes
+        segment_ids = np.repeat(np.arange(n_segments, dtype=np.int32), 2)
+        edge_reversed = np.tile(np.array([False, True]), n_segments)
+
+        edge_data = {}
+        for name in forward_data:
+            values = np.empty(2 * n_segments, dtype=np.float32)
+            values[0::2], values[1::2] = forward_data[name], reverse_data[name]
+            edge_data[name] = values
+
+        edge_categories = {}
+        for name, values in (categories or {}).items():
+            codes, labels = cls._encode_categories(values)
+            edge_categories[name] = (np.repeat(codes, 2), labels)
+
+        return cls._from_edge_list(len(node_coords), sources, targets, node_coords[:, 0], node_coords[:, 1],
+                                   edge_data, segment_ids, edge_reversed, np.asarray(geometries, dtype=object),
+                                   segment_labels, edge_categories)
+
+    @classmethod
+    def _from_edge_list(cls, n_nodes, sources, targets, x, y, edge_data, segment_ids, edge_reversed,
+                        geometries, segment_labels, edge_categories, node_labels=None):
+        """Trie une liste d'arêtes par nœud de départ (tri stable) pour obtenir le format CSR."""
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(sources, minlength=n_nodes))
+
+        edge_data = {name: values[order] for name, values in edge_data.items()}
+        edge_categories = {name: (codes[order], labels) for name, (codes, labels) in edge_categories.items()}
+
+        return cls(offsets, targets[order], x, y, edge_data, segment_ids[order], edge_reversed[order],
+                   geometries, segment_labels, edge_categories, node_labels)
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Convertit un nx.DiGraph produit par GraphBuilder en graphe compact."""
+        node_labels = list(graph.nodes())
+        position = {node: i for i, node in enumerate(node_labels)}
+        x = np.array([float(data['x']) for _, data in graph.nodes(data=True)], dtype=np.float64)
+        y = np.array([float(data['y']) for _, data in graph.nodes(data=True)], dtype=np.float64)
+
+        edges = list(graph.edges(data=True))
+        sources = np.array([position[u] for u, _, _ in edges], dtype=np.int64)
+        targets = np.array([position[v] for _, v, _ in edges], dtype=np.int64)
+
+        # L'arête retour ("<id>_rev") partage le segment de l'arête aller
+        segments = {}
+        segment_ids, edge_reversed = [], []
+        geometries, segment_labels = [], []
+        for i, (_, _, data) in enumerate(edges):
+            edge_id = data.get('id', i)
+            is_reversed = str(edge_id).endswith('_rev')
+            key = str(edge_id)[:-4] if is_reversed else str(edge_id)
+            if key not in segments:
+                segments[key] = len(segment_labels)
+                segment_labels.append(key if is_reversed else edge_id)
+                geometries.append(data.get('geometry'))
+            elif not is_reversed:
+                segment_labels[segments[key]] = edge_id
+            segment_ids.append(segments[key])
+            edge_reversed.append(is_reversed)
+
+        # Colonnes numériques en float32, colonnes texte en codes catégoriels
+        text_columns = {}
+        for _, _, data in edges:
+            for name, value in data.items():
+                if name in ('id', 'geometry'):
+                    continue
+                if isinstance(value, str):
+                    text_columns[name] = True
+                else:
+                    text_columns.setdefault(name, False)
+        edge_data = {name: np.array([data.get(name, np.nan) for _, _, data in edges], dtype=np.float64)
+                     for name, is_text in text_columns.items() if not is_text}
+        edge_categories = {name: cls._encode_categories([data.get(name) for _, _, data in edges])
+                           for name, is_text in text_columns.items() if is_text}
+
+        node_labels = None if node_labels == list(range(len(node_labels))) else np.asarray(node_labels, dtype=object)
+        return cls._from_edge_list(len(x), sources, targets, x, y, edge_data, np.asarray(segment_ids, dtype=np.int32),
+                                   np.asarray(edge_reversed, dtype=bool), np.asarray(geometries, dtype=object),
+                                   segment_labels, edge_categories, node_labels)
+
+    def to_networkx(self):
+        """Reconstruit un nx.DiGraph équivalent à celui de GraphBuilder.build_graph."""
+        graph = nx.DiGraph()
+        nodes = self.node_labels if self.node_labels is not None else range(self.n_nodes)
+        nodes = list(nodes)
+        points = shapely.points(self.x, self.y)
+        graph.add_nodes_from(
+            (node, {'x': x, 'y': y, 'point': point})
+            for node, x, y, point in zip(nodes, self.x.tolist(), self.y.tolist(), points)
+        )
+
+        geometries = self.geometry_array()
+        columns = {name: values.astype(np.float64).tolist() for name, values in self.edge_data.items()}
+        columns.update({name: self.category(name).tolist() for name in self.edge_categories})
+        names = list(columns)
+
+        def edges():
+            for edge, (u, v, segment, is_reversed) in enumerate(zip(self.sources.tolist(), self.targets.tolist(),
+                                                                    self.segment_ids.tolist(),
+                                                                    self.edge_reversed.tolist())):
+                label = self.segment_labels[segment]
+                attrs = {'id': f"{label}_rev" if is_reversed else label,
+                         'geometry': geometries[segment]}
+                for name in names:
+                    value = columns[name][edge]
+                    # Les valeurs inconnues (NaN) ne sont pas stockées
+                    if value is not None and value == value:
+                        attrs[name] = value
+                yield nodes[u], nodes[v], attrs
+
+        graph.add_edges_from(edges())
+        return graph
+
+    def save(self, directory, metadata=None):
+        """Sauvegarde le graphe dans un répertoire binaire (tableaux .npy + géométries WKB).
+
+        Les tableaux numériques sont relus par mappage mémoire ; les géométries sont
+        stockées à part et décodées uniquement lorsqu'une arête doit être dessinée.
+        Le répertoire est écrit à côté puis mis en place (voir `replace_directory`).
+        """
+        with replace_directory(directory) as tmp_directory:
+            self.write_files(tmp_directory, metadata)
+        return Path(directory)
+
+    def write_files(self, directory, metadata=None):
+        """Écrit les fichiers du graphe dans un répertoire existant (utilisé par `save`)."""
+        directory = Path(directory)
+        arrays = {
+            'offsets': self.offsets,
+            'targets': self.targets,
+            'x': self.x,
+            'y': self.y,
+            'segment_ids': self.segment_ids,
+            'edge_reversed': self.edge_reversed,
+            'segment_labels': self.segment_labels.astype(str),
+        }
+        arrays.update({f"edge_{name}": values for name, values in self.edge_data.items()})
+        arrays.update({f"category_{name}": codes for name, (codes, _) in self.edge_categories.items()})
+        if self.node_labels is not None:
+            arrays['node_labels'] = np.asarray(self.node_labels).astype(str)
+
+        # Géométries : WKB concaténés + offsets
+        wkb = shapely.to_wkb(self.geometry_array())
+        lengths = np.array([len(chunk) if chunk is not None else 0 for chunk in wkb], dtype=np.int64)
+        geometry_offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+        geometry_offsets[1:] = np.cumsum(lengths)
+        arrays['geometry_offsets'] = geometry_offsets
+        with open(directory / "geometries.wkb", 'wb') as f:
+            for chunk in wkb:
+                if chunk is not None:
+                    f.write(chunk)
+
+        for name, values in arrays.items():
+            np.save(directory / f"{name}.npy", values)
+
+        header = {
+            'format': GRAPH_FORMAT,
+            'version': GRAPH_FORMAT_VERSION,
+            'n_nodes': self.n_nodes,
+            'n_edges': self.n_edges,
+            'n_segments': len(self.segment_labels),
+            'edge_columns': list(self.edge_data),
+            'categories': {name: list(labels) for name, (_, labels) in self.edge_categories.items()},
+            'metadata': metadata or {},
+        }
+        # L'en-tête est écrit en dernier : un répertoire sans en-tête est incomplet
+        with open(directory / "header.json", 'w') as f:
+            json.dump(header, f, ensure_ascii=False)
+
+    @staticmethod
+    def read_header(directory):
+        """Lit et valide l'en-tête d'un graphe binaire."""
+        header_path = Path(directory) / "header.json"
+        if not header_path.exists():
+            raise FileNotFoundError(f"Aucun graphe binaire complet dans {directory}")
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        if header.get('format') != GRAPH_FORMAT or header.get('version') != GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Le graphe {directory} est dans un format obsolète "
+                             f"({header.get('format')} v{header.get('version')}), il doit être reconstruit")
+        return header
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Charge un graphe binaire ; avec `mmap`, les tableaux ne sont lus qu'à l'accès."""
+        directory = Path(directory)
+        header = cls.read_header(directory)
+        mmap_mode = 'r' if mmap else None
+
+        def array(name):
+            return np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+
+        edge_data = {name: array(f"edge_{name}") for name in header['edge_columns']}
+        edge_categories = {name: (array(f"category_{name}"), labels)
+                           for name, labels in header['categories'].items()}
+        node_labels = array('node_labels') if (directory / "node_labels.npy").exists() else None
+
+        wkb_path = directory / "geometries.wkb"
+        if wkb_path.stat().st_size > 0:
+            wkb_buffer = np.memmap(wkb_path, dtype=np.uint8, mode='r')
+        else:
+            wkb_buffer = np.zeros(0, dtype=np.uint8)
+        geometries = LazyGeometries(wkb_buffer, np.load(directory / "geometry_offsets.npy"))
+
+        # np.asarray ne copie pas les tableaux mappés dont le type est déjà le bon
+        graph = cls(array('offsets'), array('targets'), array('x'), array('y'), edge_data,
+                    array('segment_ids'), array('edge_reversed'), geometries,
+                    np.load(directory / "segment_labels.npy"), edge_categories, node_labels)
+        graph.metadata = header['metadata']
+        return graph
@@ -0,0 +1,354 @@
+# rando_sim/contraction.py
+import heapq
+import math
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import progress
+from routing import Route, Router
+
+# Format des hiérarchies sauvegardées : à incrémenter à chaque changement incompatible
+CH_FORMAT_VERSION = 1
+
+
+class ContractionHierarchy:
+    """Hiérarchie de contraction d'un CompactGraph pour un poids donné.
+
+    Les nœuds sont contractés un à un par ordre d'importance croissante ; des raccourcis
+    préservent les plus courts chemins entre les nœuds restants. Une requête n'explore
+    ensuite que les arêtes « montantes » depuis la source et depuis la cible.
+
+    Chaque arête de la hiérarchie est (départ, arrivée, poids, milieu, arête d'origine) :
+    `milieu` vaut -1 pour une arête du graphe (dont l'indice est `arête d'origine`),
+    sinon le raccourci se décompose en départ -> milieu -> arrivée.
+    """
+
+    def __init__(self, graph, weight, rank, edge_from, edge_to, edge_weight, edge_middle, edge_original, stats=None):
+        self.graph = graph
+        self.weight = weight
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.edge_from = np.asarray(edge_from, dtype=np.int64)
+        self.edge_to = np.asarray(edge_to, dtype=np.int64)
+        self.edge_weight = np.asarray(edge_weight, dtype=np.float64)
+        self.edge_middle = np.asarray(edge_middle, dtype=np.int64)
+        self.edge_original = np.asarray(edge_original, dtype=np.int64)
+        self.stats = stats or {}
+        self._prepare_search()
+
+    def _prepare_search(self):
+        """Construit les deux graphes de recherche montants (listes Python au format CSR)."""
+        n_nodes = len(self.rank)
+        upward = self.rank[self.edge_to] > self.rank[self.edge_from]
+
+        def csr(origin, destination, selection):
+            edges = np.flatnonzero(selection)
+            order = edges[np.argsort(origin[edges], kind='stable')]
+            offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(origin[edges], minlength=n_nodes))
+            return offsets.tolist(), destination[order].tolist(), self.edge_weight[order].tolist(), order.tolist()
+
+        # Avant : arêtes u -> v montantes ; arrière : arêtes u -> v descendantes parcourues de v vers u
+        self._forward = csr(self.edge_from, self.edge_to, upward)
+        self._backward = csr(self.edge_to, self.edge_from, ~upward)
+
+    @classmethod
+    def build(cls, graph, weight='time', settle_limit=200, track_memory=False):
+        """Prétraitement : ordonne et contracte les nœuds, en mesurant le temps.
+
+        Avec `track_memory`, le pic mémoire est mesuré avec tracemalloc (prétraitement
+        environ quatre fois plus lent : à réserver au diagnostic).
+        """
+        started = time.perf_counter()
+        if track_memory:
+            # Comme l'instrumentation : un suivi déjà en cours (intervalle englobant) n'est pas arrêté
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        n_nodes = graph.n_nodes
+        weights = graph.edge_data[weight].astype(np.float64)
+        sources = graph.sources.tolist()
+        targets = graph.targets.tolist()
+
+        # Adjacence modifiable : pour chaque couple, on garde l'arête la moins coûteuse
+        out_adj = [dict() for _ in range(n_nodes)]
+        in_adj = [dict() for _ in range(n_nodes)]
+        edges = {}
+        for edge, (u, v, w) in enumerate(zip(sources, targets, weights.tolist())):
+            if u == v or math.isinf(w) or math.isnan(w):
+                continue
+            if w < out_adj[u].get(v, math.inf):
+                out_adj[u][v] = w
+                in_adj[v][u] = w
+                edges[(u, v)] = (w, -1, edge)
+
+        contracted = [False] * n_nodes
+        contracted_neighbours = [0] * n_nodes
+        rank = [0] * n_nodes
+
+        def witness_costs(start, excluded, cutoff):
+            """Recherche locale de chemins témoins depuis `start` sans passer par `excluded`."""
+            dist = {start: 0.0}
+            heap = [(0.0, start)]
+            settled = 0
+            while heap and settled < settle_limit:
+                d, u = heapq.heappop(heap)
+                if d > dist.get(u, math.inf):
+                    continue
+                if d > cutoff:
+                    break
+                settled += 1
+                for v, w in out_adj[u].items():
+                    if v == excluded or contracted[v]:
+                        continue
+                    candidate = d + w
+                    if candidate < dist.get(v, math.inf):
+                        dist[v] = candidate
+                        heapq.heappush(heap, (candidate, v))
+            return dist
+
+        def shortcuts_for(node):
+            """Raccourcis nécessaires si `node` est contracté."""
+            shortcuts = []
+            outgoing = [(w, cost) for w, cost in out_adj[node].items() if not contracted[w]]
+            if not outgoing:
+                return shortcuts
+            max_out = max(cost for _, cost in outgoing)
+            for u, cost_in in in_adj[node].items():
+                if contracted[u]:
+                    continue
+                dist = witness_costs(u, node, cost_in + max_out)
+                for w, cost_out in outgoing:
+                    if w == u:
+                        continue
+                    candidate = cost_in + cost_out
+                    # Un chemin témoin au plus aussi court rend le raccourci inutile
+                    if dist.get(w, math.inf) > candidate:
+                        shortcuts.append((u, w, candidate))
+            return shortcuts
+
+        def priority(node):
+            """Différence d'arêtes + voisins déjà contractés (ordre d'importance), et raccourcis associés."""
+            shortcuts = shortcuts_for(node)
+            degree = (sum(1 for v in out_adj[node] if not contracted[v])
+                      + sum(1 for u in in_adj[node] if not contracted[u]))
+            return len(shortcuts) - degree + contracted_neighbours[node], shortcuts
+
+        heap = [(priority(node)[0], node) for node in range(n_nodes)]
+        heapq.heapify(heap)
+        n_shortcuts = 0
+        next_rank = 0
+        while heap:
+            _, node = heapq.heappop(heap)
+            if contracted[node]:
+                continue
+            # Mise à jour paresseuse : si la priorité a augmenté, on remet le nœud dans la file
+            current, shortcuts = priority(node)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, node))
+                continue
+
+            for u, w, cost in shortcuts:
+                if cost < out_adj[u].get(w, math.inf):
+                    out_adj[u][w] = cost
+                    in_adj[w][u] = cost
+                    edges[(u, w)] = (cost, node, -1)
+                    n_shortcuts += 1
+
+            contracted[node] = True
+            rank[node] = next_rank
+            next_rank += 1
+            for neighbour in set(out_adj[node]) | set(in_adj[node]):
+                contracted_neighbours[neighbour] += 1
+
+        # Seules les arêtes encore présentes dans l'adjacence sont utiles à la recherche
+        keys = [(u, v) for u in range(n_nodes) for v in out_adj[u]]
+        values = [edges[key] for key in keys]
+        edge_from = np.array([u for u, _ in keys], dtype=np.int64)
+        edge_to = np.array([v for _, v in keys], dtype=np.int64)
+        edge_weight = np.array([cost for cost, _, _ in values], dtype=np.float64)
+        edge_middle = np.array([middle for _, middle, _ in values], dtype=np.int64)
+        edge_original = np.array([original for _, _, original in values], dtype=np.int64)
+
+        stats = {
+            'weight': weight,
+            'build_time_s': time.perf_counter() - started,
+            'n_nodes': n_nodes,
+            'n_edges': int(graph.n_edges),
+            'n_shortcuts': n_shortcuts,
+        }
+        if track_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            stats['peak_memory_mb'] = peak / 1024 ** 2
+
+        hierarchy = cls(graph, weight, rank, edge_from, edge_to, edge_weight, edge_middle, edge_original, stats)
+        hierarchy.stats['nbytes'] = hierarchy.nbytes()
+        progress(f"Hiérarchie de contraction ({weight}) : {n_shortcuts} raccourcis en "
+                 f"{stats['build_time_s']:.1f} s" +
+                 (f", pic mémoire {stats['peak_memory_mb']:.0f} Mo" if track_memory else ""))
+        return hierarchy
+
+    def nbytes(self):
+        """Mémoire occupée par les tableaux de la hiérarchie."""
+        return sum(array.nbytes for array in (self.rank, self.edge_from, self.edge_to, self.edge_weight,
+                                              self.edge_middle, self.edge_original))
+
+    def query(self, source, target):
+        """Plus court chemin par recherche bidirectionnelle montante ; renvoie un Route."""
+        if source == target:
+            return Route(self.graph, [source], [], self.weight, 0.0)
+
+        searches = (self._forward, self._backward)
+        dist = ({source: 0.0}, {target: 0.0})
+        pred = ({}, {})
+        settled = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meeting = math.inf, None
+
+        while heaps[0] or heaps[1]:
+            # Chaque recherche s'arrête dès que sa file ne peut plus améliorer le meilleur chemin
+            for side in (0, 1):
+                if heaps[side] and heaps[side][0][0] >= best:
+                    heaps[side].clear()
+            candidates = [side for side in (0, 1) if heaps[side]]
+            if not candidates:
+                break
+            side = min(candidates, key=lambda s: heaps[s][0][0])
+
+            d, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+            if u in dist[1 - side] and d + dist[1 - side][u] < best:
+                best, meeting = d + dist[1 - side][u], u
+
+            offsets, neighbours, weights, ch_edges = searches[side]
+            own = dist[side]
+            for i in range(offsets[u], offsets[u + 1]):
+                v = neighbours[i]
+                candidate = d + weights[i]
+                if candidate < own.get(v, math.inf):
+                    own[v] = candidate
+                    pred[side][v] = ch_edges[i]
+                    heapq.heappush(heaps[side], (candidate, v))
+
+        if meeting is None:
+            raise ValueError(f"Aucun itinéraire entre les nœuds {source} et {target}")
+
+        # Chemin dans la hiérarchie puis dépliage des raccourcis en arêtes du graphe
+        ch_path = []
+        node = meeting
+        while node != source:
+            edge = pred[0][node]
+            ch_path.append(edge)
+            node = int(self.edge_from[edge])
+        ch_path.reverse()
+        node = meeting
+        while node != target:
+            edge = pred[1][node]
+            ch_path.append(edge)
+            node = int(self.edge_to[edge])
+
+        edges = []
+        for ch_edge in ch_path:
+            edges.extend(self._unpack(ch_edge))
+        nodes = [source] + [int(self.graph.targets[edge]) for edge in edges]
+        return Route(self.graph, nodes, edges, self.weight, best)
+
+    def _edge_lookup(self):
+        """Index (départ, arrivée) -> arête de la hiérarchie, construit à la demande."""
+        if not hasattr(self, '_lookup'):
+            self._lookup = {(u, v): i for i, (u, v) in enumerate(zip(self.edge_from.tolist(), self.edge_to.tolist()))}
+        return self._lookup
+
+    def _unpack(self, ch_edge):
+        """Décompose récursivement (sans récursion Python) un raccourci en arêtes du graphe."""
+        lookup = self._edge_lookup()
+        edges = []
+        stack = [ch_edge]
+        while stack:
+            current = stack.pop()
+            middle = int(self.edge_middle[current])
+            if middle < 0:
+                edges.append(int(self.edge_original[current]))
+                continue
+            u, v = int(self.edge_from[current]), int(self.edge_to[current])
+            # Ordre inverse sur la pile : la première moitié est dépilée en premier
+            stack.append(lookup[(middle, v)])
+            stack.append(lookup[(u, middle)])
+        return edges
+
+    def save(self, filename):
+        """Sauvegarde la hiérarchie au format NPZ, à côté du graphe."""
+        np.savez(filename, version=CH_FORMAT_VERSION, weight=self.weight, rank=self.rank,
+                 edge_from=self.edge_from, edge_to=self.edge_to, edge_weight=self.edge_weight,
+                 edge_middle=self.edge_middle, edge_original=self.edge_original,
+                 n_graph_nodes=self.graph.n_nodes, n_graph_edges=self.graph.n_edges)
+        return filename
+
+    @classmethod
+    def load(cls, filename, graph):
+        """Charge une hiérarchie sauvegardée et vérifie qu'elle correspond au graphe."""
+        with np.load(filename) as data:
+            if int(data['version']) != CH_FORMAT_VERSION:
+                raise ValueError(f"La hiérarchie {filename} est dans un format obsolète, elle doit être recalculée")
+            if int(data['n_graph_nodes']) != graph.n_nodes or int(data['n_graph_edges']) != graph.n_edges:
+                raise ValueError(f"La hiérarchie {filename} ne correspond pas au graphe chargé")
+            return cls(graph, str(data['weight']), data['rank'], data['edge_from'], data['edge_to'],
+                       data['edge_weight'], data['edge_middle'], data['edge_original'])
+
+
+def build_hierarchies(graph, directory, weights=('distance', 'time', 'effort'), **kwargs):
+    """Calcule et sauvegarde une hiérarchie par poids dans le répertoire du graphe."""
+    directory = Path(directory)
+    hierarchies = {}
+    for weight in weights:
+        hierarchy = ContractionHierarchy.build(graph, weight, **kwargs)
+        hierarchy.save(directory / f"ch_{weight}.npz")
+        hierarchies[weight] = hierarchy
+    return hierarchies
+
+
+def verify_against_dijkstra(hierarchy, n_pairs=100, seed=0, rel_tol=1e-6):
+    """Compare les coûts de la hiérarchie à ceux d'un Dijkstra classique sur des paires aléatoires.
+
+    Renvoie la liste des écarts (source, cible, coût CH, coût Dijkstra) ; vide si tout concorde.
+    """
+    router = Router(hierarchy.graph)
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    for source, target in rng.integers(0, hierarchy.graph.n_nodes, size=(n_pairs, 2)).tolist():
+        settled, _ = router.dijkstra(source, weight=hierarchy.weight, targets=[target])
+        expected = settled.get(target, math.inf)
+        try:
+            route = hierarchy.query(source, target)
+            cost = route.cost
+            # Le chemin déplié doit avoir le même coût que celui annoncé
+            unpacked = float(sum(router.weights(hierarchy.weight)[edge] for edge in route.edges))
+            if not math.isclose(unpacked, cost, rel_tol=rel_tol, abs_tol=1e-6):
+                mismatches.append((source, target, unpacked, expected))
+                continue
+        except ValueError:
+            cost = math.inf
+        if not (cost == expected or math.isclose(cost, expected, rel_tol=rel_tol, abs_tol=1e-6)):
+            mismatches.append((source, target, cost, expected))
+    return mismatches
+
+
+if __name__ == "__main__":
+    from graph import GraphBuilder
+
+    processed_data_dir = Path("./data/processed")
+    builder = GraphBuilder(processed_data_dir)
+    graph = builder.load_compact_graph()
+
+    hierarchies = build_hierarchies(graph, processed_data_dir / "routing_graph")
+    for weight, hierarchy in hierarchies.items():
+        mismatches = verify_against_dijkstra(hierarchy)
+        progress(f"{weight} : {len(mismatches)} écart(s) sur 100 paires aléatoires")
@@ -0,0 +1,244 @@
+# rando_sim/cost_model.py
+import numpy as np
+import pandas as pd
+
+from enrichment import HYDRO_CROSSINGS, VEGETATION_PREFIX
+
+
+def pedestrian_slope_factor(slope_percent):
+    """Facteur de ralentissement selon la pente pour un marcheur léger."""
+    return np.where(slope_percent > 0,
+                    1 - np.minimum(0.8, slope_percent / 100),   # Montée
+                    1 - np.minimum(0.4, np.abs(slope_percent) / 100))  # Descente
+
+
+def pedestrian_effort(time_s, slope_percent):
+    """Effort (formule simplifiée) : le temps majoré selon la pente."""
+    return time_s * (1 + np.abs(slope_percent) / 20)
+
+
+def loaded_infantry_slope_factor(slope_percent):
+    """Facteur de pente d'une unité chargée : plus pénalisée en montée comme en descente."""
+    return np.where(slope_percent > 0,
+                    1 - np.minimum(0.85, 1.5 * slope_percent / 100),
+                    1 - np.minimum(0.5, 1.2 * np.abs(slope_percent) / 100))
+
+
+def loaded_infantry_effort(time_s, slope_percent):
+    """Effort d'une unité chargée : charge constante et pente plus coûteuse."""
+    return 1.3 * time_s * (1 + np.abs(slope_percent) / 15)
+
+
+def vehicle_slope_factor(slope_percent):
+    """Facteur de pente d'un véhicule : infranchissable au-delà de 30 %."""
+    factor = 1 - np.minimum(0.7, np.abs(slope_percent) / 50)
+    return np.where(np.abs(slope_percent) > 30, 0.0, factor)
+
+
+def vehicle_effort(time_s, slope_percent):
+    """Effort d'un véhicule : proportionnel au temps de conduite."""
+    return time_s * (1 + np.maximum(slope_percent, 0) / 50)
+
+
+class MovementProfile:
+    """Profil de déplacement : vitesses par surface (km/h), fonction de pente et fonction d'effort.
+
+    Une vitesse nulle (surface absente de la table avec `default_speed=0`, ou facteur
+    de pente nul) rend l'arête infranchissable : son temps et son effort sont infinis.
+
+    `vegetation_factors` donne le facteur de vitesse sur la portion d'un segment traversant
+    chaque classe de végétation, `crossing_time_s` le temps perdu à chaque traversée de
+    cours d'eau sans pont (colonnes de DataProcessor.add_land_cover).
+    """
+
+    def __init__(self, name, base_speeds, default_speed=3.0,
+                 slope_factor=pedestrian_slope_factor, effort=pedestrian_effort,
+                 vegetation_factors=None, crossing_time_s=0.0):
+        self.name = name
+        self.base_speeds = dict(base_speeds)
+        self.default_speed = default_speed
+        self.slope_factor = slope_factor
+        self.effort = effort
+        self.vegetation_factors = dict(vegetation_factors or {})
+        self.crossing_time_s = crossing_time_s
+
+    @property
+    def max_speed(self):
+        """Vitesse maximale du profil (km/h), sur terrain plat."""
+        return max(list(self.base_speeds.values()) + [self.default_speed])
+
+    def speeds_for(self, labels):
+        """Vitesses de base (km/h) pour une liste de libellés de surface."""
+        return np.array([self.base_speeds.get(label, self.default_speed) for label in labels], dtype=np.float64)
+
+
+# Vitesse de base selon le type de surface (km/h) pour un marcheur léger
+PEDESTRIAN_SPEEDS = {
+    'sentier_balisé': 4.0,
+    'chemin': 3.5,
+    'piste': 5.0,
+    'route': 5.5,
+    'hors_sentier': 2.5,
+    'vegetation_dense': 1.5,
+    'zone_rocheuse': 1.8,
+    'cours_eau': 0.8,
+}
+
+LOADED_INFANTRY_SPEEDS = {
+    'sentier_balisé': 3.2,
+    'chemin': 3.0,
+    'piste': 4.0,
+    'route': 4.5,
+    'hors_sentier': 1.8,
+    'vegetation_dense': 1.1,
+    'zone_rocheuse': 1.0,
+    'cours_eau': 0.5,
+}
+
+VEHICLE_SPEEDS = {
+    'route': 50.0,
+    'piste': 20.0,
+    'chemin': 10.0,
+}
+
+# Facteur de vitesse sur la portion d'un segment traversant chaque classe de végétation
+PEDESTRIAN_VEGETATION = {'foret': 0.95, 'foret_ouverte': 0.97, 'lande': 0.9}
+LOADED_INFANTRY_VEGETATION = {'foret': 0.9, 'foret_ouverte': 0.95, 'lande': 0.85, 'verger_vigne': 0.95}
+VEHICLE_VEGETATION = {'foret': 0.9, 'foret_ouverte': 0.95, 'lande': 0.8, 'verger_vigne': 0.9}
+
+
+class CostModel:
+    """Calcule en une passe vectorisée distance, temps et effort pour plusieurs profils de déplacement.
+
+    Le profil par défaut alimente les colonnes `time` et `effort` ; les autres profils
+    alimentent `time_<nom>` et `effort_<nom>`.
+    """
+
+    def __init__(self, default_profile='pieton'):
+        self.profiles = {}
+        self.default_profile = default_profile
+        self.register_profile(MovementProfile('pieton', PEDESTRIAN_SPEEDS,
+                                              vegetation_factors=PEDESTRIAN_VEGETATION, crossing_time_s=60.0))
+        self.register_profile(MovementProfile('infanterie_chargee', LOADED_INFANTRY_SPEEDS, default_speed=2.5,
+                                              slope_factor=loaded_infantry_slope_factor,
+                                              effort=loaded_infantry_effort,
+                                              vegetation_factors=LOADED_INFANTRY_VEGETATION, crossing_time_s=180.0))
+        self.register_profile(MovementProfile('vehicule', VEHICLE_SPEEDS, default_speed=0.0,
+                                              slope_factor=vehicle_slope_factor, effort=vehicle_effort,
+                                              vegetation_factors=VEHICLE_VEGETATION, crossing_time_s=120.0))
+
+    def register_profile(self, profile):
+        """Ajoute (ou remplace) un profil de déplacement."""
+        self.profiles[profile.name] = profile
+        return profile
+
+    def remove_profile(self, name):
+        """Retire un profil de déplacement."""
+        if name == self.default_profile:
+            raise ValueError("Le profil par défaut ne peut pas être retiré")
+        del self.profiles[name]
+
+    def column_names(self, profile_name):
+        """Noms des colonnes (temps, effort) d'un profil."""
+        if profile_name == self.default_profile:
+            return 'time', 'effort'
+        return f"time_{profile_name}", f"effort_{profile_name}"
+
+    def max_speed(self, profile_name=None):
+        """Vitesse maximale (m/s) d'un profil, utilisable pour une heuristique admissible."""
+        profile = self.profiles[profile_name or self.default_profile]
+        return profile.max_speed / 3.6
+
+    @staticmethod
+    def _surface_codes(surface_type):
+        """Encode les types de surface en codes entiers (une seule passe, aucune si déjà catégoriels)."""
+        if isinstance(surface_type, pd.Categorical):
+            return surface_type.codes, list(surface_type.categories)
+        categorical = pd.Categorical(pd.Series(surface_type, dtype=object))
+        return categorical.codes, list(categorical.categories)
+
+    @staticmethod
+    def _portions(length_m, slope_percent, ascent_m, descent_m, length_up_m, length_down_m):
+        """Découpe chaque segment en portions de pente homogène (montée, descente, plat).
+
+        Sans profil complet, tout le segment porte la pente nette.
+        """
+        length_m = np.asarray(length_m, dtype=np.float64)
+        slope_percent = np.asarray(slope_percent, dtype=np.float64)
+        zero = np.zeros_like(length_m)
+
+        if any(value is None for value in (ascent_m, descent_m, length_up_m, length_down_m)):
+            return [(length_m, slope_percent)]
+
+        ascent_m, descent_m, length_up_m, length_down_m = (
+            np.asarray(value, dtype=np.float64) for value in (ascent_m, descent_m, length_up_m, length_down_m))
+        has_profile = (np.isfinite(ascent_m) & np.isfinite(descent_m)
+                       & np.isfinite(length_up_m) & np.isfinite(length_down_m))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            up_slope = np.where(length_up_m > 0, 100 * ascent_m / length_up_m, 0.0)
+            down_slope = np.where(length_down_m > 0, -100 * descent_m / length_down_m, 0.0)
+        flat_length = np.maximum(length_m - length_up_m - length_down_m, 0)
+
+        # Les segments sans profil gardent une seule portion à pente nette
+        return [
+            (np.where(has_profile, length_up_m, length_m), np.where(has_profile, up_slope, slope_percent)),
+            (np.where(has_profile, length_down_m, zero), np.where(has_profile, down_slope, 0.0)),
+            (np.where(has_profile, flat_length, zero), zero),
+        ]
+
+    @staticmethod
+    def _vegetation_multiplier(profile, land_cover, n):
+        """Multiplicateur de temps dû à la végétation : chaque portion est parcourue à sa propre vitesse."""
+        multiplier = np.ones(n)
+        for name, factor in profile.vegetation_factors.items():
+            fraction = land_cover.get(f"{VEGETATION_PREFIX}{name}")
+            if fraction is None:
+                continue
+            fraction = np.nan_to_num(np.asarray(fraction, dtype=np.float64), nan=0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                multiplier += np.where(fraction > 0, fraction * (1 / factor - 1) if factor > 0 else np.inf, 0.0)
+        return multiplier
+
+    def compute(self, length_m, slope_percent, surface_type, ascent_m=None, descent_m=None,
+                length_up_m=None, length_down_m=None, profiles=None, land_cover=None):
+        """Calcule les colonnes de coûts de tous les segments pour tous les profils demandés.
+
+        `land_cover` : colonnes d'occupation du sol (`veg_<classe>`, `hydro_crossings`) si connues.
+        """
+        length_m = np.asarray(length_m, dtype=np.float64)
+        land_cover = land_cover or {}
+        portions = self._portions(length_m, slope_percent, ascent_m, descent_m, length_up_m, length_down_m)
+        codes, labels = self._surface_codes(surface_type)
+
+        costs = {'distance': length_m}
+        for name in profiles or self.profiles:
+            profile = self.profiles[name]
+            # Vitesse de base par code de surface ; le code -1 (inconnu) prend la valeur par défaut
+            speeds = np.append(profile.speeds_for(labels), profile.default_speed)
+            base_speed = speeds[codes]
+
+            vegetation = self._vegetation_multiplier(profile, land_cover, len(length_m))
+
+            time_s = np.zeros_like(length_m)
+            effort = np.zeros_like(length_m)
+            for portion_length, portion_slope in portions:
+                speed = base_speed * profile.slope_factor(portion_slope)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    # Temps en secondes à la vitesse effective (infini si infranchissable)
+                    portion_time = np.where(speed > 0, portion_length / 1000 / speed * 3600 * vegetation, np.inf)
+                portion_time = np.where(portion_length > 0, portion_time, 0.0)
+                time_s += portion_time
+                effort += profile.effort(portion_time, portion_slope)
+
+            # Traversées de cours d'eau à gué : temps forfaitaire, effort à plat
+            if HYDRO_CROSSINGS in land_cover and profile.crossing_time_s:
+                crossing_time = np.nan_to_num(np.asarray(land_cover[HYDRO_CROSSINGS], dtype=np.float64),
+                                              nan=0.0) * profile.crossing_time_s
+                time_s += crossing_time
+                effort += profile.effort(crossing_time, np.zeros_like(crossing_time))
+
+            time_column, effort_column = self.column_names(name)
+            costs[time_column] = time_s
+            costs[effort_column] = effort
+
+        return costs
@@ -0,0 +1,511 @@
+# rando_sim/cost_surface.py
+import heapq
+import json
+import math
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+
+from compact_graph import replace_directory
+from enrichment import DENSE_VEGETATION_CLASSES, VEGETATION_CLASSES
+from instrumentation import progress
+from routing import Route
+
+COST_SURFACE_FORMAT = "poseidon-cost-surface"
+COST_SURFACE_VERSION = 1
+
+# Classes du raster hors réseau : des libellés de surface du modèle de coûts (codes 0, 1, ...)
+SURFACE_CLASSES = ['hors_sentier', 'vegetation_dense', 'zone_rocheuse', 'cours_eau']
+# Code des cellules infranchissables (bâtiments, plans d'eau)
+IMPASSABLE = 255
+
+# Au-delà de cette pente, un terrain découvert est classé en zone rocheuse
+ROCKY_SLOPE_PERCENT = 100.0
+
+# Table des facteurs de pente : de -SLOPE_TABLE_MAX à +SLOPE_TABLE_MAX % par pas de SLOPE_TABLE_STEP
+SLOPE_TABLE_MAX = 400.0
+SLOPE_TABLE_STEP = 0.5
+
+
+def _grid_moves(connectivity):
+    """Déplacements d'une cellule vers ses voisines : (dl, dc, cellules traversées, cellules de coin).
+
+    Le coût d'un déplacement est la moyenne des cellules traversées (extrémités comprises) ;
+    une diagonale ne coupe pas le coin d'une cellule infranchissable.
+    """
+    moves = []
+    for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        moves.append((dr, dc, [], []))
+    for dr, dc in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
+        moves.append((dr, dc, [], [(dr, 0), (0, dc)]))
+    if connectivity == 16:
+        for dr, dc in [(-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2)]:
+            sr, sc = int(np.sign(dr)), int(np.sign(dc))
+            # Un saut de cavalier traverse les deux cellules situées entre ses extrémités
+            via = [(sr, 0), (sr, dc)] if abs(dr) == 2 else [(0, sc), (dr, sc)]
+            moves.append((dr, dc, via, []))
+    elif connectivity != 8:
+        raise ValueError(f"Connexité inconnue : {connectivity} (8 ou 16)")
+    return moves
+
+
+class CostSurface:
+    """Raster de friction hors réseau : classe de surface (uint8) et altitude (float32) par cellule.
+
+    Les deux grilles sont stockées en .npy et relues par mappage mémoire : seules les
+    fenêtres utilisées par une recherche sont chargées.
+    """
+
+    def __init__(self, surface, elevation, left, top, resolution, classes=None, crs='EPSG:2154'):
+        self.surface = surface
+        self.elevation = elevation
+        self.left = float(left)
+        self.top = float(top)
+        self.resolution = float(resolution)
+        self.classes = list(classes or SURFACE_CLASSES)
+        self.crs = crs
+
+    @property
+    def shape(self):
+        return self.surface.shape
+
+    @property
+    def bounds(self):
+        height, width = self.shape
+        return (self.left, self.top - height * self.resolution, self.left + width * self.resolution, self.top)
+
+    @property
+    def nbytes(self):
+        return self.surface.nbytes + self.elevation.nbytes
+
+    @staticmethod
+    def estimate_bytes(bounds, resolution):
+        """Taille des grilles (octets) pour une emprise et une résolution : 5 octets par cellule."""
+        width = math.ceil((bounds[2] - bounds[0]) / resolution)
+        height = math.ceil((bounds[3] - bounds[1]) / resolution)
+        return width * height * (np.dtype(np.uint8).itemsize + np.dtype(np.float32).itemsize)
+
+    def cell_of(self, xs, ys):
+        """Ligne et colonne des cellules contenant des points (hors grille : en dehors de [0, taille[)."""
+        cols = np.floor((np.asarray(xs, dtype=np.float64) - self.left) / self.resolution).astype(np.int64)
+        rows = np.floor((self.top - np.asarray(ys, dtype=np.float64)) / self.resolution).astype(np.int64)
+        return rows, cols
+
+    def cell_center(self, rows, cols):
+        """Coordonnées des centres de cellules."""
+        return (self.left + (np.asarray(cols) + 0.5) * self.resolution,
+                self.top - (np.asarray(rows) + 0.5) * self.resolution)
+
+    # --- Construction ----------------------------------------------------------------
+
+    @staticmethod
+    def _prepare_layers(layers, vegetation_classes=None):
+        """Géométries à rasteriser, dans l'ordre de peinture (la dernière couche l'emporte), avec leur R-tree.
+
+        La végétation dense regroupe les natures des classes DENSE_VEGETATION_CLASSES de
+        `vegetation_classes` (table de l'enrichissement du réseau, VEGETATION_CLASSES par défaut).
+        """
+        prepared = []
+
+        def add(gdf, value, all_touched, keep=None):
+            geometries = gdf.geometry.values if keep is None else gdf.geometry.values[np.asarray(keep)]
+            geometries = np.asarray(geometries, dtype=object)
+            geometries = geometries[~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)]
+            prepared.append((value, all_touched, geometries, shapely.STRtree(geometries)))
+
+        land_use = layers.get('land_use')
+        vegetation_classes = vegetation_classes or VEGETATION_CLASSES
+        patterns = [vegetation_classes[name] for name in DENSE_VEGETATION_CLASSES if name in vegetation_classes]
+        if land_use is not None and 'NATURE' in land_use.columns and patterns:
+            dense = land_use['NATURE'].astype(str).str.contains("|".join(patterns), regex=True)
+            add(land_use, SURFACE_CLASSES.index('vegetation_dense'), False, keep=dense.to_numpy())
+
+        # Les cours d'eau souterrains (POS_SOL < 0) ne gênent pas la marche ; l'entrée est gardée
+        # même vide, la zone rocheuse étant peinte juste avant
+        rivers = layers.get('rivers')
+        if rivers is None:
+            rivers = gpd.GeoDataFrame(geometry=[])
+        level = (pd.to_numeric(rivers['POS_SOL'], errors='coerce').fillna(0)
+                 if 'POS_SOL' in rivers.columns else pd.Series(0, index=rivers.index))
+        add(rivers, SURFACE_CLASSES.index('cours_eau'), True, keep=(level >= 0).to_numpy())
+
+        for name in ('water', 'buildings'):
+            if layers.get(name) is not None:
+                add(layers[name], IMPASSABLE, False)
+        return prepared
+
+    @classmethod
+    def build(cls, directory, layers, bounds, sampler=None, resolution=5.0, block_size=1024, crs='EPSG:2154',
+              vegetation_classes=None):
+        """Rasterise les couches et le MNT par blocs directement dans les fichiers du raster.
+
+        `layers` : couches de IGNDataLoader (`land_use`, `water`, `rivers`, `buildings`,
+        toutes facultatives). La mémoire utilisée est celle d'un bloc de `block_size`²
+        cellules, quelle que soit l'emprise. `vegetation_classes` : table des classes de
+        végétation, la même que pour l'enrichissement du réseau.
+        """
+        # Raster écrit à côté puis mis en place : un raster en cours d'utilisation n'est jamais réécrit
+        with replace_directory(directory) as tmp_directory:
+            cls._rasterize(tmp_directory, layers, bounds, sampler, resolution, block_size, crs, vegetation_classes)
+        return cls.load(directory)
+
+    @classmethod
+    def _rasterize(cls, directory, layers, bounds, sampler, resolution, block_size, crs, vegetation_classes):
+        minx, miny, maxx, maxy = bounds
+        width = math.ceil((maxx - minx) / resolution)
+        height = math.ceil((maxy - miny) / resolution)
+        left, top = minx, miny + height * resolution
+
+        progress(f"Raster de coût : {width} x {height} cellules de {resolution:g} m "
+                 f"({cls.estimate_bytes(bounds, resolution) / 1024 ** 2:.0f} Mo sur disque)")
+
+        surface = np.lib.format.open_memmap(directory / "surface.npy", mode='w+', dtype=np.uint8,
+                                            shape=(height, width))
+        elevation = np.lib.format.open_memmap(directory / "elevation.npy", mode='w+', dtype=np.float32,
+                                              shape=(height, width))
+        prepared = cls._prepare_layers(layers, vegetation_classes)
+        rocky = SURFACE_CLASSES.index('zone_rocheuse')
+        cours_eau = SURFACE_CLASSES.index('cours_eau')
+
+        for row0 in range(0, height, block_size):
+            for col0 in range(0, width, block_size):
+                rows, cols = min(block_size, height - row0), min(block_size, width - col0)
+                block_left, block_top = left + col0 * resolution, top - row0 * resolution
+                transform = from_origin(block_left, block_top, resolution, resolution)
+                box = shapely.box(block_left, block_top - rows * resolution,
+                                  block_left + cols * resolution, block_top)
+
+                codes = np.zeros((rows, cols), dtype=np.uint8)
+                z, slope = cls._sample_block(sampler, block_left, block_top, rows, cols, resolution)
+
+                for value, all_touched, geometries, tree in prepared:
+                    if value == cours_eau:
+                        # Terrain découvert trop raide : zone rocheuse (sous les cours d'eau et obstacles)
+                        codes[(codes == 0) & (slope > ROCKY_SLOPE_PERCENT)] = rocky
+                    hits = tree.query(box, predicate='intersects')
+                    if len(hits):
+                        rasterize(((geometry, value) for geometry in geometries[hits]), out=codes,
+                                  transform=transform, all_touched=all_touched)
+
+                surface[row0:row0 + rows, col0:col0 + cols] = codes
+                elevation[row0:row0 + rows, col0:col0 + cols] = z
+
+        surface.flush()
+        elevation.flush()
+        del surface, elevation
+
+        header = {
+            'format': COST_SURFACE_FORMAT,
+            'version': COST_SURFACE_VERSION,
+            'left': left,
+            'top': top,
+            'resolution': resolution,
+            'shape': [height, width],
+            'classes': SURFACE_CLASSES,
+            'impassable': IMPASSABLE,
+            'crs': crs,
+        }
+        # L'en-tête est écrit en dernier : un répertoire sans en-tête est incomplet
+        with open(directory / "header.json", 'w') as f:
+            json.dump(header, f, ensure_ascii=False)
+
+    @staticmethod
+    def _sample_block(sampler, left, top, rows, cols, resolution):
+        """Altitude des centres de cellules d'un bloc et pente maximale (%), calculée avec une marge d'une cellule."""
+        if sampler is None:
+            return np.full((rows, cols), np.nan, dtype=np.float32), np.full((rows, cols), np.nan)
+        xs = left + (np.arange(-1, cols + 1) + 0.5) * resolution
+        ys = top - (np.arange(-1, rows + 1) + 0.5) * resolution
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        z = sampler.sample(grid_x.ravel(), grid_y.ravel(), method='bilinear').reshape(grid_x.shape)
+        dz_dy, dz_dx = np.gradient(z, resolution)
+        slope = 100 * np.hypot(dz_dx, dz_dy)
+        return z[1:-1, 1:-1].astype(np.float32), slope[1:-1, 1:-1]
+
+    # --- Persistance -----------------------------------------------------------------
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Charge un raster de coût ; avec `mmap`, les grilles ne sont lues qu'à l'accès."""
+        directory = Path(directory)
+        header_path = directory / "header.json"
+        if not header_path.exists():
+            raise FileNotFoundError(f"Aucun raster de coût complet dans {directory}")
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        if header.get('format') != COST_SURFACE_FORMAT or header.get('version') != COST_SURFACE_VERSION:
+            raise ValueError(f"Le raster de coût {directory} est dans un format obsolète, il doit être reconstruit")
+
+        mmap_mode = 'r' if mmap else None
+        return cls(np.load(directory / "surface.npy", mmap_mode=mmap_mode),
+                   np.load(directory / "elevation.npy", mmap_mode=mmap_mode),
+                   header['left'], header['top'], header['resolution'], header['classes'], header['crs'])
+
+
+class HybridRoute:
+    """Itinéraire mixte : tronçons hors réseau (centres de cellules) et sur réseau (Route), dans l'ordre."""
+
+    def __init__(self, graph, legs, weight, cost, origin, destination):
+        self.graph = graph
+        self.legs = legs
+        self.weight = weight
+        self.cost = cost
+        self.origin = origin
+        self.destination = destination
+
+    @property
+    def network_length(self):
+        """Longueur parcourue sur le réseau (m)."""
+        return sum(leg.totals.get('distance', 0.0) for kind, leg in self.legs if kind == 'trail')
+
+    @property
+    def off_network_length(self):
+        """Longueur parcourue hors réseau (m), raccordements au réseau compris."""
+        return max(self.geometry.length - self.network_length, 0.0)
+
+    @property
+    def geometry(self):
+        coords = [tuple(self.origin)]
+        for kind, leg in self.legs:
+            if kind == 'grid':
+                coords.extend(leg)
+            else:
+                geometry = leg.geometry
+                coords.extend(shapely.get_coordinates(geometry).tolist())
+        coords.append(tuple(self.destination))
+        coords = [tuple(c) for c in coords]
+        # Supprime les points consécutifs confondus
+        coords = [c for i, c in enumerate(coords) if i == 0 or c != coords[i - 1]]
+        if len(coords) < 2:
+            return shapely.Point(coords[0])
+        return shapely.LineString(coords)
+
+
+class HybridRouter:
+    """Itinéraires mêlant réseau et hors réseau en une seule recherche A*.
+
+    La grille hors réseau est implicite : les voisins d'une cellule (8 ou 16) et le coût
+    de chaque déplacement sont calculés à la volée sur une fenêtre du raster autour de
+    l'origine et de la destination. Chaque nœud du graphe situé dans la fenêtre est relié
+    à la cellule qui le contient.
+    """
+
+    def __init__(self, router, surface, connectivity=16, margin=1000.0, max_window_cells=4_000_000):
+        self.router = router
+        self.graph = router.graph
+        self.cost_model = router.cost_model
+        self.surface = surface
+        self.connectivity = connectivity
+        self.moves = _grid_moves(connectivity)
+        self.margin = margin
+        self.max_window_cells = max_window_cells
+        self._tables = {}
+
+    def _profile_for(self, weight):
+        """Profil et type de coût ('time' ou 'effort') d'un poids du graphe."""
+        for name, profile in self.cost_model.profiles.items():
+            columns = self.cost_model.column_names(name)
+            if weight in columns:
+                return profile, ('time', 'effort')[columns.index(weight)]
+        raise ValueError(f"Poids inconnu hors réseau : {weight}")
+
+    def cost_tables(self, weight):
+        """Coût par mètre à plat de chaque classe (inf : infranchissable) et multiplicateur selon la pente.
+
+        L'effort est supposé proportionnel au temps à pente donnée, comme pour les profils fournis.
+        """
+        if weight not in self._tables:
+            slopes = np.arange(-SLOPE_TABLE_MAX, SLOPE_TABLE_MAX + SLOPE_TABLE_STEP / 2, SLOPE_TABLE_STEP)
+            pace = np.full(256, np.inf)
+            if weight == 'distance':
+                pace[:len(self.surface.classes)] = 1.0
+                multiplier = np.ones_like(slopes)
+            else:
+                profile, kind = self._profile_for(weight)
+                speeds = profile.speeds_for(self.surface.classes)
+                with np.errstate(divide='ignore'):
+                    pace[:len(speeds)] = np.where(speeds > 0, 3.6 / speeds, np.inf)
+                    factor = profile.slope_factor(slopes)
+                    multiplier = np.where(factor > 0, 1 / factor, np.inf)
+                if kind == 'effort':
+                    multiplier = multiplier * profile.effort(np.ones_like(slopes), slopes)
+            pace[IMPASSABLE] = np.inf
+            self._tables[weight] = (pace, multiplier)
+        return self._tables[weight]
+
+    def _window(self, origin, destination):
+        """Fenêtre du raster (lignes, colonnes) couvrant les deux points et une marge."""
+        (ox, oy), (dx, dy) = origin, destination
+        margin = max(self.margin, 0.25 * math.hypot(dx - ox, dy - oy))
+        rows, cols = self.surface.cell_of([min(ox, dx) - margin, max(ox, dx) + margin],
+                                          [max(oy, dy) + margin, min(oy, dy) - margin])
+        height, width = self.surface.shape
+        row0, row1 = max(int(rows[0]), 0), min(int(rows[1]) + 1, height)
+        col0, col1 = max(int(cols[0]), 0), min(int(cols[1]) + 1, width)
+        if row1 <= row0 or col1 <= col0:
+            raise ValueError("Les points sont en dehors du raster de coût")
+        if (row1 - row0) * (col1 - col0) > self.max_window_cells:
+            raise ValueError(f"Fenêtre de recherche trop grande ({row1 - row0} x {col1 - col0} cellules, "
+                             f"maximum {self.max_window_cells})")
+        return row0, row1, col0, col1
+
+    def route(self, origin, destination, weight='time'):
+        """Itinéraire entre deux points (x, y) du système du graphe, sur le réseau et hors réseau."""
+        surface = self.surface
+        res = surface.resolution
+        row0, row1, col0, col1 = self._window(origin, destination)
+
+        # Fenêtre bordée de cellules infranchissables : aucun test de bord dans la recherche
+        pad = 2 if self.connectivity == 16 else 1
+        codes = np.full((row1 - row0 + 2 * pad, col1 - col0 + 2 * pad), IMPASSABLE, dtype=np.uint8)
+        codes[pad:-pad, pad:-pad] = surface.surface[row0:row1, col0:col1]
+        elevation = np.full(codes.shape, np.nan, dtype=np.float64)
+        elevation[pad:-pad, pad:-pad] = surface.elevation[row0:row1, col0:col1]
+        n_cols = codes.shape[1]
+        n_cells = codes.size
+        # Coordonnées du centre de la cellule (0, 0) de la fenêtre bordée
+        x0 = surface.left + (col0 - pad + 0.5) * res
+        y0 = surface.top - (row0 - pad + 0.5) * res
+
+        pace_table, multiplier = self.cost_tables(weight)
+        flat_multiplier = float(multiplier[int(round(SLOPE_TABLE_MAX / SLOPE_TABLE_STEP))])
+        # memoryview : accès élément par élément rapide sans convertir la fenêtre en listes
+        pace = memoryview(pace_table[codes.ravel()])
+        z = memoryview(elevation.ravel())
+        mult = multiplier.tolist()
+        last_slope = len(mult) - 1
+
+        moves = [(dr * n_cols + dc, res * math.hypot(dr, dc),
+                  [r * n_cols + c for r, c in via], [r * n_cols + c for r, c in corners])
+                 for dr, dc, via, corners in self.moves]
+
+        def cell_index(x, y):
+            r, c = surface.cell_of([x], [y])
+            r, c = int(r[0]), int(c[0])
+            # La fenêtre est rognée au raster : un point hors raster tomberait sur une autre cellule
+            if not (row0 <= r < row1 and col0 <= c < col1):
+                raise ValueError(f"Le point ({x:.1f}, {y:.1f}) est en dehors du raster de coût {surface.bounds}")
+            return (r - row0 + pad) * n_cols + c - col0 + pad
+
+        start, goal = cell_index(*origin), cell_index(*destination)
+        if pace[start] == math.inf or pace[goal] == math.inf:
+            raise ValueError("Point de départ ou d'arrivée sur une cellule infranchissable")
+
+        # Raccordements réseau <-> grille : chaque nœud de la fenêtre et la cellule qui le contient
+        node_rows, node_cols = surface.cell_of(self.graph.x, self.graph.y)
+        inside = np.flatnonzero((node_rows >= row0) & (node_rows < row1) & (node_cols >= col0) & (node_cols < col1))
+        node_cell = {}
+        cell_nodes = {}
+        for node, r, c in zip(inside.tolist(), node_rows[inside].tolist(), node_cols[inside].tolist()):
+            cell = (r - row0 + pad) * n_cols + c - col0 + pad
+            cx, cy = x0 + (cell % n_cols) * res, y0 - (cell // n_cols) * res
+            link = math.hypot(self.graph.x[node] - cx, self.graph.y[node] - cy) * pace[cell] * flat_multiplier
+            if link < math.inf:
+                node_cell[node] = (cell, link)
+                cell_nodes.setdefault(cell, []).append((node, link))
+
+        offsets, targets, xs, ys = self.router._offsets, self.router._targets, self.router._x, self.router._y
+        w = self.router.weights(weight)
+        scale = self.router.heuristic_scale(weight)
+        tx, ty = destination
+
+        # États : cellules de la fenêtre [0, n_cells[, puis nœuds du graphe décalés de n_cells
+        g_cells = np.full(n_cells, np.inf)
+        pred_cells = np.full(n_cells, -1, dtype=np.int64)
+        g = memoryview(g_cells)
+        pred = memoryview(pred_cells)
+        g_nodes = {}
+        pred_nodes = {}
+
+        g[start] = 0.0
+        heap = [(0.0, 0.0, start)]
+        cost = None
+        while heap:
+            _, d, state = heapq.heappop(heap)
+            if state < n_cells:
+                u = state
+                if d > g[u]:
+                    continue
+                if u == goal:
+                    cost = d
+                    break
+                pa, za = pace[u], z[u]
+                for offset, length, via, corners in moves:
+                    v = u + offset
+                    total, n = pa + pace[v], 2
+                    for step in via:
+                        total += pace[u + step]
+                        n += 1
+                    if total == math.inf or any(pace[u + corner] == math.inf for corner in corners):
+                        continue
+                    zb = z[v]
+                    slope = 100 * (zb - za) / length if za == za and zb == zb else 0.0
+                    i = int((slope + SLOPE_TABLE_MAX) / SLOPE_TABLE_STEP + 0.5)
+                    candidate = d + length * total / n * mult[min(max(i, 0), last_slope)]
+                    if candidate < g[v]:
+                        g[v] = candidate
+                        pred[v] = u
+                        vx, vy = x0 + (v % n_cols) * res, y0 - (v // n_cols) * res
+                        heapq.heappush(heap, (candidate + scale * math.hypot(vx - tx, vy - ty), candidate, v))
+                for node, link in cell_nodes.get(u, ()):
+                    candidate = d + link
+                    if candidate < g_nodes.get(node, math.inf):
+                        g_nodes[node] = candidate
+                        pred_nodes[node] = (u, -1)
+                        heapq.heappush(heap, (candidate + scale * math.hypot(xs[node] - tx, ys[node] - ty),
+                                              candidate, n_cells + node))
+            else:
+                u = state - n_cells
+                if d > g_nodes[u]:
+                    continue
+                for edge in range(offsets[u], offsets[u + 1]):
+                    v = targets[edge]
+                    candidate = d + w[edge]
+                    if candidate < g_nodes.get(v, math.inf):
+                        g_nodes[v] = candidate
+                        pred_nodes[v] = (n_cells + u, edge)
+                        heapq.heappush(heap, (candidate + scale * math.hypot(xs[v] - tx, ys[v] - ty),
+                                              candidate, n_cells + v))
+                if u in node_cell:
+                    cell, link = node_cell[u]
+                    candidate = d + link
+                    if candidate < g[cell]:
+                        g[cell] = candidate
+                        pred[cell] = state
+                        heapq.heappush(heap, (candidate + scale * math.hypot(x0 + (cell % n_cols) * res - tx,
+                                                                            y0 - (cell // n_cols) * res - ty),
+                                              candidate, cell))
+
+        if cost is None:
+            raise ValueError("Aucun itinéraire entre les deux points")
+
+        # Remontée des prédécesseurs, puis regroupement en tronçons grille / réseau
+        states = [goal]
+        while states[-1] != start:
+            state = states[-1]
+            states.append(pred[state] if state < n_cells else pred_nodes[state - n_cells][0])
+        states.reverse()
+
+        legs = []
+        for i, state in enumerate(states):
+            if state < n_cells:
+                point = (x0 + (state % n_cols) * res, y0 - (state // n_cols) * res)
+                if not legs or legs[-1][0] != 'grid':
+                    legs.append(('grid', []))
+                legs[-1][1].append(point)
+            else:
+                node = state - n_cells
+                if not legs or legs[-1][0] != 'trail':
+                    legs.append(('trail', ([node], [])))
+                else:
+                    legs[-1][1][0].append(node)
+                    legs[-1][1][1].append(pred_nodes[node][1])
+        legs = [(kind, leg if kind == 'grid' else
+                 Route(self.graph, leg[0], leg[1], weight, g_nodes[leg[0][-1]] - g_nodes[leg[0][0]]))
+                for kind, leg in legs]
+        return HybridRoute(self.graph, legs, weight, cost, origin, destination)
@@ -1,72 +1,110 @@
 # rando_sim/data_loader.py
 import geopandas as gpd
-import rasterio
+import importlib.util
+import pyogrio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
+from instrumentation import count, progress, span
+from mnt_index import MNTTileIndex
+
+# Lecture via Arrow (plus rapide, moins de copies) quand pyarrow est installé
+USE_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Couches de la BD TOPO : chemin relatif et colonnes attributaires utilisées en aval
+# (None pour toutes les colonnes, [] pour la géométrie seule)
+BD_TOPO_LAYERS = {
+    # Chemins et routes
+    'roads': ("BDTOPO/1_DONNEES/TRANSPORT/ROUTE_NUMEROTEE_OU_NOMMEE.shp", ['TYPE_ROUTE']),
+    'paths': ("BDTOPO/1_DONNEES/TRANSPORT/TRONCON_DE_ROUTE.shp", ['NATURE', 'POS_SOL']),
+    # Obstacles
+    'buildings': ("BDTOPO/1_DONNEES/BATI/BATIMENT.shp", []),
+    'water': ("BDTOPO/1_DONNEES/HYDROGRAPHIE/PLAN_D_EAU.shp", ['NATURE']),
+    'rivers': ("BDTOPO/1_DONNEES/HYDROGRAPHIE/TRONCON_HYDROGRAPHIQUE.shp", ['NATURE', 'POS_SOL']),
+    # Occupation du sol
+    'land_use': ("BDTOPO/1_DONNEES/OCCUPATION_SOL/ZONE_DE_VEGETATION.shp", ['NATURE']),
+}
 
 class IGNDataLoader:
-    def __init__(self, raw_data_dir, processed_data_dir):
+    def __init__(self, raw_data_dir, processed_data_dir, bbox=None, mask=None, force_2d=True):
         self.raw_data_dir = Path(raw_data_dir)
         self.processed_data_dir = Path(processed_data_dir)
         
+        # Zone d'intérêt appliquée à la lecture, et abandon de l'altitude Z (le MNT la fournit)
+        self.bbox = bbox
+        self.mask = mask
+        self.force_2d = force_2d
+        
         # Créer les répertoires s'ils n'existent pas
         os.makedirs(self.processed_data_dir, exist_ok=True)
     
-    def load_bd_topo(self):
-        """Charge les fichiers pertinents de la BD TOPO."""
-        # Chemins et routes
-        roads_path = self.raw_data_dir / "BDTOPO/1_DONNEES/TRANSPORT/ROUTE_NUMEROTEE_OU_NOMMEE.shp"
-        paths_path = self.raw_data_dir / "BDTOPO/1_DONNEES/TRANSPORT/TRONCON_DE_ROUTE.shp"
+    def _read_layer(self, name, path, columns, bbox=None, mask=None):
+        """Lit une couche en ne gardant que les colonnes utiles et les entités de la zone d'intérêt."""
+        info = pyogrio.read_info(path)
+        # Les colonnes absentes de cette version de la BD TOPO sont ignorées
+        available = [column for column in columns if column in info['fields']] if columns is not None else None
+        
+        if mask is not None and hasattr(mask, 'to_crs'):
+            # Emprise fournie comme GeoDataFrame/GeoSeries : reprojetée dans le système de la couche
+            mask = mask.to_crs(info['crs']).union_all() if info['crs'] else mask.union_all()
         
-        # Obstacles
-        buildings_path = self.raw_data_dir / "BDTOPO/1_DONNEES/BATI/BATIMENT.shp"
-        water_path = self.raw_data_dir / "BDTOPO/1_DONNEES/HYDROGRAPHIE/PLAN_D_EAU.shp"
-        rivers_path = self.raw_data_dir / "BDTOPO/1_DONNEES/HYDROGRAPHIE/TRONCON_HYDROGRAPHIQUE.shp"
+        started = time.perf_counter()
+        with span('read_file', layer=name) as read_span:
+            gdf = gpd.read_file(path, engine="pyogrio", columns=available, bbox=bbox, mask=mask,
+                                force_2d=self.force_2d, use_arrow=USE_ARROW)
+            read_span.count('rows_read', len(gdf))
+        progress(f"{name} : {len(gdf)} entités lues en {time.perf_counter() - started:.1f} s")
+        return gdf
+    
+    def load_bd_topo(self, bbox=None, mask=None, columns=None, workers=None):
+        """Charge les couches utiles de la BD TOPO, en parallèle.
         
-        # Occupation du sol
-        land_use_path = self.raw_data_dir / "BD_TOPO/1_DONNEES/OCCUPATION_SOL/ZONE_DE_VEGETATION.shp"
+        Seules les colonnes de `BD_TOPO_LAYERS` (ou de `columns`, {couche: liste ou None pour
+        toutes}) sont lues, et la zone d'intérêt (`bbox` (xmin, ymin, xmax, ymax) ou polygone
+        `mask`) est appliquée directement par le lecteur.
+        """
+        bbox = bbox if bbox is not None else self.bbox
+        mask = mask if mask is not None else self.mask
+        layer_columns = {name: layer_cols for name, (_, layer_cols) in BD_TOPO_LAYERS.items()}
+        layer_columns.update(columns or {})
         
         # Chargement des données
-        data = {}
-        if roads_path.exists():
-            data['roads'] = gpd.read_file(roads_path)
-        if paths_path.exists():
-            data['paths'] = gpd.read_file(paths_path)
-        if buildings_path.exists():
-            data['buildings'] = gpd.read_file(buildings_path)
-        if water_path.exists():
-            data['water'] = gpd.read_file(water_path)
-        if rivers_path.exists():
-            data['rivers'] = gpd.read_file(rivers_path)
-        if land_use_path.exists():
-            data['land_use'] = gpd.read_file(land_use_path)
+        paths = {name: self.raw_data_dir / relative_path for name, (relative_path, _) in BD_TOPO_LAYERS.items()}
+        paths = {name: path for name, path in paths.items() if path.exists()}
+        
+        # La lecture se fait dans GDAL, hors du GIL : les couches se chargent en parallèle
+        with ThreadPoolExecutor(max_workers=workers or len(paths) or 1) as executor:
+            futures = {name: executor.submit(self._read_layer, name, path, layer_columns[name], bbox, mask)
+                       for name, path in paths.items()}
+            data = {name: future.result() for name, future in futures.items()}
         
         return data
     
     def load_mnt(self):
-        """Charge le Modèle Numérique de Terrain (MNT)."""
-        mnt_files = list(self.raw_data_dir.glob("**/RGEALTI*.asc"))
+        """Charge l'index des dalles du Modèle Numérique de Terrain (MNT)."""
+        # L'index persistant évite de rouvrir chaque dalle : seules les dalles nouvelles
+        # ou modifiées depuis le dernier passage voient leur en-tête relu
+        index = MNTTileIndex.load(self.processed_data_dir / "mnt_index.json",
+                                  cache_dir=self.processed_data_dir / "mnt_cache")
+        with span('dem_index_refresh'):
+            index.refresh(self.raw_data_dir)
         
-        if not mnt_files:
-            print("Aucun fichier MNT trouvé !")
+        if not index.records:
+            progress("Aucun fichier MNT trouvé !")
             return None
         
-        mnt_data = []
-        for mnt_file in mnt_files:
-            with rasterio.open(mnt_file) as src:
-                print(f"Chargement du MNT: {mnt_file}")
-                print(f"  Taille: {src.width}x{src.height}")
-                print(f"  CRS: {src.crs}")
-                
-                # Ici on pourrait charger les données, mais pour les MNT volumineux,
-                # on préférera garder les chemins des fichiers et y accéder plus tard
-                mnt_data.append({
-                    'path': str(mnt_file),
-                    'bounds': src.bounds,
-                    'crs': 'EPSG:2154' #src.crs.to_string()
-                })
+        index.save()
         
-        return mnt_data
+        # Ici on pourrait charger les données, mais pour les MNT volumineux,
+        # on préférera garder les chemins des fichiers et y accéder plus tard
+        return index.records
+    
+    def convert_mnt_cache(self):
+        """Convertit une fois les dalles ASCII du MNT en binaires mappables en mémoire."""
+        index = MNTTileIndex.load(self.processed_data_dir / "mnt_index.json",
+                                  cache_dir=self.processed_data_dir / "mnt_cache")
+        return index.convert_to_cache()
     
     def preprocess_and_save(self):
         """Charge, prétraite et sauvegarde les données au format GeoPackage."""
@@ -79,11 +117,17 @@ class IGNDataLoader:
         with open(self.processed_data_dir / "mnt_metadata.json", 'w') as f:
             json.dump(mnt_data, f)
         
-        # Sauvegarder les données vectorielles en GeoPackage
-        for name, gdf in topo_data.items():
+        # Sauvegarder les données vectorielles en GeoPackage (un fichier par couche, en parallèle)
+        def save(name, gdf):
             output_path = self.processed_data_dir / f"{name}.gpkg"
-            print(f"Sauvegarde de {name} vers {output_path}")
-            gdf.to_file(output_path, driver="GPKG")
+            progress(f"Sauvegarde de {name} vers {output_path}")
+            with span('write_file', layer=name):
+                gdf.to_file(output_path, driver="GPKG", engine="pyogrio")
+            count('rows_written', len(gdf))
+        
+        with ThreadPoolExecutor(max_workers=len(topo_data) or 1) as executor:
+            for future in [executor.submit(save, name, gdf) for name, gdf in topo_data.items()]:
+                future.result()
         
         return {
             'topo_data': topo_data,
@@ -1,26 +1,42 @@
 # rando_sim/data_processor.py
 import geopandas as gpd
-from shapely.geometry import LineString, Point
+import shapely
 import numpy as np
 from pathlib import Path
-import rasterio
-from rasterio.windows import Window
 import pandas as pd
+from dem_sampler import DEMSampler
+from mnt_index import MNTTileIndex
+from elevation_profiles import compute_elevation_profiles
+from noding import node_network
+from tiling import run_tiled
+from surface_rules import SurfaceClassifier
+from cost_surface import CostSurface
+from enrichment import enrich_network
+from instrumentation import count, progress, span
 
 class DataProcessor:
-    def __init__(self, processed_data_dir):
+    def __init__(self, processed_data_dir, surface_classifier=None):
         self.processed_data_dir = Path(processed_data_dir)
+        # Table de règles de classification des surfaces (surface_rules.json par défaut)
+        self.surface_classifier = surface_classifier or SurfaceClassifier.from_file()
         self.data = {}
         self.network = None
         self.mnt_metadata = None
+        self.profiles = None
+        self.noding_report = None
+        self._dem_sampler = None
     
-    def load_processed_data(self):
-        """Charge les données prétraitées."""
+    def load_processed_data(self, layers=None):
+        """Charge les données prétraitées (toutes les couches, ou seulement celles de `layers`)."""
         # Charger les fichiers GeoPackage
         for file_path in self.processed_data_dir.glob("*.gpkg"):
             name = file_path.stem
-            print(f"Chargement de {name}...")
-            self.data[name] = gpd.read_file(file_path)
+            if layers is not None and name not in layers:
+                continue
+            progress(f"Chargement de {name}...")
+            with span('read_file', layer=name):
+                self.data[name] = gpd.read_file(file_path)
+            count('rows_read', len(self.data[name]))
         
         # Charger les métadonnées MNT
         import json
@@ -28,6 +44,7 @@ class DataProcessor:
         if mnt_path.exists():
             with open(mnt_path, 'r') as f:
                 self.mnt_metadata = json.load(f)
+            self._dem_sampler = None
         
         return self.data
     
@@ -52,6 +69,10 @@ class DataProcessor:
 
         paths['nature'] = paths['NATURE']
         paths = paths[['geometry', 'network_type', 'nature']]
+        
+        # Position par rapport au sol (ponts, tunnels), utilisée par le nœudage
+        roads = roads.assign(level=self._ground_level(self.data['roads']))
+        paths = paths.assign(level=self._ground_level(self.data['paths']))
 
         # Fusion des deux sources
         network = gpd.pd.concat([roads, paths], ignore_index=True)
@@ -60,123 +81,198 @@ class DataProcessor:
         network = gpd.GeoDataFrame(network, geometry='geometry', crs=roads.crs)
         network = network[network.is_valid]  # Filtrer les géométries invalides
         
-        # Classification des types de surface
-        network['surface_type'] = network.apply(self._classify_surface_type, axis=1)
+        # Classification des types de surface (table de règles, stockée en Categorical)
+        with span('classify_surfaces'):
+            network['surface_type'] = self.surface_classifier.classify(network['network_type'], network['nature'])
+        count('rows_processed', len(network))
         
         # Sauvegarde du réseau unifié
         self.network = network
-        network.to_file(self.processed_data_dir / "unified_network.gpkg", driver="GPKG")
+        self._write_network(network, "unified_network.gpkg")
         
         return network
     
-    def _classify_surface_type(self, row):
-        """Classifie le type de surface en fonction des attributs."""
-        if row['network_type'] == 'sentier':
-            if 'Sentier' in str(row['nature']):
-                return 'sentier_balisé'
-            elif 'Piste cyclable' in str(row['nature']):
-                return 'piste'
-            else:
-                return 'sentier_balisé'
-        elif row['network_type'] == 'route':
-            if 'Chemin' in str(row['nature']):
-                return 'chemin'
-            elif 'Sentier' in str(row['nature']):
-                return 'sentier_balisé'
-            elif 'Route' in str(row['nature']):
-                return 'route'
-            else:
-                return 'chemin'
-        return 'chemin'  # Valeur par défaut
+    def _write_network(self, network, filename):
+        """Sauvegarde le réseau en GeoPackage dans le répertoire des données traitées."""
+        with span('write_file', layer=Path(filename).stem):
+            network.to_file(self.processed_data_dir / filename, driver="GPKG")
+        count('rows_written', len(network))
+    
+    @staticmethod
+    def _ground_level(layer):
+        """Niveau par rapport au sol (POS_SOL de la BD TOPO) : 0 au sol, > 0 pont, < 0 tunnel."""
+        if 'POS_SOL' not in layer.columns:
+            return 0
+        return pd.to_numeric(layer['POS_SOL'], errors='coerce').fillna(0).astype(int)
     
-    def extract_elevation_for_points(self, points_gdf):
+    def node_network(self, tolerance=0.5, **kwargs):
+        """Nœude le réseau unifié : fusion des extrémités proches, raccords en T, découpe aux croisements.
+        
+        Les ponts et tunnels (colonne `level`) ne sont pas coupés par les voies qu'ils croisent.
+        """
+        if self.network is None:
+            raise ValueError("Le réseau unifié n'a pas été créé")
+        
+        with span('noding', rows=len(self.network)):
+            network, self.noding_report = node_network(self.network, tolerance=tolerance, **kwargs)
+        
+        # Le réseau nœudé remplace le réseau unifié pour les étapes suivantes
+        self.network = network
+        self._write_network(network, "unified_network.gpkg")
+        
+        return network
+    
+    def _get_dem_sampler(self):
+        """Renvoie l'échantillonneur MNT, partagé entre les étapes pour réutiliser le cache des dalles."""
+        if self._dem_sampler is None:
+            index = MNTTileIndex.from_records(self.mnt_metadata,
+                                              cache_dir=self.processed_data_dir / "mnt_cache")
+            self._dem_sampler = DEMSampler(index)
+        return self._dem_sampler
+    
+    def extract_elevation_for_points(self, points_gdf, method='nearest'):
         """Extrait l'élévation pour une série de points."""
         if not self.mnt_metadata:
             raise ValueError("Les métadonnées MNT ne sont pas chargées")
         
-        # Ajouter une colonne pour stocker l'élévation
-        points_gdf['elevation'] = np.nan
-        
-        # Pour chaque fichier MNT
-        for mnt_info in self.mnt_metadata:
-            mnt_path = mnt_info['path']
-            
-            with rasterio.open(mnt_path) as src:
-                # Filtrer les points qui sont dans les limites de ce MNT
-                bounds = mnt_info['bounds']
-                mask = points_gdf.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]].index
-                
-                if len(mask) == 0:
-                    continue
-                
-                # Pour chaque point dans les limites
-                for idx in mask:
-                    point = points_gdf.loc[idx, 'geometry']
-                    
-                    # Convertir les coordonnées du point en indices raster
-                    x, y = src.index(point.x, point.y)
-                    
-                    # Vérifier que les indices sont valides
-                    if 0 <= x < src.width and 0 <= y < src.height:
-                        # Lire la valeur d'élévation
-                        window = Window(x, y, 1, 1)
-                        data = src.read(1, window=window)
-                        
-                        # Si la valeur n'est pas NO_DATA
-                        if data[0, 0] != src.nodata:
-                            points_gdf.at[idx, 'elevation'] = float(data[0, 0])
+        # Échantillonnage groupé par dalle : une lecture raster par dalle et non par point
+        sampler = self._get_dem_sampler()
+        geometries = points_gdf.geometry.values
+        points_gdf['elevation'] = sampler.sample(shapely.get_x(geometries),
+                                                 shapely.get_y(geometries),
+                                                 method=method)
         
         return points_gdf
     
-    def add_elevation_to_network(self):
+    def add_elevation_to_network(self, method='nearest'):
         """Ajoute l'information d'élévation au réseau."""
         if self.network is None:
             raise ValueError("Le réseau unifié n'est pas créé")
         
-        # Extraire les points de début et de fin de chaque segment
-        start_points = []
-        end_points = []
-        
-        for idx, row in self.network.iterrows():
-            if isinstance(row.geometry, LineString):
-                start_points.append(Point(row.geometry.coords[0]))
-                end_points.append(Point(row.geometry.coords[-1]))
-            else:
-                # Skip geometries that are not LineStrings
-                start_points.append(None)
-                end_points.append(None)
-        
-        # Créer des GeoDataFrames pour les points
-        start_gdf = gpd.GeoDataFrame({'geometry': start_points}, 
-                                     geometry='geometry', 
-                                     crs=self.network.crs)
-        end_gdf = gpd.GeoDataFrame({'geometry': end_points}, 
-                                   geometry='geometry', 
-                                   crs=self.network.crs)
-        
-        # Filtrer les géométries None
-        start_gdf = start_gdf[~start_gdf.geometry.isna()]
-        end_gdf = end_gdf[~end_gdf.geometry.isna()]
-        
-        # Extraire l'élévation
-        start_gdf = self.extract_elevation_for_points(start_gdf)
-        end_gdf = self.extract_elevation_for_points(end_gdf)
+        if not self.mnt_metadata:
+            raise ValueError("Les métadonnées MNT ne sont pas chargées")
         
-        # Ajouter l'élévation au réseau
-        self.network['elevation_start'] = np.nan
-        self.network['elevation_end'] = np.nan
+        # Extraire les points de début et de fin de chaque LineString (les autres géométries sont ignorées)
+        geometries = self.network.geometry.values
+        is_line = shapely.get_type_id(geometries) == 1
+        start_points = shapely.get_point(geometries[is_line], 0)
+        end_points = shapely.get_point(geometries[is_line], -1)
+        
+        # Extraire l'élévation des débuts et fins en un seul passage
+        sampler = self._get_dem_sampler()
+        points = np.concatenate([start_points, end_points])
+        elevations = sampler.sample(shapely.get_x(points), shapely.get_y(points), method=method)
         
-        # Mapper les élévations aux segments correspondants
-        for i, (idx, row) in enumerate(self.network.iterrows()):
-            if i < len(start_gdf) and i < len(end_gdf):
-                self.network.at[idx, 'elevation_start'] = start_gdf.iloc[i].get('elevation', np.nan)
-                self.network.at[idx, 'elevation_end'] = end_gdf.iloc[i].get('elevation', np.nan)
+        # Ajouter l'élévation au réseau
+        n_lines = int(is_line.sum())
+        elevation_start = np.full(len(self.network), np.nan)
+        elevation_end = np.full(len(self.network), np.nan)
+        elevation_start[is_line] = elevations[:n_lines]
+        elevation_end[is_line] = elevations[n_lines:]
+        self.network['elevation_start'] = elevation_start
+        self.network['elevation_end'] = elevation_end
         
         # Calculer la pente
         self.network['length_m'] = self.network.geometry.length
         self.network['slope_percent'] = 100 * (self.network['elevation_end'] - self.network['elevation_start']) / self.network['length_m']
         
         # Sauvegarder le réseau avec élévation
-        self.network.to_file(self.processed_data_dir / "network_with_elevation.gpkg", driver="GPKG")
+        self._write_network(self.network, "network_with_elevation.gpkg")
+        
+        return self.network
+    
+    def add_elevation_profiles(self, spacing=None, method='nearest'):
+        """Ajoute au réseau le profil altimétrique complet de chaque segment (D+, D-, pente maximale)."""
+        if self.network is None:
+            raise ValueError("Le réseau unifié n'est pas créé")
+        
+        if not self.mnt_metadata:
+            raise ValueError("Les métadonnées MNT ne sont pas chargées")
+        
+        # Échantillonnage de tous les sommets (ou d'un pas densifié) en un seul passage
+        sampler = self._get_dem_sampler()
+        with span('elevation_profiles', rows=len(self.network)):
+            profiles, summary = compute_elevation_profiles(self.network.geometry.values, sampler,
+                                                           spacing=spacing, method=method)
+        count('rows_processed', len(self.network))
+        
+        # Colonnes de synthèse consommées par GraphBuilder.calculate_costs
+        for column in summary.columns:
+            self.network[column] = summary[column].values
+        
+        # La pente nette reste disponible pour compatibilité
+        self.network['length_m'] = self.network.geometry.length
+        self.network['slope_percent'] = 100 * (self.network['elevation_end'] - self.network['elevation_start']) / self.network['length_m']
+        
+        # Sauvegarder le réseau et les profils (même ordre de lignes)
+        self.profiles = profiles
+        profiles.save(self.processed_data_dir / "elevation_profiles.npz")
+        self._write_network(self.network, "network_with_elevation.gpkg")
         
         return self.network
+    
+    def process_tiled(self, spacing=None, method='nearest', workers=None, block_tiles=1):
+        """Classification des surfaces, profils altimétriques et pente par blocs de dalles MNT, en parallèle.
+        
+        Chaque processus n'ouvre que les dalles de son bloc ; le résultat est identique à
+        create_unified_network suivi de add_elevation_profiles.
+        """
+        if self.network is None:
+            raise ValueError("Le réseau unifié n'est pas créé")
+        
+        if not self.mnt_metadata:
+            raise ValueError("Les métadonnées MNT ne sont pas chargées")
+        
+        index = self._get_dem_sampler().index
+        # Les processus de travail ne sont pas instrumentés : seul l'ensemble est mesuré
+        with span('tiled_profiles', rows=len(self.network), workers=workers):
+            columns, profiles = run_tiled(self.network, index, self.surface_classifier, spacing=spacing,
+                                          method=method, workers=workers, block_tiles=block_tiles)
+        count('rows_processed', len(self.network))
+        for column, values in columns.items():
+            self.network[column] = values
+        
+        # Mêmes sorties que add_elevation_profiles
+        self.profiles = profiles
+        profiles.save(self.processed_data_dir / "elevation_profiles.npz")
+        self._write_network(self.network, "network_with_elevation.gpkg")
+        
+        return self.network
+    
+    def add_land_cover(self, classes=None):
+        """Ajoute à chaque ligne du réseau la part de sa longueur dans chaque classe de végétation
+        et son nombre de traversées de cours d'eau sans pont.
+        
+        Les colonnes sont aussi sauvegardées dans land_cover.npz (même ordre de lignes que le
+        réseau unifié), relu par GraphBuilder.load_network.
+        """
+        if self.network is None:
+            raise ValueError("Le réseau unifié n'est pas créé")
+        
+        with span('enrich', rows=len(self.network)):
+            columns = enrich_network(self.network, land_use=self.data.get('land_use'),
+                                     rivers=self.data.get('rivers'), classes=classes)
+        count('rows_processed', len(self.network))
+        for column in columns.columns:
+            self.network[column] = columns[column].to_numpy()
+        
+        np.savez(self.processed_data_dir / "land_cover.npz",
+                 **{column: columns[column].to_numpy() for column in columns.columns})
+        return columns
+    
+    def build_cost_surface(self, resolution=5.0, bounds=None, block_size=1024, vegetation_classes=None):
+        """Rasterise occupation du sol, eau, bâti et pente du MNT en un raster de coût hors réseau.
+        
+        L'emprise est celle du réseau unifié par défaut ; le MNT est facultatif (altitude
+        inconnue, pas de zone rocheuse). `vegetation_classes` : table de `add_land_cover`.
+        """
+        if bounds is None:
+            if self.network is None:
+                raise ValueError("Le réseau unifié n'est pas créé")
+            bounds = tuple(self.network.total_bounds)
+        
+        layers = {name: self.data[name] for name in ('land_use', 'water', 'rivers', 'buildings') if name in self.data}
+        sampler = self._get_dem_sampler() if self.mnt_metadata else None
+        return CostSurface.build(self.processed_data_dir / "cost_surface", layers, bounds, sampler=sampler,
+                                 resolution=resolution, block_size=block_size,
+                                 vegetation_classes=vegetation_classes)
@@ -0,0 +1,96 @@
+# rando_sim/dem_sampler.py
+import numpy as np
+
+from instrumentation import count
+from mnt_index import MNTTileIndex
+
+
+class DEMSampler:
+    """Échantillonne le MNT par lots : chaque dalle RGEALTI est décodée une seule fois."""
+
+    def __init__(self, mnt_metadata):
+        if not mnt_metadata:
+            raise ValueError("Les métadonnées MNT ne sont pas chargées")
+
+        # Accepte un index existant (et son cache) ou une liste de métadonnées
+        if isinstance(mnt_metadata, MNTTileIndex):
+            self.index = mnt_metadata
+        else:
+            self.index = MNTTileIndex.from_records(mnt_metadata)
+
+    def sample(self, xs, ys, method='nearest'):
+        """Renvoie l'élévation (NaN si inconnue) pour des tableaux de coordonnées Lambert-93."""
+        if method not in ('nearest', 'bilinear'):
+            raise ValueError(f"Méthode d'interpolation inconnue : {method}")
+
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        elevations = np.full(len(xs), np.nan)
+        if len(xs) == 0:
+            return elevations
+        count('dem_points_sampled', len(xs))
+
+        # Recherche spatiale des dalles contenant chaque point (R-tree)
+        valid = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+        point_idx, tile_idx = self.index.query_points(xs[valid], ys[valid])
+        point_idx = valid[point_idx]
+
+        # Regroupement par dalle, dans l'ordre de l'index
+        order = np.lexsort((point_idx, tile_idx))
+        point_idx, tile_idx = point_idx[order], tile_idx[order]
+        tiles, starts = np.unique(tile_idx, return_index=True)
+        ends = np.append(starts[1:], len(tile_idx))
+
+        for tile_id, start, end in zip(tiles, starts, ends):
+            indices = point_idx[start:end]
+            tile = self.index.get_tile(tile_id)
+            values = self._sample_tile(tile, xs[indices], ys[indices], method)
+
+            # Comme auparavant, une dalle suivante n'écrase que par une valeur valide
+            found = ~np.isnan(values)
+            elevations[indices[found]] = values[found]
+
+        return elevations
+
+    def _sample_tile(self, tile, xs, ys, method):
+        """Indexe le tableau de la dalle pour tous ses points en une fois."""
+        # Coordonnées pixel continues (colonne, ligne) depuis le coin supérieur gauche
+        cols_f = (xs - tile.left) / tile.xres
+        rows_f = (ys - tile.top) / tile.yres
+
+        if method == 'nearest':
+            cols = np.clip(np.floor(cols_f).astype(np.int64), 0, tile.width - 1)
+            rows = np.clip(np.floor(rows_f).astype(np.int64), 0, tile.height - 1)
+            return self._mask_nodata(tile.data[rows, cols], tile.nodata)
+
+        # Interpolation bilinéaire entre les centres des quatre pixels voisins
+        cols_c = np.clip(cols_f - 0.5, 0, tile.width - 1)
+        rows_c = np.clip(rows_f - 0.5, 0, tile.height - 1)
+        col0 = np.minimum(np.floor(cols_c).astype(np.int64), max(tile.width - 2, 0))
+        row0 = np.minimum(np.floor(rows_c).astype(np.int64), max(tile.height - 2, 0))
+        col1 = np.minimum(col0 + 1, tile.width - 1)
+        row1 = np.minimum(row0 + 1, tile.height - 1)
+        dc = cols_c - col0
+        dr = rows_c - row0
+
+        z00 = self._mask_nodata(tile.data[row0, col0], tile.nodata)
+        z01 = self._mask_nodata(tile.data[row0, col1], tile.nodata)
+        z10 = self._mask_nodata(tile.data[row1, col0], tile.nodata)
+        z11 = self._mask_nodata(tile.data[row1, col1], tile.nodata)
+
+        values = (z00 * (1 - dr) * (1 - dc) + z01 * (1 - dr) * dc
+                  + z10 * dr * (1 - dc) + z11 * dr * dc)
+
+        # Si un voisin est NO_DATA, on se rabat sur le pixel le plus proche
+        fallback = np.isnan(values)
+        if fallback.any():
+            values[fallback] = self._sample_tile(tile, xs[fallback], ys[fallback], 'nearest')
+        return values
+
+    @staticmethod
+    def _mask_nodata(values, nodata):
+        """Convertit les valeurs en flottants en remplaçant NO_DATA par NaN."""
+        values = values.astype(np.float64)
+        if nodata is not None:
+            values[values == nodata] = np.nan
+        return values
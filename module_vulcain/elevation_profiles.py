@@ -0,0 +1,102 @@
+# rando_sim/elevation_profiles.py
+import numpy as np
+import pandas as pd
+import shapely
+
+
+class ElevationProfiles:
+    """Profils altimétriques compacts : distances et altitudes cumulées de toutes les arêtes, indexées par offsets."""
+
+    def __init__(self, offsets, distances, elevations):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.elevations = np.asarray(elevations, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def profile(self, i):
+        """Renvoie (distance cumulée, altitude) pour l'arête de position i."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.distances[start:end], self.elevations[start:end]
+
+    def save(self, filename):
+        """Sauvegarde les profils au format NPZ."""
+        np.savez(filename, offsets=self.offsets, distances=self.distances, elevations=self.elevations)
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        """Charge des profils sauvegardés par save()."""
+        with np.load(filename) as data:
+            return cls(data['offsets'], data['distances'], data['elevations'])
+
+
+def compute_elevation_profiles(geometries, sampler, spacing=None, method='nearest'):
+    """Échantillonne le MNT sur tous les sommets (ou tous les `spacing` mètres) en un seul passage.
+
+    Renvoie les profils et un DataFrame de synthèse par géométrie : D+, D-,
+    longueurs montantes/descendantes, pente maximale et altitudes aux extrémités.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    n_geoms = len(geometries)
+
+    # Les parties des MultiLineString sont traitées séparément (pas de saut entre parties)
+    parts, part_geom = shapely.get_parts(geometries, return_index=True)
+    if spacing is not None:
+        parts = shapely.segmentize(parts, spacing)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+    coord_geom = part_geom[coord_part]
+
+    # Une seule requête au MNT pour tous les sommets
+    z = sampler.sample(coords[:, 0], coords[:, 1], method=method)
+
+    # Pas entre sommets consécutifs d'une même partie
+    same_part = np.zeros(len(coords), dtype=bool)
+    same_part[1:] = coord_part[1:] == coord_part[:-1]
+    step = np.zeros(len(coords))
+    step[1:] = np.hypot(np.diff(coords[:, 0]), np.diff(coords[:, 1]))
+    step[~same_part] = 0.0
+    dz = np.zeros(len(coords))
+    dz[1:] = np.diff(z)
+    dz[~same_part | np.isnan(dz)] = 0.0
+
+    # Distance cumulée propre à chaque géométrie : le résultat ne dépend pas des autres
+    # géométries du lot (traitement par dalles identique au traitement d'un seul bloc)
+    cumulative = pd.Series(step).groupby(coord_geom).cumsum().to_numpy()
+    offsets = np.zeros(n_geoms + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(coord_geom, minlength=n_geoms))
+    has_coords = offsets[1:] > offsets[:-1]
+    first = offsets[:-1][has_coords]
+
+    # Synthèse par géométrie
+    up = dz > 0
+    down = dz < 0
+    ascent = np.bincount(coord_geom, weights=np.where(up, dz, 0.0), minlength=n_geoms)
+    descent = np.bincount(coord_geom, weights=np.where(down, -dz, 0.0), minlength=n_geoms)
+    length_up = np.bincount(coord_geom, weights=np.where(up, step, 0.0), minlength=n_geoms)
+    length_down = np.bincount(coord_geom, weights=np.where(down, step, 0.0), minlength=n_geoms)
+
+    max_slope = np.zeros(n_geoms)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step_slope = np.where(step > 0, 100 * np.abs(dz) / step, 0.0)
+    np.maximum.at(max_slope, coord_geom, step_slope)
+
+    elevation_start = np.full(n_geoms, np.nan)
+    elevation_end = np.full(n_geoms, np.nan)
+    elevation_start[has_coords] = z[first]
+    elevation_end[has_coords] = z[offsets[1:][has_coords] - 1]
+
+    # Sans aucune altitude connue, la synthèse n'a pas de sens
+    known = np.bincount(coord_geom, weights=~np.isnan(z), minlength=n_geoms) > 0
+    summary = pd.DataFrame({
+        'elevation_start': elevation_start,
+        'elevation_end': elevation_end,
+        'ascent_m': np.where(known, ascent, np.nan),
+        'descent_m': np.where(known, descent, np.nan),
+        'length_up_m': np.where(known, length_up, np.nan),
+        'length_down_m': np.where(known, length_down, np.nan),
+        'max_slope_percent': np.where(known, max_slope, np.nan),
+    })
+
+    return ElevationProfiles(offsets, cumulative, z), summary
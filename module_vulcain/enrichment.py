@@ -0,0 +1,196 @@
+# rando_sim/enrichment.py
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from instrumentation import progress
+
+# Classes de végétation (natures de ZONE_DE_VEGETATION, expressions régulières) : une colonne
+# `veg_<classe>` par classe donne la part de la longueur de chaque ligne dans cette classe
+VEGETATION_CLASSES = {
+    'foret': r"Forêt fermée|Bois|Peupleraie",
+    'foret_ouverte': r"Forêt ouverte|Zone arborée",
+    'lande': r"Lande|Haie",
+    'verger_vigne': r"Verger|Vigne",
+}
+# Classes qui forment la végétation dense du raster de coût hors réseau (cost_surface.py) :
+# une même nature de zone est ainsi classée de la même façon sur le réseau et en dehors
+DENSE_VEGETATION_CLASSES = ('foret', 'lande')
+VEGETATION_PREFIX = 'veg_'
+# Nombre de traversées de cours d'eau au même niveau que la voie (sans pont ni buse)
+HYDRO_CROSSINGS = 'hydro_crossings'
+
+# Les polygones de plus de SUBDIVIDE_MAX_VERTICES sommets sont découpés selon une grille
+SUBDIVIDE_MAX_VERTICES = 256
+SUBDIVIDE_CELL = 1000.0
+# Nombre de lignes traitées par requête groupée (borne la mémoire des couples ligne/polygone)
+CHUNK_SIZE = 200_000
+
+
+def land_cover_columns(columns):
+    """Colonnes d'enrichissement (végétation, traversées) parmi des noms de colonnes."""
+    return [column for column in columns
+            if str(column).startswith(VEGETATION_PREFIX) or column == HYDRO_CROSSINGS]
+
+
+def _ground_level(layer):
+    """Niveau par rapport au sol (POS_SOL), 0 si absent."""
+    if 'POS_SOL' not in layer.columns:
+        return np.zeros(len(layer), dtype=np.int64)
+    return pd.to_numeric(layer['POS_SOL'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+
+def subdivide(polygons, max_vertices=SUBDIVIDE_MAX_VERTICES, cell=SUBDIVIDE_CELL):
+    """Découpe les grands polygones selon une grille de pas `cell` (comme ST_Subdivide).
+
+    Une intersection avec un morceau ne coûte plus que ses quelques sommets, au lieu de
+    ceux du massif forestier entier pour chaque ligne qui le touche.
+    """
+    polygons = np.asarray(polygons, dtype=object)
+    big = shapely.get_num_coordinates(polygons) > max_vertices
+    if not big.any():
+        return polygons
+
+    # Cellules de la grille couvrant l'emprise de chaque grand polygone
+    bounds = shapely.bounds(polygons[big])
+    ix0, iy0 = np.floor(bounds[:, 0] / cell).astype(np.int64), np.floor(bounds[:, 1] / cell).astype(np.int64)
+    nx = np.floor(bounds[:, 2] / cell).astype(np.int64) - ix0 + 1
+    ny = np.floor(bounds[:, 3] / cell).astype(np.int64) - iy0 + 1
+    counts = nx * ny
+    owner = np.repeat(np.arange(len(bounds)), counts)
+    rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = ix0[owner] + rank % nx[owner]
+    cy = iy0[owner] + rank // nx[owner]
+    boxes = shapely.box(cx * cell, cy * cell, (cx + 1) * cell, (cy + 1) * cell)
+
+    # Seules les parties surfaciques des morceaux sont gardées (les contacts linéaires sont écartés)
+    pieces = shapely.get_parts(shapely.intersection(polygons[big][owner], boxes))
+    pieces = pieces[shapely.get_type_id(pieces) == 3]
+    return np.concatenate([polygons[~big], pieces])
+
+
+def _covered_length(lines, line_idx, pieces):
+    """Longueur de chaque ligne couverte par l'union de ses morceaux (intervalles fusionnés le long de la ligne).
+
+    Les morceaux issus de polygones qui se recouvrent ne sont ainsi comptés qu'une fois,
+    sans union géométrique sensible aux arrondis.
+    """
+    parts, part_idx = shapely.get_parts(pieces, return_index=True)
+    is_line = shapely.get_type_id(parts) == 1
+    parts, owner = parts[is_line], line_idx[part_idx[is_line]]
+    if not len(parts):
+        return np.zeros(len(lines))
+
+    # Position des extrémités de chaque morceau le long de sa ligne
+    a = shapely.line_locate_point(lines[owner], shapely.get_point(parts, 0))
+    b = shapely.line_locate_point(lines[owner], shapely.get_point(parts, -1))
+    intervals = pd.DataFrame({'line': owner, 'start': np.minimum(a, b), 'end': np.maximum(a, b)})
+    intervals = intervals.sort_values(['line', 'start'], kind='stable')
+
+    # Fin la plus lointaine des intervalles précédents de la même ligne : seul le dépassement compte
+    reach = intervals.groupby('line', sort=False)['end'].cummax()
+    previous = reach.groupby(intervals['line'], sort=False).shift().fillna(-np.inf)
+    added = (intervals['end'] - np.maximum(intervals['start'], previous)).clip(lower=0)
+    return np.bincount(intervals['line'].to_numpy(), weights=added.to_numpy(), minlength=len(lines))
+
+
+def vegetation_fractions(lines, land_use, classes=None, chunk_size=CHUNK_SIZE, verbose=True):
+    """Part de la longueur de chaque ligne dans chaque classe de végétation (DataFrame `veg_<classe>`).
+
+    Requêtes groupées sur un R-tree par classe ; les lignes entièrement contenues dans un
+    polygone (prédicat préparé `within`) ne passent pas par le calcul d'intersection.
+    """
+    lines = np.asarray(lines, dtype=object)
+    lengths = shapely.length(lines)
+    classes = VEGETATION_CLASSES if classes is None else classes
+    nature = land_use['NATURE'].astype(str) if 'NATURE' in land_use.columns else pd.Series('', index=land_use.index)
+    geometries = np.asarray(land_use.geometry.values, dtype=object)
+    valid = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+
+    columns = {}
+    for name, pattern in classes.items():
+        started = time.perf_counter()
+        polygons = subdivide(geometries[valid & nature.str.contains(pattern, regex=True).to_numpy()])
+        covered = np.zeros(len(lines))
+        if len(polygons):
+            tree = shapely.STRtree(polygons)
+            for start in range(0, len(lines), chunk_size):
+                chunk = lines[start:start + chunk_size]
+                line_idx, poly_idx = tree.query(chunk, predicate='intersects')
+                inside_line, _ = tree.query(chunk, predicate='within')
+
+                # Ligne entièrement dans un polygone : toute sa longueur ; sinon, les morceaux découpés
+                inside = np.zeros(len(chunk), dtype=bool)
+                inside[inside_line] = True
+                partial = ~inside[line_idx]
+                line_idx, poly_idx = line_idx[partial], poly_idx[partial]
+                pieces = shapely.intersection(chunk[line_idx], polygons[poly_idx])
+
+                chunk_covered = np.where(inside, lengths[start:start + len(chunk)], 0.0)
+                chunk_covered += _covered_length(chunk, line_idx, pieces)
+                covered[start:start + len(chunk)] = chunk_covered
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(lengths > 0, covered / lengths, 0.0)
+        columns[f"{VEGETATION_PREFIX}{name}"] = np.clip(fraction, 0.0, 1.0)
+        if verbose:
+            progress(f"  {name} : {len(polygons)} polygones, {np.count_nonzero(covered)} lignes concernées "
+                     f"({time.perf_counter() - started:.1f} s)")
+    return pd.DataFrame(columns)
+
+
+def hydro_crossings(lines, rivers, line_level=None, chunk_size=CHUNK_SIZE):
+    """Nombre de points où chaque ligne traverse un cours d'eau au même niveau qu'elle.
+
+    Un pont (niveau > 0) ne traverse pas à gué la rivière qu'il franchit, pas plus qu'une
+    voie au sol un cours d'eau busé (niveau < 0).
+    """
+    lines = np.asarray(lines, dtype=object)
+    line_level = np.zeros(len(lines), dtype=np.int64) if line_level is None else np.asarray(line_level)
+    geometries = np.asarray(rivers.geometry.values, dtype=object)
+    valid = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+    river_level = _ground_level(rivers)[valid]
+    geometries = geometries[valid]
+
+    crossings = np.zeros(len(lines), dtype=np.int64)
+    if not len(geometries):
+        return crossings
+    tree = shapely.STRtree(geometries)
+    for start in range(0, len(lines), chunk_size):
+        chunk = lines[start:start + chunk_size]
+        line_idx, river_idx = tree.query(chunk, predicate='crosses')
+        same_level = line_level[start + line_idx] == river_level[river_idx]
+        line_idx, river_idx = line_idx[same_level], river_idx[same_level]
+        points = shapely.get_num_geometries(shapely.intersection(chunk[line_idx], geometries[river_idx]))
+        crossings[start:start + len(chunk)] += np.bincount(line_idx, weights=points,
+                                                           minlength=len(chunk)).astype(np.int64)
+    return crossings
+
+
+def enrich_network(network, land_use=None, rivers=None, classes=None, level_column='level', verbose=True):
+    """Colonnes d'occupation du sol et de traversées de cours d'eau de chaque ligne du réseau.
+
+    Les couches absentes donnent des colonnes nulles. Renvoie un DataFrame aligné sur le réseau.
+    """
+    lines = network.geometry.values
+    classes = VEGETATION_CLASSES if classes is None else classes
+
+    started = time.perf_counter()
+    if land_use is not None:
+        columns = vegetation_fractions(lines, land_use, classes=classes, verbose=verbose)
+    else:
+        columns = pd.DataFrame({f"{VEGETATION_PREFIX}{name}": np.zeros(len(network)) for name in classes})
+
+    if rivers is not None:
+        level = network[level_column].to_numpy() if level_column in network.columns else None
+        columns[HYDRO_CROSSINGS] = hydro_crossings(lines, rivers, line_level=level)
+    else:
+        columns[HYDRO_CROSSINGS] = np.zeros(len(network), dtype=np.int64)
+
+    columns.index = network.index
+    if verbose:
+        progress(f"Enrichissement de {len(network)} lignes en {time.perf_counter() - started:.1f} s "
+                 f"({int((columns[HYDRO_CROSSINGS] > 0).sum())} avec traversée de cours d'eau)")
+    return columns
@@ -1,223 +1,355 @@
 # rando_sim/graph.py
 import networkx as nx
 import geopandas as gpd
-from shapely.geometry import Point, LineString
+import shapely
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
 import pandas as pd
+from compact_graph import CompactGraph
+from cost_model import CostModel
+from enrichment import land_cover_columns
+from instrumentation import count, progress, span
+from rendering import NetworkRenderer
+from snapping import SnapIndex
+from surface_rules import SurfaceClassifier
 
 class GraphBuilder:
-    def __init__(self, processed_data_dir):
+    def __init__(self, processed_data_dir, cost_model=None):
         self.processed_data_dir = Path(processed_data_dir)
         self.graph = nx.DiGraph()  # Graphe orienté pour tenir compte des pentes
         self.network = None
+        self.compact_graph = None
+        self.cost_model = cost_model or CostModel()
     
-    def load_network(self):
-        """Charge le réseau avec élévation."""
-        network_path = self.processed_data_dir / "network_with_elevation.gpkg"
-        if not network_path.exists():
-            network_path = self.processed_data_dir / "unified_network.gpkg"
+    def load_network(self, network_path=None, land_cover_path=None):
+        """Charge le réseau avec élévation.
+        
+        Sans `network_path`, le réseau avec élévation est pris s'il existe (sinon le réseau unifié),
+        avec land_cover.npz s'il existe. Avec `network_path`, seuls les fichiers indiqués sont lus.
+        """
+        if network_path is None:
+            network_path = self.processed_data_dir / "network_with_elevation.gpkg"
             if not network_path.exists():
-                raise FileNotFoundError("Aucun fichier de réseau trouvé")
-        
-        self.network = gpd.read_file(network_path)
+                network_path = self.processed_data_dir / "unified_network.gpkg"
+                if not network_path.exists():
+                    raise FileNotFoundError("Aucun fichier de réseau trouvé")
+            land_cover_path = self.processed_data_dir / "land_cover.npz"
+        network_path = Path(network_path)
+        
+        with span('read_file', layer=network_path.stem):
+            self.network = gpd.read_file(network_path)
+        count('rows_read', len(self.network))
+        
+        # Le GeoPackage stocke les libellés : retour aux catégories de la table de règles
+        if 'surface_type' in self.network:
+            self.network['surface_type'] = SurfaceClassifier.from_file().categorical(self.network['surface_type'])
+        
+        # Occupation du sol calculée par DataProcessor.add_land_cover (mêmes lignes que le réseau)
+        if land_cover_path is not None and Path(land_cover_path).exists():
+            with np.load(land_cover_path) as land_cover:
+                if all(len(land_cover[column]) == len(self.network) for column in land_cover.files):
+                    for column in land_cover.files:
+                        self.network[column] = land_cover[column]
+                else:
+                    progress(f"{land_cover_path} ne correspond pas au réseau, occupation du sol ignorée")
         return self.network
     
-    def _add_edge_with_attributes(self, start_node, end_node, idx, row):
-        """Ajoute une arête dans les deux sens avec les attributs appropriés."""
-        # Récupérer ou calculer les attributs nécessaires
-        surface_type = row.get('surface_type', 'chemin')
+    # Colonnes du profil altimétrique complet calculées par DataProcessor.add_elevation_profiles
+    PROFILE_COLUMNS = ('ascent_m', 'descent_m', 'length_up_m', 'length_down_m', 'max_slope_percent')
+    
+    # Colonnes du profil utilisées par CostModel.compute (la pente maximale ne sert qu'à l'affichage)
+    COST_PROFILE_COLUMNS = ('ascent_m', 'descent_m', 'length_up_m', 'length_down_m')
+    
+    # Correspondance montée/descente pour l'arête retour
+    REVERSE_PROFILE_COLUMNS = {'ascent_m': 'descent_m', 'descent_m': 'ascent_m',
+                               'length_up_m': 'length_down_m', 'length_down_m': 'length_up_m'}
+    
+    def _explode_lines(self):
+        """Éclate le réseau en LineString simples et renvoie (parties, ligne d'origine, identifiants)."""
+        geometries = self.network.geometry.values
+        type_ids = shapely.get_type_id(geometries)
+        
+        # Seules les LineString (1) et MultiLineString (5) sont utilisées
+        keep = np.flatnonzero((type_ids == 1) | (type_ids == 5))
+        parts, part_pos = shapely.get_parts(geometries[keep], return_index=True)
+        rows = keep[part_pos]
+        
+        # Rang de chaque partie au sein de sa MultiLineString
+        first_part = np.searchsorted(rows, rows, side='left')
+        part_rank = np.arange(len(rows)) - first_part
+        
+        # Les parties vides sont ignorées
+        non_empty = shapely.get_num_coordinates(parts) > 0
+        parts, rows, part_rank = parts[non_empty], rows[non_empty], part_rank[non_empty]
+        
+        # Identifiants des arêtes : index de la ligne, suffixé du rang pour les MultiLineString
+        labels = self.network.index.to_numpy()[rows]
+        is_multi = type_ids[rows] == 5
+        ids = [f"{label}_{rank}" if multi else label
+               for label, rank, multi in zip(labels, part_rank, is_multi)]
+        
+        return parts, rows, ids
+    
+    @staticmethod
+    def _assign_node_ids(coords, snap_tolerance=None):
+        """Attribue un identifiant de nœud à chaque coordonnée avec un seul np.unique.
+        
+        Les identifiants suivent l'ordre de première apparition. Avec `snap_tolerance`,
+        les coordonnées sont d'abord arrondies sur une grille de ce pas.
+        """
+        if snap_tolerance:
+            keys = np.round(coords / snap_tolerance).astype(np.int64)
+        else:
+            keys = coords
+        _, first_idx, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        
+        # Renumérotation dans l'ordre de première apparition
+        order = np.argsort(first_idx, kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        return rank[inverse], coords[first_idx[order]]
+    
+    def _edge_columns(self, rows, parts):
+        """Rassemble en tableaux les attributs nécessaires au calcul des coûts de chaque partie."""
+        network = self.network
+        n = len(rows)
+        
+        # Types de surface conservés en Categorical jusqu'aux arêtes du graphe
+        if 'surface_type' in network:
+            surface = network['surface_type']
+            if not isinstance(surface.dtype, pd.CategoricalDtype):
+                surface = surface.astype('category')
+            surface_type = surface.array[rows]
+        else:
+            surface_type = pd.Categorical(np.full(n, 'chemin', dtype=object))
         
-        # Utiliser shapely pour calculer la longueur si elle n'est pas disponible
-        length_m = row.get('length_m', row.geometry.length)
+        # Longueur de la ligne si connue, sinon celle de la partie
+        if 'length_m' in network:
+            length_m = network['length_m'].to_numpy(dtype=np.float64)[rows]
+        else:
+            length_m = shapely.length(parts)
         
-        # Gestion de la pente
-        if 'slope_percent' in row and not pd.isna(row['slope_percent']):
-            slope_percent = row['slope_percent']
+        # Si pas de pente disponible, utiliser 0
+        if 'slope_percent' in network:
+            slope_percent = np.nan_to_num(network['slope_percent'].to_numpy(dtype=np.float64)[rows], nan=0.0)
         else:
-            # Si pas de pente disponible, utiliser 0
-            slope_percent = 0
-        
-        # Calculer les coûts de déplacement
-        costs = self.calculate_costs({
-            'length_m': length_m,
-            'slope_percent': slope_percent,
-            'surface_type': surface_type
-        })
-        
-        # Ajout de l'arête au graphe (sens aller)
-        self.graph.add_edge(
-            start_node, 
-            end_node, 
-            id=idx,
-            geometry=row.geometry,
-            surface_type=surface_type,
-            length_m=length_m,
-            slope_percent=slope_percent,
-            **costs['forward']
-        )
+            slope_percent = np.zeros(n)
         
-        # Ajout de l'arête dans l'autre sens (avec des coûts différents)
-        reverse_slope = -slope_percent
-        reverse_costs = self.calculate_costs({
-            'length_m': length_m,
-            'slope_percent': reverse_slope,
-            'surface_type': surface_type
-        })
-        
-        self.graph.add_edge(
-            end_node, 
-            start_node, 
-            id=f"{idx}_rev",
-            geometry=row.geometry,
-            surface_type=surface_type,
-            length_m=length_m,
-            slope_percent=reverse_slope,
-            **reverse_costs['forward']
-        )
+        # Profil altimétrique complet (D+, D-) s'il a été calculé par DataProcessor
+        profile = {column: network[column].to_numpy(dtype=np.float64)[rows]
+                   for column in self.PROFILE_COLUMNS if column in network}
+        
+        # Occupation du sol et traversées de cours d'eau, identiques dans les deux sens
+        land_cover = {column: network[column].to_numpy(dtype=np.float64)[rows]
+                      for column in land_cover_columns(network.columns)}
+        
+        return surface_type, length_m, slope_percent, profile, land_cover
     
-    def build_graph(self):
-        """Construit le graphe à partir du réseau."""
+    def _edge_attributes(self, ids, parts, surface_type, data):
+        """Construit les dictionnaires d'attributs des arêtes pour networkx."""
+        columns = {
+            'id': ids,
+            'geometry': parts,
+            'surface_type': surface_type,
+        }
+        columns.update({key: value.tolist() for key, value in data.items() if key not in self.PROFILE_COLUMNS})
+        names = list(columns)
+        attributes = [dict(zip(names, values)) for values in zip(*columns.values())]
+        
+        # Les valeurs de profil inconnues (NaN) ne sont pas stockées
+        for column in self.PROFILE_COLUMNS:
+            if column not in data:
+                continue
+            for attrs, value in zip(attributes, data[column].tolist()):
+                if not np.isnan(value):
+                    attrs[column] = value
+        
+        return attributes
+    
+    def _build_segments(self, snap_tolerance=None):
+        """Calcule en tableaux les nœuds, segments et coûts aller/retour du réseau."""
         if self.network is None:
             self.load_network()
         
         # Vérifiez les types de géométries dans le réseau
-        geom_types = self.network.geometry.type.value_counts()
-        print("Types de géométries dans le réseau :")
-        for geom_type, count in geom_types.items():
-            print(f"  - {geom_type}: {count}")
-        
-        # Dictionnaire pour stocker les nœuds {(x, y): node_id}
-        all_nodes = {}
-        node_counter = 0
-        
-        print("Construction des nœuds...")
-        for _, row in self.network.iterrows():
-            # Gérer à la fois LineString et MultiLineString
-            if row.geometry.type == 'LineString':
-                # Pour les LineString, traitement direct
-                start_point = row.geometry.coords[0]
-                end_point = row.geometry.coords[-1]
-                
-                # Ajouter les points comme nœuds
-                if start_point not in all_nodes:
-                    all_nodes[start_point] = node_counter
-                    self.graph.add_node(node_counter, x=start_point[0], y=start_point[1], point=Point(start_point))
-                    node_counter += 1
-                
-                if end_point not in all_nodes:
-                    all_nodes[end_point] = node_counter
-                    self.graph.add_node(node_counter, x=end_point[0], y=end_point[1], point=Point(end_point))
-                    node_counter += 1
-                    
-            elif row.geometry.type == 'MultiLineString':
-                # Pour les MultiLineString, traiter chaque LineString contenue
-                for line in row.geometry.geoms:
-                    if len(line.coords) > 0:
-                        start_point = line.coords[0]
-                        end_point = line.coords[-1]
-                        
-                        # Ajouter les points comme nœuds
-                        if start_point not in all_nodes:
-                            all_nodes[start_point] = node_counter
-                            self.graph.add_node(node_counter, x=start_point[0], y=start_point[1], point=Point(start_point))
-                            node_counter += 1
-                        
-                        if end_point not in all_nodes:
-                            all_nodes[end_point] = node_counter
-                            self.graph.add_node(node_counter, x=end_point[0], y=end_point[1], point=Point(end_point))
-                            node_counter += 1
-        
-        print(f"Nombre de nœuds créés : {node_counter}")
+        geom_types = self.network.geometry.geom_type.value_counts()
+        progress("Types de géométries dans le réseau :")
+        for geom_type, n_geometries in geom_types.items():
+            progress(f"  - {geom_type}: {n_geometries}")
+        
+        # Éclatement des MultiLineString en une seule passe
+        with span('explode_lines', rows=len(self.network)):
+            parts, rows, ids = self._explode_lines()
+        
+        progress("Construction des nœuds...")
+        with span('nodes', parts=len(parts)):
+            # Extrémités de chaque partie, entrelacées (début, fin) comme dans l'ordre de parcours
+            starts = shapely.get_coordinates(shapely.get_point(parts, 0))
+            ends = shapely.get_coordinates(shapely.get_point(parts, -1))
+            coords = np.empty((2 * len(parts), 2))
+            coords[0::2] = starts
+            coords[1::2] = ends
+            
+            node_ids, node_coords = self._assign_node_ids(coords, snap_tolerance)
+        count('nodes_built', len(node_coords))
+        progress(f"Nombre de nœuds créés : {len(node_coords)}")
+        
+        progress("Construction des arêtes...")
+        with span('edges', parts=len(parts)):
+            surface_type, length_m, slope_percent, profile, land_cover = self._edge_columns(rows, parts)
+        reverse_profile = {self.REVERSE_PROFILE_COLUMNS.get(key, key): value for key, value in profile.items()}
+        
+        # Coûts de toutes les arêtes, dans les deux sens, en un seul calcul vectorisé
+        with span('edge_costs', edges=2 * len(parts)):
+            forward_costs = self.calculate_costs_batch(length_m, slope_percent, surface_type,
+                                                       land_cover=land_cover, **self._cost_columns(profile))
+            reverse_costs = self.calculate_costs_batch(length_m, -slope_percent, surface_type,
+                                                       land_cover=land_cover, **self._cost_columns(reverse_profile))
+        
+        return {
+            'node_coords': node_coords,
+            'start_nodes': node_ids[0::2],
+            'end_nodes': node_ids[1::2],
+            'geometries': parts,
+            'ids': ids,
+            'surface_type': surface_type,
+            'forward': {'length_m': length_m, 'slope_percent': slope_percent, **profile, **land_cover,
+                        **forward_costs},
+            'reverse': {'length_m': length_m, 'slope_percent': -slope_percent, **reverse_profile, **land_cover,
+                        **reverse_costs},
+        }
+    
+    def build_graph(self, snap_tolerance=None):
+        """Construit le graphe à partir du réseau."""
+        segments = self._build_segments(snap_tolerance)
+        node_coords = segments['node_coords']
+        
+        points = shapely.points(node_coords)
+        self.graph.add_nodes_from(
+            (node, {'x': x, 'y': y, 'point': point})
+            for node, (x, y), point in zip(range(len(node_coords)), node_coords.tolist(), points)
+        )
         
         # Ajouter les arêtes
-        print("Construction des arêtes...")
-        edge_counter = 0
-        for idx, row in self.network.iterrows():
-            if row.geometry.type == 'LineString':
-                # Traitement direct pour LineString
-                start_point = row.geometry.coords[0]
-                end_point = row.geometry.coords[-1]
-                
-                if start_point in all_nodes and end_point in all_nodes:
-                    start_node = all_nodes[start_point]
-                    end_node = all_nodes[end_point]
-                    
-                    # Ajouter l'arête avec ses attributs
-                    self._add_edge_with_attributes(start_node, end_node, idx, row)
-                    edge_counter += 2  # +2 car on ajoute les arêtes dans les deux sens
-                
-            elif row.geometry.type == 'MultiLineString':
-                # Pour les MultiLineString, traiter chaque LineString contenue
-                for i, line in enumerate(row.geometry.geoms):
-                    if len(line.coords) > 0:
-                        start_point = line.coords[0]
-                        end_point = line.coords[-1]
-                        
-                        if start_point in all_nodes and end_point in all_nodes:
-                            start_node = all_nodes[start_point]
-                            end_node = all_nodes[end_point]
-                            
-                            # Créer un identifiant unique pour cette partie de MultiLineString
-                            sub_idx = f"{idx}_{i}"
-                            
-                            # Créer une copie des attributs avec la géométrie mise à jour
-                            line_row = row.copy()
-                            # Remplacer la géométrie MultiLineString par la LineString actuelle
-                            line_row.geometry = line
-                            
-                            # Ajouter l'arête avec ses attributs
-                            self._add_edge_with_attributes(start_node, end_node, sub_idx, line_row)
-                            edge_counter += 2
-        
-        print(f"Nombre d'arêtes créées : {edge_counter}")
+        ids, parts, surface_type = segments['ids'], segments['geometries'], segments['surface_type']
+        forward = self._edge_attributes(ids, parts, surface_type, segments['forward'])
+        reverse = self._edge_attributes([f"{idx}_rev" for idx in ids], parts, surface_type, segments['reverse'])
+        
+        # Aller puis retour pour chaque partie, comme lors d'un ajout arête par arête
+        def edges():
+            for u, v, fwd, rev in zip(segments['start_nodes'].tolist(), segments['end_nodes'].tolist(),
+                                      forward, reverse):
+                yield u, v, fwd
+                yield v, u, rev
+        
+        with span('networkx_edges', edges=2 * len(parts)):
+            self.graph.add_edges_from(edges())
+        count('edges_built', 2 * len(parts))
+        progress(f"Nombre d'arêtes créées : {2 * len(parts)}")
         
         return self.graph
     
+    def build_compact_graph(self, snap_tolerance=None):
+        """Construit directement le graphe compact (CSR), sans passer par networkx."""
+        segments = self._build_segments(snap_tolerance)
+        with span('csr', parts=len(segments['ids'])):
+            self.compact_graph = CompactGraph.from_segments(
+                segments['node_coords'], segments['start_nodes'], segments['end_nodes'],
+                segments['geometries'], segments['ids'], segments['forward'], segments['reverse'],
+                categories={'surface_type': segments['surface_type']}
+            )
+        count('edges_built', self.compact_graph.n_edges)
+        progress(f"Nombre d'arêtes créées : {self.compact_graph.n_edges}")
+        progress(f"Mémoire du graphe compact : {self.compact_graph.nbytes() / 1024 ** 2:.1f} Mo (hors géométries)")
+        return self.compact_graph
+    
+    def to_compact(self):
+        """Convertit le graphe networkx courant en graphe compact."""
+        self.compact_graph = CompactGraph.from_networkx(self.graph)
+        return self.compact_graph
+    
     def calculate_costs(self, segment):
         """Calcule les coûts de déplacement pour un segment."""
-        # Paramètres de base
-        length_m = segment['length_m']
-        slope = segment['slope_percent']
-        surface_type = segment['surface_type']
-        
-        # Vitesse de base selon le type de surface (km/h)
-        base_speeds = {
-            'sentier_balisé': 4.0,
-            'chemin': 3.5,
-            'piste': 5.0,
-            'route': 5.5,
-            'hors_sentier': 2.5,
-            'zone_rocheuse': 1.8,
-            'cours_eau': 0.8,
-        }
+        profile = {key: np.array([segment[key]], dtype=np.float64)
+                   for key in self.COST_PROFILE_COLUMNS if key in segment}
+        land_cover = {key: np.array([segment[key]], dtype=np.float64) for key in land_cover_columns(segment.keys())}
+        costs = self.calculate_costs_batch(np.array([segment['length_m']], dtype=np.float64),
+                                           np.array([segment['slope_percent']], dtype=np.float64),
+                                           np.array([segment['surface_type']], dtype=object),
+                                           land_cover=land_cover, **profile)
         
-        # Facteur de ralentissement selon la pente
-        if slope > 0:  # Montée
-            slope_factor = 1 - min(0.8, slope / 100)
-        else:  # Descente
-            slope_factor = 1 - min(0.4, abs(slope) / 100)
+        return {
+            'forward': {key: float(value[0]) for key, value in costs.items()}
+        }
+    
+    def _cost_columns(self, profile):
+        """Colonnes du profil altimétrique passées au modèle de coûts."""
+        return {key: value for key, value in profile.items() if key in self.COST_PROFILE_COLUMNS}
+    
+    def calculate_costs_batch(self, length_m, slope_percent, surface_type, ascent_m=None, descent_m=None,
+                              length_up_m=None, length_down_m=None, land_cover=None):
+        """Calcule les coûts de déplacement de tous les segments, pour tous les profils du modèle de coûts."""
+        return self.cost_model.compute(length_m, slope_percent, surface_type,
+                                       ascent_m=ascent_m, descent_m=descent_m,
+                                       length_up_m=length_up_m, length_down_m=length_down_m,
+                                       land_cover=land_cover)
+    
+    def update_costs(self, cost_model=None):
+        """Recalcule les colonnes de coûts du graphe compact sans reconstruire le graphe."""
+        if cost_model is not None:
+            self.cost_model = cost_model
+        if self.compact_graph is None:
+            raise ValueError("Le graphe compact n'est pas construit")
+        
+        graph = self.compact_graph
+        # Les colonnes de pente sont déjà orientées dans le sens de chaque arête
+        columns = {key: graph.edge_data[key] for key in self.COST_PROFILE_COLUMNS if key in graph.edge_data}
+        land_cover = {key: graph.edge_data[key] for key in land_cover_columns(graph.edge_data)}
+        costs = self.calculate_costs_batch(graph.edge_data['length_m'], graph.edge_data['slope_percent'],
+                                           graph.categorical('surface_type'), land_cover=land_cover, **columns)
+        for name, values in costs.items():
+            graph.edge_data[name] = values.astype(np.float32)
+        
+        return graph
+    
+    def save_graph(self, filename=None, format='binary'):
+        """Sauvegarde le graphe au format binaire (par défaut) ou GraphML."""
+        if format == 'graphml':
+            return self.export_graphml(filename)
+        if format != 'binary':
+            raise ValueError(f"Format de sauvegarde inconnu : {format}")
         
-        # Vitesse effective
-        speed = base_speeds.get(surface_type, 3.0) * slope_factor
+        if filename is None:
+            filename = self.processed_data_dir / "routing_graph"
+        else:
+            filename = Path(filename)
         
-        # Temps en secondes
-        time_s = length_m / 1000 / speed * 3600
+        # Le format binaire s'appuie sur le graphe compact
+        if self.compact_graph is None:
+            self.to_compact()
         
-        # Effort (formule simplifiée)
-        effort = time_s * (1 + abs(slope) / 20)
+        progress(f"Sauvegarde du graphe dans {filename}...")
+        with span('graph_write', path=filename.name):
+            self.compact_graph.save(filename, metadata=self._network_metadata())
+        # L'index d'accrochage est sauvegardé avec le graphe qu'il décrit
+        with span('snap_index_write'):
+            SnapIndex(self.compact_graph).save(filename)
+        progress(f"Graphe sauvegardé dans {filename}")
         
-        return {
-            'forward': {
-                'distance': length_m,
-                'time': time_s,
-                'effort': effort
-            }
-        }
+        return filename
     
-    def save_graph(self, filename=None):
-        """Sauvegarde le graphe au format GraphML."""
+    def _network_metadata(self):
+        """Décrit le réseau source pour détecter un graphe sauvegardé périmé."""
+        for name in ("network_with_elevation.gpkg", "unified_network.gpkg"):
+            network_path = self.processed_data_dir / name
+            if network_path.exists():
+                return {'network': str(network_path), 'network_mtime': network_path.stat().st_mtime}
+        return {}
+    
+    def export_graphml(self, filename=None):
+        """Sauvegarde le graphe au format GraphML (interopérabilité)."""
         if filename is None:
             filename = self.processed_data_dir / "routing_graph.graphml"
         else:
@@ -255,13 +387,58 @@ class GraphBuilder:
             save_graph.add_edge(u, v, **edge_attrs)
         
         # Sauvegarder le graphe nettoyé
-        print(f"Sauvegarde du graphe dans {filename}...")
-        nx.write_graphml(save_graph, filename)
-        print(f"Graphe sauvegardé dans {filename}")
+        progress(f"Sauvegarde du graphe dans {filename}...")
+        with span('graphml_write', path=filename.name):
+            nx.write_graphml(save_graph, filename)
+        progress(f"Graphe sauvegardé dans {filename}")
         
         return filename
     
+    def load_compact_graph(self, filename=None, mmap=True):
+        """Charge le graphe binaire sans le convertir : topologie mappée, géométries décodées à la demande."""
+        if filename is None:
+            filename = self.processed_data_dir / "routing_graph"
+        else:
+            filename = Path(filename)
+        
+        with span('graph_read', path=filename.name):
+            self.compact_graph = CompactGraph.load(filename, mmap=mmap)
+        
+        # Avertir si le réseau source a été modifié depuis la sauvegarde
+        metadata = self.compact_graph.metadata
+        current = self._network_metadata()
+        if metadata.get('network_mtime') and current.get('network_mtime', 0) > metadata['network_mtime']:
+            progress(f"Attention : le réseau {current['network']} est plus récent que le graphe {filename}")
+        
+        progress(f"Graphe chargé avec {self.compact_graph.n_nodes} nœuds et {self.compact_graph.n_edges} arêtes")
+        return self.compact_graph
+    
+    def load_snap_index(self, filename=None):
+        """Charge l'index d'accrochage sauvegardé avec le graphe binaire (reconstruit s'il manque)."""
+        if filename is None:
+            filename = self.processed_data_dir / "routing_graph"
+        
+        if self.compact_graph is None:
+            self.load_compact_graph(filename)
+        
+        return SnapIndex.load(filename, self.compact_graph)
+    
     def load_graph(self, filename=None):
+        """Charge le graphe (binaire, ou GraphML selon l'extension) sous forme de nx.DiGraph."""
+        if filename is None:
+            filename = self.processed_data_dir / "routing_graph"
+            if not filename.exists():
+                filename = self.processed_data_dir / "routing_graph.graphml"
+        else:
+            filename = Path(filename)
+        
+        if filename.suffix == '.graphml':
+            return self.import_graphml(filename)
+        
+        self.graph = self.load_compact_graph(filename).to_networkx()
+        return self.graph
+    
+    def import_graphml(self, filename=None):
         """Charge un graphe à partir d'un fichier GraphML et reconvertit les WKT en objets Shapely."""
         if filename is None:
             filename = self.processed_data_dir / "routing_graph.graphml"
@@ -272,8 +449,9 @@ class GraphBuilder:
             raise FileNotFoundError(f"Le fichier {filename} n'existe pas")
         
         # Charger le graphe
-        print(f"Chargement du graphe depuis {filename}...")
-        loaded_graph = nx.read_graphml(filename)
+        progress(f"Chargement du graphe depuis {filename}...")
+        with span('graphml_read', path=filename.name):
+            loaded_graph = nx.read_graphml(filename)
         
         # Créer un nouveau graphe avec objets Shapely reconstitués
         self.graph = nx.DiGraph()
@@ -306,34 +484,26 @@ class GraphBuilder:
             
             self.graph.add_edge(u, v, **edge_attrs)
         
-        print(f"Graphe chargé avec {len(self.graph.nodes())} nœuds et {len(self.graph.edges())} arêtes")
+        progress(f"Graphe chargé avec {len(self.graph.nodes())} nœuds et {len(self.graph.edges())} arêtes")
         return self.graph
     
-    def visualize_sample(self, radius=30, output_file=None):
-        """Visualise un échantillon du graphe."""
-        if not self.graph:
-            raise ValueError("Le graphe n'est pas construit")
-        
-        # Extraire un sous-graphe centré sur un nœud aléatoire
-        center_node = list(self.graph.nodes())[0]
-        subgraph = nx.ego_graph(self.graph, center_node, radius=radius)
-        
-        # Construire un dictionnaire des positions
-        pos = {n: (float(self.graph.nodes[n]['x']), float(self.graph.nodes[n]['y'])) 
-               for n in subgraph.nodes()}
-        
-        # Visualiser le sous-graphe
-        plt.figure(figsize=(12, 10))
-        nx.draw(subgraph, pos, with_labels=False, 
-                node_size=10, node_color='blue', 
-                edge_color='gray', width=1.0, alpha=0.7)
-        
-        # Ajouter un titre
-        plt.title(f"Échantillon du graphe (rayon={radius} nœuds)", fontsize=14)
-        
-        # Sauvegarder ou afficher
-        if output_file:
-            plt.savefig(output_file, dpi=300, bbox_inches='tight')
-            print(f"Visualisation sauvegardée dans {output_file}")
-        else:
-            plt.show()
\ No newline at end of file
+    def visualize(self, output_file=None, bounds=None, color_by='surface_type', width=4096):
+        """Dessine le réseau complet (ou l'emprise `bounds`) coloré par type de surface, pente ou coût.
+        
+        Rendu rastérisé directement depuis les tableaux du graphe compact (voir rendering.py) ;
+        sans fichier de sortie, l'image est affichée.
+        """
+        if self.compact_graph is None:
+            if self.graph:
+                self.to_compact()
+            else:
+                self.load_compact_graph()
+        
+        renderer = NetworkRenderer(self.compact_graph, color_by=color_by)
+        image = renderer.render(output_file, bounds=bounds, width=width, background='white')
+        if not output_file:
+            plt.figure(figsize=(12, 10))
+            plt.imshow(image)
+            plt.axis('off')
+            plt.show()
+        return image
\ No newline at end of file
@@ -0,0 +1,350 @@
+# rando_sim/instrumentation.py
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+REPORT_VERSION = 1
+# Période d'échantillonnage de la mémoire résidente pendant un enregistrement
+RSS_SAMPLE_S = 0.05
+# Nombre de fonctions (cProfile) et de lignes d'allocation (tracemalloc) gardées dans le rapport
+PROFILE_TOP = 25
+TRACEMALLOC_TOP = 10
+
+# Enregistrement en cours (None : instrumentation désactivée, chaque appel est un simple test)
+_recorder = None
+
+
+def current_rss():
+    """Mémoire résidente actuelle du processus, en octets (Linux : /proc, sinon pic depuis le démarrage)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+        scale = 1 if platform.system() == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class _NullSpan:
+    """Intervalle sans effet, renvoyé quand l'instrumentation est désactivée."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Intervalle mesuré : durée, temps CPU, pic de mémoire résidente, compteurs et sous-intervalles.
+
+    Le temps CPU est celui du processus (tous threads confondus) : un écart important entre
+    durée et temps CPU signale une étape limitée par les entrées / sorties.
+    """
+
+    def __init__(self, recorder, name, attrs):
+        self.recorder = recorder
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.children = []
+        self.counters = {}
+        self.started = self.cpu_started = None
+        self.seconds = self.cpu_seconds = None
+        self.rss_start = self.peak_rss = 0
+        self.profile = None
+        self.memory = None
+        self._profiler = None
+        self._tracing = False
+
+    def __enter__(self):
+        self.recorder._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.attrs['error'] = f"{exc_type.__name__}: {exc}"
+        self.recorder._exit(self)
+        return False
+
+    def set(self, **attrs):
+        """Ajoute des attributs à l'intervalle (nombre de lignes, fichier, statut...)."""
+        self.attrs.update(attrs)
+
+    def count(self, name, n=1):
+        self.recorder._count(self, name, n)
+
+    def to_dict(self, origin):
+        result = {
+            'name': self.name,
+            'start_s': self.started - origin if self.started is not None else None,
+            'seconds': self.seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_mb': self.peak_rss / 1024 ** 2,
+            'rss_delta_mb': (self.peak_rss - self.rss_start) / 1024 ** 2,
+        }
+        if self.attrs:
+            result['attrs'] = self.attrs
+        if self.counters:
+            result['counters'] = self.counters
+        if self.profile is not None:
+            result['profile'] = self.profile
+        if self.memory is not None:
+            result['memory'] = self.memory
+        if self.children:
+            result['children'] = [child.to_dict(origin) for child in self.children]
+        return result
+
+
+class Recorder:
+    """Enregistrement d'un passage : arbre d'intervalles, compteurs, messages de progression.
+
+    Les intervalles nommés dans `profile` sont profilés avec cProfile (thread qui les ouvre
+    uniquement, un seul à la fois), ceux de `trace_memory` avec tracemalloc (coûteux : à
+    réserver au diagnostic). Les profils .prof sont écrits dans `output_dir` s'il est fourni.
+    """
+
+    def __init__(self, profile=(), trace_memory=(), output_dir=None, sample_interval=RSS_SAMPLE_S):
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.sample_interval = sample_interval
+        self.root = Span(self, 'run', {})
+        self.counters = {}
+        self.events = []
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._stacks = {}
+        self._main = None
+        self._open = {}
+        self._profiling = False
+        self._stop = threading.Event()
+        self._sampler = None
+
+    # --- Cycle de vie ------------------------------------------------------------------
+
+    def start(self):
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._main = threading.get_ident()
+        self._enter(self.root)
+        if self.sample_interval:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.root.seconds is None:
+            self._exit(self.root)
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            rss = current_rss()
+            # Les intervalles ouverts sont emboîtés : chacun voit le pic de ses sous-intervalles
+            for span in list(self._open.values()):
+                if rss > span.peak_rss:
+                    span.peak_rss = rss
+
+    # --- Intervalles et compteurs ------------------------------------------------------
+
+    def _stack(self):
+        return self._stacks.setdefault(threading.get_ident(), [])
+
+    def current(self):
+        """Intervalle ouvert le plus interne du thread courant (à défaut, celui du thread principal)."""
+        stack = self._stacks.get(threading.get_ident())
+        if stack:
+            return stack[-1]
+        stack = self._stacks.get(self._main)
+        return stack[-1] if stack else self.root
+
+    def _enter(self, span):
+        stack = self._stack()
+        if span is not self.root:
+            # Un thread de travail rattache ses intervalles à l'intervalle courant du thread principal
+            span.parent = self.current()
+            with self._lock:
+                span.parent.children.append(span)
+        stack.append(span)
+        span.rss_start = span.peak_rss = current_rss()
+        self._open[id(span)] = span
+
+        if span.name in self.profile and not self._profiling:
+            self._profiling = True
+            span._profiler = cProfile.Profile()
+        if span.name in self.trace_memory:
+            span._tracing = not tracemalloc.is_tracing()
+            if span._tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        span.started = time.perf_counter()
+        span.cpu_started = time.process_time()
+        if span._profiler is not None:
+            span._profiler.enable()
+
+    def _exit(self, span):
+        if span._profiler is not None:
+            span._profiler.disable()
+        span.seconds = time.perf_counter() - span.started
+        span.cpu_seconds = time.process_time() - span.cpu_started
+        span.peak_rss = max(span.peak_rss, current_rss())
+        self._open.pop(id(span), None)
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        # Pic propagé aux intervalles englobants (entre deux échantillons)
+        parent = span.parent
+        while parent is not None:
+            parent.peak_rss = max(parent.peak_rss, span.peak_rss)
+            parent = parent.parent
+
+        if span._profiler is not None:
+            span.profile = self._profile_summary(span)
+            span._profiler = None
+            self._profiling = False
+        if span.name in self.trace_memory and tracemalloc.is_tracing():
+            span.memory = self._memory_summary()
+            if span._tracing:
+                tracemalloc.stop()
+
+    def _count(self, span, name, n):
+        # Compteurs cumulés : un intervalle inclut ceux de ses sous-intervalles
+        with self._lock:
+            while span is not None:
+                span.counters[name] = span.counters.get(name, 0) + n
+                span = span.parent
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _profile_summary(self, span):
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            span._profiler.dump_stats(self.output_dir / f"{span.name}.prof")
+        stats = pstats.Stats(span._profiler).stats
+        # (fichier, ligne, fonction) -> (appels primitifs, appels, temps propre, temps cumulé, appelants)
+        top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        return [{'function': f"{Path(filename).name}:{line}({function})", 'calls': calls,
+                 'own_s': own, 'cumulative_s': cumulative}
+                for (filename, line, function), (_, calls, own, cumulative, _) in top]
+
+    @staticmethod
+    def _memory_summary():
+        current, peak = tracemalloc.get_traced_memory()
+        # Allocations encore présentes en fin d'intervalle, par ligne de code
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:TRACEMALLOC_TOP]
+        return {
+            'traced_peak_mb': peak / 1024 ** 2,
+            'traced_current_mb': current / 1024 ** 2,
+            'top': [{'location': str(stat.traceback[0]), 'size_mb': stat.size / 1024 ** 2, 'count': stat.count}
+                    for stat in statistics],
+        }
+
+    # --- Rapport -----------------------------------------------------------------------
+
+    def report(self):
+        """Rapport du passage (dictionnaire sérialisable en JSON)."""
+        origin = self.root.started
+        return {
+            'version': REPORT_VERSION,
+            'started': self.started_at,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seconds': self.root.seconds if self.root.seconds is not None else time.perf_counter() - origin,
+            'peak_rss_mb': self.root.peak_rss / 1024 ** 2,
+            'counters': dict(self.counters),
+            'spans': [child.to_dict(origin) for child in self.root.children],
+            'events': list(self.events),
+        }
+
+    def save(self, path):
+        path = Path(path)
+        os.makedirs(path.parent, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return path
+
+    def summary(self, max_depth=2):
+        """Tableau texte des intervalles (durée, CPU, pic de mémoire) et des compteurs."""
+        lines = [f"{'intervalle':<34}{'durée':>9}{'CPU':>9}{'pic RSS':>10}"]
+
+        def walk(span, depth):
+            label = f"{'  ' * depth}{span.name}"
+            lines.append(f"{label:<34}{span.seconds or 0.0:8.2f}s{span.cpu_seconds or 0.0:8.2f}s"
+                         f"{span.peak_rss / 1024 ** 2:7.0f} Mo")
+            if depth < max_depth:
+                for child in span.children:
+                    walk(child, depth + 1)
+
+        for child in self.root.children:
+            walk(child, 0)
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name} : {value}")
+        return "\n".join(lines)
+
+
+# --- Interface du module : sans effet hors d'un enregistrement -------------------------
+
+def enabled():
+    return _recorder is not None
+
+
+def span(name, **attrs):
+    """Intervalle mesuré, à utiliser avec `with` ; sans coût notable hors enregistrement."""
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, name, attrs)
+
+
+def count(name, n=1):
+    """Incrémente un compteur de l'intervalle courant (et du total du passage)."""
+    if _recorder is not None:
+        _recorder._count(_recorder.current(), name, n)
+
+
+def progress(message):
+    """Message de progression : affiché, et horodaté dans le rapport pendant un enregistrement."""
+    print(message)
+    if _recorder is not None:
+        _recorder.events.append({'t': time.perf_counter() - _recorder.root.started,
+                                 'span': _recorder.current().name, 'message': message})
+
+
+@contextlib.contextmanager
+def record(profile=(), trace_memory=(), output_dir=None, sample_interval=RSS_SAMPLE_S):
+    """Active l'instrumentation le temps d'un bloc et renvoie l'enregistrement.
+
+        with instrumentation.record(profile=['graph']) as run:
+            pipeline.run()
+        run.save("run_report.json")
+    """
+    global _recorder
+    previous = _recorder
+    recorder = Recorder(profile=profile, trace_memory=trace_memory, output_dir=output_dir,
+                        sample_interval=sample_interval).start()
+    _recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _recorder = previous
+        recorder.stop()
@@ -0,0 +1,117 @@
+# rando_sim/isochrone.py
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.ops import substring
+
+from routing import Router
+
+
+class IsochroneBuilder:
+    """Calcule les zones atteignables depuis une ou plusieurs origines, pour plusieurs seuils à la fois."""
+
+    def __init__(self, graph, router=None, crs='EPSG:2154'):
+        self.graph = graph
+        self.router = router or Router(graph)
+        self.crs = crs
+
+    def node_costs(self, origins, max_cost, weight='time'):
+        """Coût minimal depuis l'origine la plus proche pour chaque nœud (inf si hors d'atteinte).
+
+        Une seule recherche multi-sources, arrêtée au-delà de `max_cost`.
+        """
+        settled, _ = self.router.dijkstra(origins, weight=weight, cutoff=max_cost)
+        costs = np.full(self.graph.n_nodes, np.inf)
+        if settled:
+            nodes = np.fromiter(settled.keys(), dtype=np.int64, count=len(settled))
+            costs[nodes] = np.fromiter(settled.values(), dtype=np.float64, count=len(settled))
+        return costs
+
+    def edge_reach(self, costs, threshold, weight='time'):
+        """Part de chaque arête parcourable sous le seuil (0 : pas atteinte, 1 : entièrement)."""
+        start_cost = costs[self.graph.sources]
+        edge_cost = self.graph.edge_data[weight].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reach = np.where(edge_cost > 0, (threshold - start_cost) / edge_cost, 1.0)
+        reach = np.where(np.isfinite(start_cost) & (start_cost <= threshold), reach, 0.0)
+        return np.clip(np.nan_to_num(reach, nan=0.0), 0.0, 1.0)
+
+    def _reached_lines(self, reach, dedupe=False):
+        """Portions de géométrie effectivement atteintes (sous-segments pour les arêtes du front).
+
+        Avec `dedupe`, un segment entièrement atteint dans les deux sens n'est gardé qu'une fois.
+        """
+        edges = np.flatnonzero(reach > 0)
+        if dedupe:
+            full = edges[reach[edges] >= 1]
+            _, first = np.unique(self.graph.segment_ids[full], return_index=True)
+            edges = np.sort(np.concatenate([full[first], edges[reach[edges] < 1]]))
+        geometries = np.array([self.graph.geometry(edge) for edge in edges.tolist()], dtype=object)
+        partial = np.flatnonzero(reach[edges] < 1)
+        for i in partial.tolist():
+            edge = int(edges[i])
+            fraction = float(reach[edge])
+            if geometries[i] is None:
+                continue
+            # La portion atteinte part du nœud de départ de l'arête
+            if self.graph.edge_reversed[edge]:
+                geometries[i] = substring(geometries[i], 1 - fraction, 1, normalized=True)
+            else:
+                geometries[i] = substring(geometries[i], 0, fraction, normalized=True)
+        present = ~shapely.is_missing(geometries)
+        return edges[present], geometries[present]
+
+    @staticmethod
+    def _footprint(lines, footprint, buffer_distance, concave_ratio):
+        """Emprise polygonale des portions atteintes."""
+        if len(lines) == 0:
+            return shapely.Polygon()
+        if footprint == 'buffer':
+            # Tampons vectorisés (peu de segments d'arc) puis union en cascade
+            return shapely.union_all(shapely.buffer(lines, buffer_distance, quad_segs=4))
+        points = shapely.multipoints(shapely.get_coordinates(lines))
+        if footprint == 'concave':
+            return shapely.concave_hull(points, ratio=concave_ratio)
+        if footprint == 'convex':
+            return shapely.convex_hull(points)
+        raise ValueError(f"Type d'emprise inconnu : {footprint}")
+
+    def compute(self, origins, thresholds, weight='time', footprint='buffer', buffer_distance=50.0,
+                concave_ratio=0.3):
+        """Calcule les isochrones pour tous les seuils en une seule recherche.
+
+        Renvoie un GeoDataFrame (une ligne par seuil, du plus grand au plus petit) avec le
+        nombre de nœuds et d'arêtes atteints et l'emprise polygonale.
+        """
+        thresholds = sorted(thresholds, reverse=True)
+        costs = self.node_costs(origins, thresholds[0], weight)
+
+        rows = []
+        for threshold in thresholds:
+            reach = self.edge_reach(costs, threshold, weight)
+            _, lines = self._reached_lines(reach, dedupe=True)
+            rows.append({
+                'threshold': threshold,
+                'weight': weight,
+                'n_nodes': int(np.count_nonzero(costs <= threshold)),
+                'n_edges': int(np.count_nonzero(reach > 0)),
+                'geometry': self._footprint(lines, footprint, buffer_distance, concave_ratio),
+            })
+
+        return gpd.GeoDataFrame(rows, geometry='geometry', crs=self.crs)
+
+    def reachable_nodes(self, origins, threshold, weight='time'):
+        """Nœuds atteints sous le seuil, avec leur coût et leurs coordonnées."""
+        costs = self.node_costs(origins, threshold, weight)
+        nodes = np.flatnonzero(costs <= threshold)
+        return gpd.GeoDataFrame({'node': nodes, 'cost': costs[nodes]},
+                                geometry=shapely.points(self.graph.x[nodes], self.graph.y[nodes]),
+                                crs=self.crs)
+
+    def reachable_edges(self, origins, threshold, weight='time'):
+        """Arêtes (ou portions d'arêtes) atteintes sous le seuil."""
+        costs = self.node_costs(origins, threshold, weight)
+        reach = self.edge_reach(costs, threshold, weight)
+        edges, lines = self._reached_lines(reach)
+        return gpd.GeoDataFrame({'edge': edges, 'reach': reach[edges]},
+                                geometry=lines, crs=self.crs)
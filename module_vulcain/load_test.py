@@ -0,0 +1,147 @@
+# rando_sim/load_test.py
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from service import DEFAULT_HOST, DEFAULT_PORT, RoutingService
+
+# Répartition des requêtes générées (le reste : /route)
+ISOCHRONE_SHARE = 0.05
+SNAP_SHARE = 0.15
+
+
+async def _request(connection, host, path, body=None):
+    """Envoie une requête HTTP/1.1 sur une connexion persistante ; renvoie (statut, corps)."""
+    reader, writer = connection
+    method = 'POST' if body is not None else 'GET'
+    data = body.encode('utf-8') if body is not None else b''
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(data)}\r\n"
+                  f"Content-Type: application/geo+json\r\n\r\n").encode('latin-1') + data)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def _requests(bounds, n_requests, distinct_points, seed):
+    """Requêtes aléatoires dans l'emprise, tirées d'un jeu restreint de points (pour solliciter le cache)."""
+    rng = np.random.default_rng(seed)
+    lon0, lat0, lon1, lat1 = bounds
+    pool = np.column_stack([rng.uniform(lon0, lon1, distinct_points), rng.uniform(lat0, lat1, distinct_points)])
+
+    def point():
+        lon, lat = pool[rng.integers(distinct_points)]
+        return f"{lon:.6f},{lat:.6f}"
+
+    paths = []
+    for kind in rng.random(n_requests):
+        if kind < ISOCHRONE_SHARE:
+            paths.append(f"/isochrone?at={point()}&thresholds=300,600")
+        elif kind < ISOCHRONE_SHARE + SNAP_SHARE:
+            paths.append(f"/snap?points={point()};{point()}")
+        else:
+            paths.append(f"/route?from={point()}&to={point()}")
+    return paths
+
+
+async def run_load_test(host=DEFAULT_HOST, port=DEFAULT_PORT, n_requests=1000, concurrency=16,
+                        distinct_points=200, seed=0, bounds=None):
+    """Envoie `n_requests` requêtes sur `concurrency` connexions simultanées et mesure les latences.
+
+    Renvoie un dictionnaire : débit, latences p50 / p90 / p99 / max (ms), statuts, et
+    l'évolution des compteurs du service (cache, regroupements).
+    """
+    control = await asyncio.open_connection(host, port)
+    _, body = await _request(control, host, '/stats')
+    before = json.loads(body)
+    paths = _requests(bounds or before['bounds'], n_requests, distinct_points, seed)
+
+    latencies = np.zeros(n_requests)
+    statuses = {}
+    queue = iter(range(n_requests))
+
+    async def client():
+        connection = await asyncio.open_connection(host, port)
+        try:
+            for i in queue:
+                started = time.perf_counter()
+                status, _ = await _request(connection, host, paths[i])
+                latencies[i] = time.perf_counter() - started
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            connection[1].close()
+            await connection[1].wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    _, body = await _request(control, host, '/stats')
+    after = json.loads(body)
+    control[1].close()
+    await control[1].wait_closed()
+
+    report = {
+        'n_requests': n_requests,
+        'concurrency': concurrency,
+        'elapsed_s': elapsed,
+        'throughput_rps': n_requests / elapsed,
+        'latency_ms_p50': float(np.percentile(latencies, 50) * 1000),
+        'latency_ms_p90': float(np.percentile(latencies, 90) * 1000),
+        'latency_ms_p99': float(np.percentile(latencies, 99) * 1000),
+        'latency_ms_max': float(latencies.max() * 1000),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'service': {name: after[name] - before[name]
+                    for name in ('cache_hits', 'coalesced', 'computed', 'snap_batches', 'snapped_points')},
+    }
+    print(f"{n_requests} requêtes ({concurrency} connexions) en {elapsed:.1f} s : "
+          f"{report['throughput_rps']:.0f} req/s, p50 {report['latency_ms_p50']:.1f} ms, "
+          f"p99 {report['latency_ms_p99']:.1f} ms, statuts {report['statuses']}")
+    print(f"  service : {report['service']}")
+    return report
+
+
+async def _main(args):
+    service = server = None
+    if args.graph:
+        # Service lancé dans le même processus, sur un port libre
+        service = RoutingService(args.graph, workers=args.workers, executor=args.executor)
+        server = await service.start(args.host, 0)
+        args.port = service.address[1]
+    try:
+        report = await run_load_test(args.host, args.port, args.requests, args.concurrency,
+                                     args.distinct_points, args.seed)
+    finally:
+        if server is not None:
+            server.close()
+            service.close()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge du service d'itinéraires (localhost)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--graph', help="Répertoire d'un graphe binaire : lance le service dans ce processus")
+    parser.add_argument('--executor', choices=('process', 'thread'), default='process')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--distinct-points', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Fichier JSON du rapport")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,153 @@
+# rando_sim/matrix.py
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instrumentation import progress
+from routing import Router, dijkstra
+
+# État de chaque processus de calcul : tableaux du graphe attachés en mémoire partagée
+_WORKER_STATE = {}
+
+
+class SharedGraphArrays:
+    """Copie unique des tableaux du graphe en mémoire partagée, relue sans copie par les processus.
+
+    Seuls les noms des blocs, formes et types sont transmis aux processus : le graphe
+    lui-même n'est jamais sérialisé.
+    """
+
+    def __init__(self, graph, weights):
+        self.blocks = []
+        self.spec = {}
+        arrays = {'offsets': graph.offsets, 'targets': graph.targets}
+        arrays.update({f"weight_{name}": graph.edge_data[name] for name in weights})
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """Libère les blocs de mémoire partagée."""
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach_worker(spec):
+    """Initialisation d'un processus : attache les blocs partagés, lus sur place par Dijkstra."""
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        # memoryview : accès élément par élément rapide, sans copie privée des tableaux dans chaque processus
+        arrays[name] = memoryview(np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+
+    _WORKER_STATE['blocks'] = blocks
+    _WORKER_STATE['offsets'] = arrays['offsets']
+    _WORKER_STATE['targets'] = arrays['targets']
+    _WORKER_STATE['weights'] = {name[len('weight_'):]: array
+                                for name, array in arrays.items() if name.startswith('weight_')}
+
+
+def _matrix_rows(origins, destinations, weight, cutoff):
+    """Calcule les lignes de la matrice pour un lot d'origines (exécuté dans un processus)."""
+    offsets, targets = _WORKER_STATE['offsets'], _WORKER_STATE['targets']
+    weights = _WORKER_STATE['weights'][weight]
+    return _rows(offsets, targets, weights, origins, destinations, cutoff)
+
+
+def _rows(offsets, targets, weights, origins, destinations, cutoff):
+    """Une recherche bornée par origine, arrêtée dès que toutes les destinations sont fixées."""
+    rows = np.full((len(origins), len(destinations)), np.inf)
+    for i, origin in enumerate(origins):
+        settled, _ = dijkstra(offsets, targets, weights, [origin], cutoff=cutoff, stop_at=destinations)
+        rows[i] = [settled.get(destination, math.inf) for destination in destinations]
+    return rows
+
+
+class MatrixResult:
+    """Matrices origines × destinations par poids, avec reconstruction des chemins à la demande."""
+
+    def __init__(self, graph, origins, destinations, matrices, router=None):
+        self.graph = graph
+        self.origins = origins
+        self.destinations = destinations
+        self.matrices = matrices
+        self._router = router
+
+    def __getitem__(self, weight):
+        return self.matrices[weight]
+
+    def path(self, i, j, weight='time'):
+        """Itinéraire de l'origine i vers la destination j (recalculé par A*, même coût optimal)."""
+        if self._router is None:
+            self._router = Router(self.graph)
+        return self._router.astar(self.origins[i], self.destinations[j], weight)
+
+
+class TravelMatrixBuilder:
+    """Matrices de coûts many-to-many calculées en parallèle sur plusieurs cœurs."""
+
+    def __init__(self, graph, workers=None, chunk_size=8):
+        self.graph = graph
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def compute(self, origins, destinations, weights=('time', 'effort'), cutoff=None, workers=None):
+        """Calcule une matrice dense (float64, inf si injoignable) par poids.
+
+        Chaque poids est optimisé séparément : la matrice d'effort donne l'effort minimal,
+        pas l'effort du chemin le plus rapide.
+        """
+        origins = [int(node) for node in origins]
+        destinations = [int(node) for node in destinations]
+        workers = workers or self.workers
+        matrices = {}
+
+        if workers <= 1:
+            router = Router(self.graph)
+            for weight in weights:
+                matrices[weight] = _rows(router._offsets, router._targets, router.weights(weight),
+                                         origins, destinations, cutoff)
+            return MatrixResult(self.graph, origins, destinations, matrices, router)
+
+        chunks = [origins[start:start + self.chunk_size] for start in range(0, len(origins), self.chunk_size)]
+        with SharedGraphArrays(self.graph, weights) as shared:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                     initargs=(shared.spec,)) as executor:
+                futures = {weight: [executor.submit(_matrix_rows, chunk, destinations, weight, cutoff)
+                                    for chunk in chunks]
+                           for weight in weights}
+                for weight, weight_futures in futures.items():
+                    rows = [future.result() for future in weight_futures]
+                    matrices[weight] = np.vstack(rows) if rows else np.zeros((0, len(destinations)))
+
+        return MatrixResult(self.graph, origins, destinations, matrices)
+
+    def benchmark_scaling(self, origins, destinations, weights=('time',), worker_counts=(1, 2, 4, 8)):
+        """Mesure le temps de calcul et l'accélération selon le nombre de processus."""
+        results = []
+        reference = None
+        for workers in worker_counts:
+            started = time.perf_counter()
+            self.compute(origins, destinations, weights=weights, workers=workers)
+            elapsed = time.perf_counter() - started
+            reference = reference or elapsed
+            results.append({'workers': workers, 'seconds': elapsed, 'speedup': reference / elapsed})
+            progress(f"  {workers} processus : {elapsed:.2f} s (x{reference / elapsed:.1f})")
+        return results
@@ -0,0 +1,234 @@
+# rando_sim/mnt_index.py
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import shapely
+
+from instrumentation import count, progress, span
+
+# Mots-clés de l'en-tête d'un fichier ASCII Grid (ESRI)
+ASC_HEADER_KEYS = ('ncols', 'nrows', 'xllcorner', 'yllcorner', 'xllcenter', 'yllcenter',
+                   'cellsize', 'dx', 'dy', 'nodata_value')
+
+
+def read_asc_header(path):
+    """Lit uniquement l'en-tête d'une dalle RGEALTI .asc et renvoie son emprise et sa résolution."""
+    header = {}
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 2 or parts[0].lower() not in ASC_HEADER_KEYS:
+                break
+            header[parts[0].lower()] = float(parts[1])
+
+    ncols, nrows = int(header['ncols']), int(header['nrows'])
+    xres = header.get('cellsize', header.get('dx'))
+    yres = header.get('cellsize', header.get('dy'))
+
+    # Le coin inférieur gauche peut être donné par le coin ou par le centre du pixel
+    if 'xllcorner' in header:
+        left, bottom = header['xllcorner'], header['yllcorner']
+    else:
+        left, bottom = header['xllcenter'] - xres / 2, header['yllcenter'] - yres / 2
+
+    return {
+        'width': ncols,
+        'height': nrows,
+        'res': [xres, yres],
+        'bounds': [left, bottom, left + ncols * xres, bottom + nrows * yres],
+        'nodata': header.get('nodata_value'),
+    }
+
+
+class DEMTile:
+    """Dalle MNT décodée : tableau d'altitudes et géoréférencement minimal."""
+
+    def __init__(self, data, left, top, xres, yres, nodata):
+        self.data = data
+        self.left = left
+        self.top = top
+        self.xres = xres
+        self.yres = yres
+        self.nodata = nodata
+
+    @property
+    def height(self):
+        return self.data.shape[0]
+
+    @property
+    def width(self):
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class MNTTileIndex:
+    """Index persistant des dalles RGEALTI avec recherche spatiale et cache LRU des dalles décodées."""
+
+    def __init__(self, records=None, index_path=None, cache_dir=None, max_cache_bytes=512 * 1024 ** 2):
+        self.records = list(records or [])
+        self.index_path = Path(index_path) if index_path else None
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_cache_bytes = max_cache_bytes
+
+        self._tree = None
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """Crée un index à partir de métadonnées existantes (par ex. mnt_metadata.json)."""
+        return cls(records, **kwargs)
+
+    @classmethod
+    def load(cls, index_path, **kwargs):
+        """Charge un index sauvegardé, ou un index vide si le fichier n'existe pas."""
+        index_path = Path(index_path)
+        records = []
+        if index_path.exists():
+            with open(index_path, 'r') as f:
+                records = json.load(f)
+        return cls(records, index_path=index_path, **kwargs)
+
+    def save(self, index_path=None):
+        """Sauvegarde l'index au format JSON."""
+        index_path = Path(index_path) if index_path else self.index_path
+        if index_path is None:
+            raise ValueError("Aucun chemin de sauvegarde pour l'index MNT")
+        with open(index_path, 'w') as f:
+            json.dump(self.records, f)
+        return index_path
+
+    def refresh(self, mnt_dir, pattern="**/RGEALTI*.asc", workers=8):
+        """Met à jour l'index : seuls les fichiers nouveaux ou modifiés (mtime/taille) sont relus."""
+        known = {record['path']: record for record in self.records}
+
+        files = sorted(Path(mnt_dir).glob(pattern))
+        up_to_date = []
+        to_parse = []
+        for path in files:
+            stat = path.stat()
+            record = known.get(str(path))
+            if record and record.get('mtime') == stat.st_mtime and record.get('size') == stat.st_size:
+                up_to_date.append(record)
+            else:
+                to_parse.append((path, stat))
+
+        # Lecture parallèle des en-têtes (quelques lignes par fichier)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            headers = list(executor.map(read_asc_header, [path for path, _ in to_parse]))
+
+        parsed = []
+        for (path, stat), header in zip(to_parse, headers):
+            parsed.append({
+                'path': str(path),
+                'crs': 'EPSG:2154',
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                **header,
+            })
+
+        # Les fichiers disparus sont retirés, l'ordre reste celui du disque
+        by_path = {record['path']: record for record in up_to_date + parsed}
+        self.records = [by_path[str(path)] for path in files]
+        self._tree = None
+        self.clear_cache()
+
+        progress(f"Index MNT : {len(files)} dalles, {len(parsed)} (re)lues, {len(up_to_date)} inchangées")
+        return self
+
+    @property
+    def tree(self):
+        """R-tree (STRtree) des emprises de dalles, construit à la demande."""
+        if self._tree is None:
+            bounds = np.array([record['bounds'] for record in self.records], dtype=np.float64).reshape(-1, 4)
+            self._tree = shapely.STRtree(shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]))
+        return self._tree
+
+    def query_points(self, xs, ys):
+        """Renvoie les couples (indices des points, indices des dalles) des dalles contenant chaque point."""
+        points = shapely.points(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+        point_idx, tile_idx = self.tree.query(points, predicate='intersects')
+        return point_idx, tile_idx
+
+    def query_bbox(self, bbox):
+        """Renvoie les indices des dalles intersectant une emprise (minx, miny, maxx, maxy)."""
+        return np.sort(self.tree.query(shapely.box(*bbox), predicate='intersects'))
+
+    def _cache_path(self, record):
+        """Chemin du binaire .npy associé à une dalle ASCII."""
+        stem = Path(record['path']).stem
+        return self.cache_dir / f"{stem}_{int(record.get('mtime', 0))}.npy"
+
+    def _decode(self, record):
+        """Décode une dalle, depuis le cache binaire si disponible, sinon depuis le fichier ASCII."""
+        cache_path = self._cache_path(record) if self.cache_dir else None
+        if cache_path is not None and cache_path.exists() and 'res' in record:
+            # Géoréférencement connu par l'index : aucun accès au fichier ASCII
+            left, _, _, top = record['bounds']
+            xres, yres = record['res']
+            data = np.load(cache_path, mmap_mode='r')
+            count('raster_tiles_mapped')
+            return DEMTile(data, left, top, xres, -yres, record.get('nodata'))
+
+        with span('raster_read', path=Path(record['path']).name), rasterio.open(record['path']) as src:
+            transform = src.transform
+            data = src.read(1)
+            count('raster_windows_read')
+            return DEMTile(data, transform.c, transform.f, transform.a, transform.e, src.nodata)
+
+    def get_tile(self, tile_idx):
+        """Renvoie la dalle décodée, via le cache LRU borné par max_cache_bytes."""
+        key = self.records[tile_idx]['path']
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            count('dem_cache_hits')
+            return self._cache[key]
+
+        self.cache_misses += 1
+        count('dem_cache_misses')
+        tile = self._decode(self.records[tile_idx])
+        self._cache[key] = tile
+        self._cache_bytes += tile.nbytes
+
+        # Éviction des dalles les moins récemment utilisées (on garde au moins la dalle courante)
+        while self._cache_bytes > self.max_cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+
+        return tile
+
+    def clear_cache(self):
+        """Vide le cache des dalles décodées."""
+        self._cache.clear()
+        self._cache_bytes = 0
+
+    def convert_to_cache(self, workers=4):
+        """Convertit une fois les dalles ASCII en .npy mappables en mémoire dans cache_dir."""
+        if self.cache_dir is None:
+            raise ValueError("Aucun répertoire de cache n'est configuré")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        def convert(record):
+            cache_path = self._cache_path(record)
+            if cache_path.exists():
+                return False
+            with rasterio.open(record['path']) as src:
+                np.save(cache_path, src.read(1))
+            return True
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            converted = sum(executor.map(convert, self.records))
+
+        progress(f"Cache MNT : {converted} dalles converties dans {self.cache_dir}")
+        return converted
@@ -0,0 +1,258 @@
+# rando_sim/noding.py
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from instrumentation import progress
+
+# Niveau par rapport au sol (BD TOPO : POS_SOL, 0 au sol, > 0 pont, < 0 tunnel)
+LEVEL_COLUMN = 'level'
+
+# Longueur minimale d'un tronçon issu d'une découpe (m)
+MIN_PIECE_LENGTH = 1e-6
+
+
+def same_level(levels_a, levels_b):
+    """Règle par défaut : deux lignes ne se coupent que si elles sont au même niveau.
+
+    Un pont (niveau 1) ne crée donc pas de carrefour avec la route qu'il enjambe.
+    """
+    return levels_a == levels_b
+
+
+def component_stats(network):
+    """Statistiques de connexité d'un réseau (nœuds aux extrémités exactes des lignes)."""
+    lines = network.geometry.values
+    starts = shapely.get_coordinates(shapely.get_point(lines, 0))
+    ends = shapely.get_coordinates(shapely.get_point(lines, -1))
+    _, nodes = np.unique(np.vstack([starts, ends]), axis=0, return_inverse=True)
+    nodes = nodes.ravel()
+    n_nodes = int(nodes.max()) + 1 if len(nodes) else 0
+    n_lines = len(lines)
+
+    adjacency = coo_matrix((np.ones(n_lines), (nodes[:n_lines], nodes[n_lines:])), shape=(n_nodes, n_nodes))
+    n_components, labels = connected_components(adjacency, directed=False)
+    sizes = np.bincount(labels) if n_nodes else np.zeros(0, dtype=np.int64)
+
+    return {
+        'n_lines': n_lines,
+        'n_nodes': n_nodes,
+        'n_components': int(n_components),
+        'largest_component_nodes': int(sizes.max()) if len(sizes) else 0,
+        'largest_component_share': float(sizes.max() / n_nodes) if n_nodes else 0.0,
+        'n_singleton_components': int(np.count_nonzero(sizes <= 2)),
+    }
+
+
+def _explode(network):
+    """Une ligne simple par entité (les MultiLineString sont éclatées)."""
+    network = network[~network.geometry.is_empty & network.geometry.notna()]
+    network = network.explode(index_parts=False).reset_index(drop=True)
+    return network[network.geom_type == 'LineString'].reset_index(drop=True)
+
+
+def _levels(network, level_column):
+    """Niveau de chaque ligne (0 si la colonne est absente ou non renseignée)."""
+    if level_column not in network.columns:
+        return np.zeros(len(network), dtype=np.int64)
+    return pd.to_numeric(network[level_column], errors='coerce').fillna(0).to_numpy(np.int64)
+
+
+def _snap_endpoints(coords, line_index, tolerance):
+    """Fusionne les extrémités distantes de moins de `tolerance` (une passe KD-tree).
+
+    Renvoie les coordonnées modifiées et l'identifiant de groupe de chaque extrémité
+    (début puis fin de chaque ligne).
+    """
+    n_lines = line_index.max() + 1 if len(line_index) else 0
+    first = np.searchsorted(line_index, np.arange(n_lines), side='left')
+    last = np.searchsorted(line_index, np.arange(n_lines), side='right') - 1
+    vertex = np.concatenate([first, last])
+    endpoints = coords[vertex]
+
+    pairs = cKDTree(endpoints).query_pairs(tolerance, output_type='ndarray') if tolerance > 0 \
+        else np.zeros((0, 2), dtype=np.int64)
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(endpoints),) * 2)
+    _, groups = connected_components(graph, directed=False)
+
+    # Chaque groupe prend les coordonnées de son premier membre (déterministe)
+    _, representative = np.unique(groups, return_index=True)
+    coords = coords.copy()
+    coords[vertex] = endpoints[representative[groups]]
+    return coords, vertex, groups
+
+
+def _split_lines(coords, line_index, split_line, split_coords, min_length=MIN_PIECE_LENGTH):
+    """Découpe les lignes aux points donnés (vectorisé : un seul tri de tous les sommets).
+
+    Chaque point de découpe ferme un tronçon et ouvre le suivant ; les coordonnées des
+    points sont reprises telles quelles pour que les tronçons se raccordent exactement.
+    Renvoie (géométries des tronçons, ligne d'origine de chaque tronçon).
+    """
+    n_lines = line_index.max() + 1 if len(line_index) else 0
+    lines = shapely.linestrings(coords, indices=line_index)
+    lengths = shapely.length(lines)
+
+    # Abscisse curviligne des sommets
+    step = np.hypot(*np.diff(coords, axis=0).T)
+    step = np.concatenate([[0.0], np.where(np.diff(line_index) == 0, step, 0.0)])
+    measure = np.cumsum(step)
+    first = np.searchsorted(line_index, np.arange(n_lines))
+    measure -= measure[first][line_index]
+
+    # Abscisse des découpes ; celles trop proches d'une extrémité ou d'une découpe précédente sont ignorées
+    split_measure = shapely.line_locate_point(lines[split_line], shapely.points(split_coords))
+    keep = (split_measure > min_length) & (split_measure < lengths[split_line] - min_length)
+    split_line, split_coords, split_measure = split_line[keep], split_coords[keep], split_measure[keep]
+    order = np.lexsort((split_measure, split_line))
+    split_line, split_coords, split_measure = split_line[order], split_coords[order], split_measure[order]
+    duplicate = np.zeros(len(split_line), dtype=bool)
+    duplicate[1:] = (split_line[1:] == split_line[:-1]) & (np.diff(split_measure) < min_length)
+    split_line, split_coords, split_measure = split_line[~duplicate], split_coords[~duplicate], split_measure[~duplicate]
+
+    # Sommets (rang 0), fin de tronçon (rang 1) puis début du tronçon suivant (rang 2) à abscisse égale
+    row_line = np.concatenate([line_index, split_line, split_line])
+    row_measure = np.concatenate([measure, split_measure, split_measure])
+    row_rank = np.repeat([0, 1, 2], [len(line_index), len(split_line), len(split_line)])
+    row_coords = np.vstack([coords, split_coords, split_coords])
+    order = np.lexsort((row_rank, row_measure, row_line))
+    row_line, row_rank, row_coords = row_line[order], row_rank[order], row_coords[order]
+
+    # Numéro de tronçon : base de la ligne + nombre de découpes déjà ouvertes sur la ligne
+    pieces_per_line = 1 + np.bincount(split_line, minlength=n_lines)
+    base = np.concatenate([[0], np.cumsum(pieces_per_line)[:-1]])
+    opened = np.cumsum(row_rank == 2)
+    line_start = np.searchsorted(row_line, np.arange(n_lines))
+    opened_before = np.concatenate([[0], opened])[line_start]
+    piece = base[row_line] + opened - opened_before[row_line]
+
+    # Supprime les sommets confondus consécutifs d'un même tronçon
+    same = np.zeros(len(piece), dtype=bool)
+    same[1:] = (piece[1:] == piece[:-1]) & np.all(row_coords[1:] == row_coords[:-1], axis=1)
+    piece, row_coords = piece[~same], row_coords[~same]
+
+    geometries = shapely.linestrings(row_coords, indices=piece)
+    origin = np.repeat(np.arange(n_lines), pieces_per_line)
+    return geometries, origin
+
+
+def node_network(network, tolerance=0.5, level_column=LEVEL_COLUMN, level_rule=same_level,
+                 split_crossings=True, snap_to_lines=True, verbose=True):
+    """Nœude le réseau unifié : extrémités rapprochées, raccords en T et découpe aux croisements.
+
+    - les extrémités distantes de moins de `tolerance` sont fusionnées ;
+    - une extrémité à moins de `tolerance` de l'intérieur d'une autre ligne y est projetée
+      et coupe cette ligne (raccord en T) ;
+    - deux lignes qui se croisent sont coupées au croisement si `level_rule(niveau_a, niveau_b)`
+      l'autorise (par défaut : même niveau, les ponts et tunnels ne créent pas de carrefour).
+
+    Les candidats sont trouvés en bloc par un STRtree : aucun test deux à deux sur tout le réseau.
+    Renvoie (réseau nœudé, rapport avec les statistiques de connexité avant et après).
+    """
+    started = time.perf_counter()
+    network = _explode(network)
+    before = component_stats(network)
+    levels = _levels(network, level_column)
+
+    coords, line_index = shapely.get_coordinates(network.geometry.values, return_index=True)
+    coords, endpoint_vertex, groups = _snap_endpoints(coords, line_index, tolerance)
+    n_lines = len(network)
+    lines = shapely.linestrings(coords, indices=line_index)
+    tree = shapely.STRtree(lines)
+
+    split_line = [np.zeros(0, dtype=np.int64)]
+    split_coords = [np.zeros((0, 2))]
+    n_t_junctions = n_crossings = 0
+
+    if snap_to_lines:
+        # Une extrémité par groupe ; elle appartient aux lignes de tous les membres du groupe
+        _, member = np.unique(groups, return_index=True)
+        endpoint_line = np.concatenate([np.arange(n_lines), np.arange(n_lines)])
+        points = shapely.points(coords[endpoint_vertex[member]])
+        candidate, target = tree.query(points, predicate='dwithin', distance=max(tolerance, MIN_PIECE_LENGTH))
+
+        # Exclut les lignes qui se terminent déjà sur ce point et celles d'un autre niveau
+        group = groups[member][candidate]
+        is_own = (groups[target] == group) | (groups[n_lines + target] == group)
+        allowed = ~is_own & level_rule(levels[endpoint_line[member][candidate]], levels[target])
+        candidate, target = candidate[allowed], target[allowed]
+
+        if len(candidate):
+            # Ligne la plus proche de chaque extrémité
+            distance = shapely.distance(points[candidate], lines[target])
+            order = np.lexsort((distance, candidate))
+            candidate, target = candidate[order], target[order]
+            first = np.concatenate([[True], candidate[1:] != candidate[:-1]])
+            candidate, target = candidate[first], target[first]
+
+            projected = shapely.get_coordinates(
+                shapely.line_interpolate_point(lines[target], shapely.line_locate_point(lines[target], points[candidate])))
+
+            # Les extrémités ne sont déplacées que si la projection tombe à l'intérieur de la ligne
+            measure = shapely.line_locate_point(lines[target], shapely.points(projected))
+            inside = (measure > tolerance) & (measure < shapely.length(lines[target]) - tolerance)
+            candidate, target, projected = candidate[inside], target[inside], projected[inside]
+            n_t_junctions = len(candidate)
+
+            # Les groupes sont numérotés de 0 à n - 1 : tout le groupe suit son extrémité
+            moved = np.full(len(member), -1, dtype=np.int64)
+            moved[candidate] = np.arange(len(candidate))
+            endpoint_move = moved[groups]
+            selected = endpoint_move >= 0
+            coords[endpoint_vertex[selected]] = projected[endpoint_move[selected]]
+
+            split_line.append(target.astype(np.int64))
+            split_coords.append(projected)
+            lines = shapely.linestrings(coords, indices=line_index)
+            tree = shapely.STRtree(lines)
+
+    if split_crossings:
+        left, right = tree.query(lines, predicate='intersects')
+        keep = (left < right) & level_rule(levels[left], levels[right])
+        left, right = left[keep], right[keep]
+
+        intersections = shapely.intersection(lines[left], lines[right])
+        parts, pair = shapely.get_parts(intersections, return_index=True)
+        # Croisements ponctuels, et extrémités des tronçons superposés
+        is_point = shapely.get_type_id(parts) == 0
+        overlap_points, overlap_pair = shapely.get_parts(shapely.boundary(parts[~is_point]), return_index=True)
+        points = np.concatenate([parts[is_point], overlap_points])
+        pair = np.concatenate([pair[is_point], pair[~is_point][overlap_pair]])
+        point_coords = shapely.get_coordinates(points)
+        n_crossings = len(points)
+
+        # Un croisement situé sur l'extrémité d'une des deux lignes en reprend les coordonnées exactes
+        for line in (left[pair], right[pair]):
+            for end in (endpoint_vertex[line], endpoint_vertex[n_lines + line]):
+                close = np.hypot(*(point_coords - coords[end]).T) < MIN_PIECE_LENGTH * 1000
+                point_coords[close] = coords[end][close]
+
+        split_line += [left[pair].astype(np.int64), right[pair].astype(np.int64)]
+        split_coords += [point_coords, point_coords]
+
+    geometries, origin = _split_lines(coords, line_index, np.concatenate(split_line), np.vstack(split_coords))
+    noded = gpd.GeoDataFrame(network.drop(columns=network.geometry.name).iloc[origin].reset_index(drop=True),
+                             geometry=geometries, crs=network.crs)
+    after = component_stats(noded)
+
+    report = {
+        'tolerance': tolerance,
+        'snapped_endpoints': int(len(groups) - len(np.unique(groups))),
+        't_junctions': int(n_t_junctions),
+        'crossing_points': int(n_crossings),
+        'before': before,
+        'after': after,
+        'seconds': time.perf_counter() - started,
+    }
+    if verbose:
+        progress(f"Nœudage : {before['n_lines']} -> {after['n_lines']} lignes, "
+                 f"{before['n_components']} -> {after['n_components']} composantes connexes "
+                 f"(plus grande : {before['largest_component_share']:.1%} -> {after['largest_component_share']:.1%}) "
+                 f"en {report['seconds']:.1f} s")
+    return noded, report
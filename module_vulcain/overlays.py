@@ -0,0 +1,227 @@
+# rando_sim/overlays.py
+import itertools
+import math
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+
+from routing import Router
+
+# Multiplicateur d'une fermeture : l'arête devient infranchissable
+CLOSED = math.inf
+
+
+class Overlay:
+    """Modification temporaire des coûts d'un ensemble d'arêtes : fermeture ou multiplicateur.
+
+    Un pont détruit ou un carrefour bloqué est une fermeture ; une zone contaminée ou un
+    itinéraire fixé par l'adversaire, un multiplicateur (> 1 : ralentissement). `weights`
+    restreint l'overlay à certaines colonnes de coût (toutes par défaut).
+    """
+
+    def __init__(self, edges, multiplier=CLOSED, weights=None, name=None):
+        if not multiplier > 0:
+            raise ValueError(f"Multiplicateur invalide : {multiplier} (doit être strictement positif)")
+        self.edges = np.unique(np.asarray(edges, dtype=np.int64))
+        self.multiplier = float(multiplier)
+        self.weights = None if weights is None else frozenset(weights)
+        self.name = name
+
+    def __repr__(self):
+        effect = "fermeture" if self.closed else f"x{self.multiplier:g}"
+        return f"Overlay({self.name or 'sans nom'}, {len(self.edges)} arêtes, {effect})"
+
+    @property
+    def closed(self):
+        return math.isinf(self.multiplier)
+
+    @property
+    def penalising(self):
+        """Un overlay qui ne fait qu'augmenter des coûts laisse optimaux les itinéraires qui l'évitent."""
+        return self.multiplier >= 1.0
+
+    def applies_to(self, weight):
+        return self.weights is None or weight in self.weights
+
+    @classmethod
+    def from_segments(cls, graph, segments, direction='both', **kwargs):
+        """Overlay sur des segments du graphe, dans un sens ('forward', 'reverse') ou les deux."""
+        selected = np.isin(graph.segment_ids, np.asarray(segments, dtype=np.int64))
+        if direction == 'forward':
+            selected &= ~graph.edge_reversed
+        elif direction == 'reverse':
+            selected &= graph.edge_reversed
+        elif direction != 'both':
+            raise ValueError(f"Sens inconnu : {direction}")
+        return cls(np.flatnonzero(selected), **kwargs)
+
+    @classmethod
+    def from_polygons(cls, index, polygons, predicate='intersects', crs=None, **kwargs):
+        """Overlay sur les arêtes dont le segment touche l'un des polygones (via le STRtree d'un SnapIndex)."""
+        polygons = np.atleast_1d(np.asarray(polygons, dtype=object))
+        if crs is not None and crs != index.crs:
+            polygons = shapely.transform(polygons, lambda coords: np.column_stack(
+                index.to_graph_crs(coords[:, 0], coords[:, 1], crs)))
+        table = index._segment_table()
+        _, segments = table['tree'].query(polygons, predicate=predicate)
+        segments = np.unique(segments)
+        edges = np.concatenate([table['forward_edge'][segments], table['reverse_edge'][segments]])
+        return cls(edges[edges >= 0], **kwargs)
+
+    @classmethod
+    def around_points(cls, index, xs, ys, radius, crs=None, **kwargs):
+        """Overlay sur les arêtes à moins de `radius` mètres des points (carrefours bloqués...)."""
+        xs, ys = index.to_graph_crs(xs, ys, crs)
+        return cls.from_polygons(index, shapely.buffer(shapely.points(np.ravel(xs), np.ravel(ys)), radius), **kwargs)
+
+
+class OverlayRouter(Router):
+    """Router dont les poids tiennent compte d'une pile d'overlays, sans copie du graphe.
+
+    Les listes de poids effectifs (celles du Router) ne sont corrigées que sur les arêtes
+    concernées, à l'ajout comme au retrait d'un overlay. Toutes les recherches du Router
+    (A*, Dijkstra, isochrones, accrochage) en tiennent donc compte.
+
+    Les itinéraires calculés sont gardés dans un cache LRU. Un overlay pénalisant ne
+    change pas l'optimalité des itinéraires qui ne le traversent pas : seuls ceux qu'il
+    touche sont invalidés. Le retrait d'un overlay, ou un overlay qui accélère, invalide
+    les itinéraires calculés en sa présence (resp. tous ceux du poids concerné). Les
+    requêtes invalidées sont notées dans `stale` et recalculées par `refresh()`.
+    """
+
+    def __init__(self, graph, cost_model=None, cache_size=10_000):
+        super().__init__(graph, cost_model)
+        self.overlays = {}
+        self.cache_size = cache_size
+        self.stale = set()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidated': 0}
+
+        self._ids = itertools.count()
+        # Arête -> overlays actifs qui la concernent (ordre d'ajout)
+        self._edge_overlays = {}
+        # (source, cible, poids, méthode) -> (Route ou None, arêtes, overlays actifs au calcul)
+        self._cache = OrderedDict()
+
+    # --- Poids -----------------------------------------------------------------------
+
+    def weights(self, weight):
+        """Poids effectifs (overlays appliqués) sous forme de liste, mise à jour en place."""
+        fresh = weight not in self._weights
+        values = super().weights(weight)
+        if fresh and self._edge_overlays:
+            self._apply(weight, values, list(self._edge_overlays))
+        return values
+
+    def _apply(self, weight, values, edges):
+        """Recalcule le poids effectif des arêtes données à partir de la colonne du graphe."""
+        base = self.graph.edge_data[weight]
+        for edge in edges:
+            value = float(base[edge])
+            for overlay_id in self._edge_overlays.get(edge, ()):
+                overlay = self.overlays[overlay_id]
+                if overlay.applies_to(weight):
+                    value = math.inf if overlay.closed else value * overlay.multiplier
+            values[edge] = value
+
+    def heuristic_scale(self, weight):
+        """Minorant de l'A*, réduit si un overlay actif accélère certaines arêtes.
+
+        Les accélérations se cumulent sur une arête couverte par plusieurs overlays : le produit
+        de tous les multiplicateurs inférieurs à 1 reste un minorant.
+        """
+        scale = super().heuristic_scale(weight)
+        for overlay in self.overlays.values():
+            if overlay.applies_to(weight) and overlay.multiplier < 1.0:
+                scale *= overlay.multiplier
+        return scale
+
+    # --- Pile d'overlays -------------------------------------------------------------
+
+    def add(self, overlay):
+        """Active un overlay ; renvoie son identifiant (pour `remove`)."""
+        overlay_id = next(self._ids)
+        self.overlays[overlay_id] = overlay
+        edges = overlay.edges.tolist()
+        for edge in edges:
+            self._edge_overlays.setdefault(edge, []).append(overlay_id)
+        for weight, values in self._weights.items():
+            if overlay.applies_to(weight):
+                self._apply(weight, values, edges)
+
+        touched = np.zeros(self.graph.n_edges, dtype=bool)
+        touched[overlay.edges] = True
+        self._invalidate(lambda key, route_edges, active: overlay.applies_to(key[2]) and (
+            not overlay.penalising or touched[route_edges].any()))
+        return overlay_id
+
+    def remove(self, overlay_id):
+        """Désactive un overlay et rétablit les coûts de ses arêtes."""
+        overlay = self.overlays.pop(overlay_id)
+        edges = overlay.edges.tolist()
+        for edge in edges:
+            remaining = [other for other in self._edge_overlays[edge] if other != overlay_id]
+            if remaining:
+                self._edge_overlays[edge] = remaining
+            else:
+                del self._edge_overlays[edge]
+        for weight, values in self._weights.items():
+            if overlay.applies_to(weight):
+                self._apply(weight, values, edges)
+
+        self._invalidate(lambda key, route_edges, active: overlay_id in active)
+        return overlay
+
+    def clear(self):
+        """Retire tous les overlays."""
+        for overlay_id in list(self.overlays):
+            self.remove(overlay_id)
+
+    # --- Cache d'itinéraires ---------------------------------------------------------
+
+    def _invalidate(self, predicate):
+        for key in [key for key, (_, route_edges, active) in self._cache.items()
+                    if predicate(key, route_edges, active)]:
+            del self._cache[key]
+            self.stale.add(key)
+            self.stats['invalidated'] += 1
+
+    def route(self, source, target, weight='time', method='astar'):
+        """Itinéraire avec overlays, depuis le cache s'il est encore valide."""
+        key = (int(source), int(target), weight, method)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            route = self._cache[key][0]
+        else:
+            self.stats['misses'] += 1
+            try:
+                route = super().route(source, target, weight, method)
+            except ValueError:
+                route = None
+            # Seuls les overlays du poids concerné conditionnent la validité du résultat
+            active = frozenset(overlay_id for overlay_id, overlay in self.overlays.items()
+                               if overlay.applies_to(weight))
+            edges = np.asarray(route.edges if route is not None else [], dtype=np.int64)
+            self._cache[key] = (route, edges, active)
+            self.stale.discard(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        if route is None:
+            raise ValueError(f"Aucun itinéraire entre les nœuds {source} et {target}")
+        return route
+
+    def refresh(self):
+        """Recalcule les requêtes invalidées par les derniers overlays : {requête: Route ou None}."""
+        routes = {}
+        for key in list(self.stale):
+            source, target, weight, method = key
+            try:
+                routes[key] = self.route(source, target, weight, method)
+            except ValueError:
+                routes[key] = None
+        return routes
+
+    def clear_cache(self):
+        self._cache.clear()
+        self.stale.clear()
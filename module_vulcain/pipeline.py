@@ -0,0 +1,422 @@
+# rando_sim/pipeline.py
+import hashlib
+import inspect
+import json
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+
+from cost_model import CostModel
+from cost_surface import CostSurface
+from data_loader import BD_TOPO_LAYERS, IGNDataLoader
+from data_processor import DataProcessor
+from enrichment import VEGETATION_CLASSES
+from graph import GraphBuilder
+from instrumentation import count, progress, span
+from snapping import SnapIndex
+from surface_rules import SurfaceClassifier
+
+MANIFEST_FILE = "pipeline_manifest.json"
+MANIFEST_VERSION = 1
+
+# Fichiers annexes d'un shapefile : une modification de l'un d'eux change la couche
+SHAPEFILE_SUFFIXES = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+
+def _stable_hash(value):
+    """Empreinte d'une valeur JSON (paramètres d'étape)."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _function_fingerprint(function):
+    """Empreinte d'une fonction : nom et code source (ou bytecode à défaut)."""
+    try:
+        code = inspect.getsource(function)
+    except (OSError, TypeError):
+        code = function.__code__.co_code.hex()
+    return f"{function.__module__}.{function.__qualname__}:{hashlib.sha256(code.encode()).hexdigest()[:16]}"
+
+
+def describe_cost_model(cost_model):
+    """Paramètres d'un modèle de coûts sous forme sérialisable (pour détecter tout changement)."""
+    return {
+        'default_profile': cost_model.default_profile,
+        'profiles': {
+            name: {
+                'base_speeds': profile.base_speeds,
+                'default_speed': profile.default_speed,
+                'slope_factor': _function_fingerprint(profile.slope_factor),
+                'effort': _function_fingerprint(profile.effort),
+                'vegetation_factors': profile.vegetation_factors,
+                'crossing_time_s': profile.crossing_time_s,
+            }
+            for name, profile in cost_model.profiles.items()
+        },
+    }
+
+
+class Stage:
+    """Étape du pipeline : fichiers lus et produits (relatifs au répertoire traité) et fonction d'exécution.
+
+    `inputs` et `outputs` peuvent être des fonctions (évaluées au moment de l'exécution)
+    pour les étapes dont les entrées dépendent des fichiers présents.
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, after=(), optional=False):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        self.after = tuple(after)
+        # Étape facultative : un échec est enregistré sans interrompre le pipeline
+        self.optional = optional
+
+    def resolve(self, files):
+        return list(files() if callable(files) else files)
+
+
+class Manifest:
+    """Manifeste du pipeline : empreintes des fichiers et état de chaque étape.
+
+    Le contenu d'un fichier n'est rehaché que si sa taille ou sa date de modification
+    a changé depuis le dernier passage.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        self.stages = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.files = data.get('files', {})
+                self.stages = data.get('stages', {})
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.files, 'stages': self.stages}, f, indent=2)
+        tmp_path.replace(self.path)
+
+    def fingerprint(self, path):
+        """Empreinte d'un fichier (sha256 du contenu) ou d'un répertoire (empreintes de ses fichiers)."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        if path.is_dir():
+            children = {str(child.relative_to(path)): self.fingerprint(child)
+                        for child in sorted(path.rglob('*')) if child.is_file()}
+            return _stable_hash(children)
+
+        stat = path.stat()
+        key = str(path)
+        known = self.files.get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.files[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        return self.files[key]['sha256']
+
+
+class Pipeline:
+    """Chaîne de traitement incrémentale : ingestion -> réseau -> élévation -> graphe -> coûts -> sauvegarde,
+    plus le raster de coût hors réseau.
+
+    Chaque étape n'est relancée que si ses fichiers d'entrée, ses paramètres ou ses
+    fichiers de sortie ont changé depuis le dernier passage enregistré dans le manifeste.
+    Modifier les vitesses du modèle de coûts ne relance donc que les deux dernières étapes.
+    """
+
+    def __init__(self, raw_data_dir, processed_data_dir, cost_model=None, bbox=None,
+                 noding_tolerance=0.5, elevation_spacing=None, elevation_method='nearest', snap_tolerance=None,
+                 workers=None, surface_classifier=None, cost_surface_resolution=5.0, land_cover_classes=None):
+        self.raw_data_dir = Path(raw_data_dir)
+        self.processed_data_dir = Path(processed_data_dir)
+        self.processed_data_dir.mkdir(parents=True, exist_ok=True)
+        self.cost_model = cost_model or CostModel()
+        self.manifest = Manifest(self.processed_data_dir / MANIFEST_FILE)
+        # Nombre de processus du traitement par dalles : sans effet sur les résultats, hors manifeste
+        self.workers = workers
+
+        self.surface_classifier = surface_classifier or SurfaceClassifier.from_file()
+
+        # Objets partagés entre étapes d'un même passage (évite de relire les fichiers)
+        self.processor = None
+        self.builder = None
+        self.report = []
+
+        processed = self.processed_data_dir
+        self.stages = [
+            Stage('ingest', self._ingest,
+                  inputs=self._raw_inputs,
+                  outputs=lambda: [processed / f"{name}.gpkg" for name in self._raw_layers()]
+                  + [processed / "mnt_metadata.json"],
+                  params={'bbox': bbox}),
+            Stage('unify', self._unify,
+                  inputs=[processed / "roads.gpkg", processed / "paths.gpkg"],
+                  outputs=[processed / "unified_network.gpkg"],
+                  params={'noding_tolerance': noding_tolerance,
+                          'surface_rules': self.surface_classifier.to_dict()}, after=['ingest']),
+            Stage('elevation', self._elevation,
+                  inputs=[processed / "unified_network.gpkg", processed / "mnt_metadata.json"],
+                  outputs=[processed / "network_with_elevation.gpkg", processed / "elevation_profiles.npz"],
+                  params={'spacing': elevation_spacing, 'method': elevation_method}, after=['unify'],
+                  optional=True),
+            Stage('land_cover', self._land_cover,
+                  inputs=[processed / "unified_network.gpkg", processed / "land_use.gpkg", processed / "rivers.gpkg"],
+                  outputs=[processed / "land_cover.npz"],
+                  params={'classes': land_cover_classes or VEGETATION_CLASSES}, after=['unify'], optional=True),
+            Stage('graph', self._graph,
+                  inputs=self._network_inputs,
+                  outputs=[processed / "graph_topology"],
+                  params={'snap_tolerance': snap_tolerance}, after=['elevation', 'land_cover']),
+            Stage('costs', self._costs,
+                  inputs=[processed / "graph_topology"],
+                  outputs=[processed / "edge_costs.npz"],
+                  params={'cost_model': describe_cost_model(self.cost_model)}, after=['graph']),
+            Stage('cost_surface', self._cost_surface,
+                  inputs=[processed / f"{name}.gpkg" for name in ('land_use', 'water', 'rivers', 'buildings')]
+                  + [processed / "unified_network.gpkg", processed / "mnt_metadata.json"],
+                  outputs=[processed / "cost_surface"],
+                  params={'resolution': cost_surface_resolution, 'bbox': bbox,
+                          'vegetation_classes': land_cover_classes or VEGETATION_CLASSES},
+                  after=['unify'], optional=True),
+            Stage('persist', self._persist,
+                  inputs=[processed / "graph_topology", processed / "edge_costs.npz"],
+                  outputs=[processed / "routing_graph"], after=['costs']),
+        ]
+
+    # --- Entrées dynamiques ----------------------------------------------------------
+
+    def _raw_layers(self):
+        return [name for name, (path, _) in BD_TOPO_LAYERS.items() if (self.raw_data_dir / path).exists()]
+
+    def _raw_inputs(self):
+        """Shapefiles de la BD TOPO (avec leurs fichiers annexes) et dalles du MNT."""
+        files = []
+        for name in self._raw_layers():
+            path = self.raw_data_dir / BD_TOPO_LAYERS[name][0]
+            files += [path.with_suffix(suffix) for suffix in SHAPEFILE_SUFFIXES if path.with_suffix(suffix).exists()]
+        files += sorted(self.raw_data_dir.glob("**/RGEALTI*.asc"))
+        return files
+
+    def _network_sources(self):
+        """Réseau avec élévation si l'étape `elevation` est à jour, sinon réseau unifié (comme
+        GraphBuilder.load_network), et occupation du sol si l'étape `land_cover` est à jour."""
+        processed = self.processed_data_dir
+        network_path = processed / "network_with_elevation.gpkg"
+        if not self._stage_done('elevation'):
+            network_path = processed / "unified_network.gpkg"
+        land_cover_path = processed / "land_cover.npz" if self._stage_done('land_cover') else None
+        return network_path, land_cover_path
+
+    def _network_inputs(self):
+        network_path, land_cover_path = self._network_sources()
+        return [network_path] + ([land_cover_path] if land_cover_path is not None else [])
+
+    # --- Étapes ----------------------------------------------------------------------
+
+    def _get_processor(self, layers):
+        if self.processor is None:
+            self.processor = DataProcessor(self.processed_data_dir, surface_classifier=self.surface_classifier)
+            self.processor.load_processed_data(layers=layers)
+        return self.processor
+
+    def _ingest(self, stage):
+        if not self._raw_layers():
+            # Pas de données brutes : les fichiers déjà traités sont utilisés tels quels
+            progress(f"Aucune couche BD TOPO dans {self.raw_data_dir}, données traitées existantes conservées")
+            return
+        loader = IGNDataLoader(self.raw_data_dir, self.processed_data_dir, bbox=stage.params['bbox'])
+        loader.preprocess_and_save()
+
+    def _unify(self, stage):
+        # Seules les couches du réseau sont relues
+        processor = self._get_processor(layers=['roads', 'paths'])
+        processor.create_unified_network()
+        processor.node_network(tolerance=stage.params['noding_tolerance'])
+
+    def _elevation(self, stage):
+        processor = self._get_processor(layers=[])
+        if processor.network is None:
+            with span('read_file', layer='unified_network'):
+                processor.network = gpd.read_file(self.processed_data_dir / "unified_network.gpkg")
+        # Sans MNT, l'étape échoue et le graphe est construit sur le réseau sans élévation
+        if self.workers and self.workers > 1:
+            processor.process_tiled(spacing=stage.params['spacing'], method=stage.params['method'],
+                                    workers=self.workers)
+        else:
+            processor.add_elevation_profiles(spacing=stage.params['spacing'], method=stage.params['method'])
+
+    def _graph(self, stage):
+        self.builder = GraphBuilder(self.processed_data_dir, cost_model=self.cost_model)
+        self.builder.load_network(*self._network_sources())
+        self.builder.build_compact_graph(snap_tolerance=stage.params['snap_tolerance'])
+        self.builder.compact_graph.save(self.processed_data_dir / "graph_topology",
+                                        metadata=self.builder._network_metadata())
+
+    def _get_topology(self):
+        """Graphe compact de l'étape `graph`, rechargé depuis le disque si l'étape n'a pas tourné."""
+        if self.builder is None or self.builder.compact_graph is None:
+            self.builder = GraphBuilder(self.processed_data_dir, cost_model=self.cost_model)
+            self.builder.load_compact_graph(self.processed_data_dir / "graph_topology", mmap=False)
+        return self.builder
+
+    def _costs(self, stage):
+        builder = self._get_topology()
+        graph = builder.update_costs(self.cost_model)
+        cost_columns = ['distance'] + [column for name in self.cost_model.profiles
+                                       for column in self.cost_model.column_names(name)]
+        np.savez(self.processed_data_dir / "edge_costs.npz",
+                 **{column: graph.edge_data[column] for column in cost_columns})
+
+    def _get_layers(self, layers):
+        """Processeur avec les couches demandées chargées (seules les manquantes sont relues)."""
+        processor = self._get_processor(layers=layers)
+        missing = [name for name in layers if name not in processor.data]
+        if missing:
+            processor.load_processed_data(layers=missing)
+        if processor.network is None:
+            with span('read_file', layer='unified_network'):
+                processor.network = gpd.read_file(self.processed_data_dir / "unified_network.gpkg")
+        return processor
+
+    def _land_cover(self, stage):
+        processor = self._get_layers(['land_use', 'rivers'])
+        processor.add_land_cover(classes=stage.params['classes'])
+
+    def _cost_surface(self, stage):
+        processor = self._get_layers(['land_use', 'water', 'rivers', 'buildings'])
+        bounds = stage.params['bbox'] or tuple(processor.network.total_bounds)
+        processor.build_cost_surface(resolution=stage.params['resolution'], bounds=bounds,
+                                     vegetation_classes=stage.params['vegetation_classes'])
+
+    def load_cost_surface(self):
+        """Raster de coût hors réseau (mappé en mémoire), pour HybridRouter."""
+        return CostSurface.load(self.processed_data_dir / "cost_surface")
+
+    def _persist(self, stage):
+        builder = self._get_topology()
+        with np.load(self.processed_data_dir / "edge_costs.npz") as costs:
+            for column in costs.files:
+                builder.compact_graph.edge_data[column] = costs[column]
+        builder.save_graph(self.processed_data_dir / "routing_graph")
+
+    # --- Exécution -------------------------------------------------------------------
+
+    def _stage_key(self, stage, inputs):
+        """Clé d'une étape : paramètres et empreintes de ses entrées."""
+        return _stable_hash({
+            'params': stage.params,
+            'inputs': {str(path): self.manifest.fingerprint(path) for path in inputs},
+        })
+
+    def _stage_done(self, name):
+        """L'étape nommée a réussi lors de son dernier passage, avec ses entrées et paramètres actuels
+        (une sortie restée d'un passage antérieur ne suffit pas)."""
+        stage = next(stage for stage in self.stages if stage.name == name)
+        recorded = self.manifest.stages.get(name)
+        return (recorded is not None and recorded.get('status') == 'done'
+                and recorded.get('key') == self._stage_key(stage, stage.resolve(stage.inputs)))
+
+    @staticmethod
+    def _discard_outputs(outputs):
+        """Supprime les sorties d'une étape en échec, pour qu'aucune étape suivante ne les relise."""
+        for path in outputs:
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+
+    def _is_up_to_date(self, stage, key, outputs):
+        recorded = self.manifest.stages.get(stage.name)
+        if recorded is None or recorded.get('status') != 'done' or recorded.get('key') != key:
+            return False
+        # Une sortie supprimée ou modifiée à la main relance l'étape
+        return all(recorded['outputs'].get(str(path)) == self.manifest.fingerprint(path) for path in outputs)
+
+    def status(self):
+        """État de chaque étape : à jour ou à relancer."""
+        return {stage.name: self._is_up_to_date(stage, self._stage_key(stage, stage.resolve(stage.inputs)),
+                                                stage.resolve(stage.outputs))
+                for stage in self.stages}
+
+    def _required(self, target):
+        """Étapes nécessaires pour produire `target` (l'étape et ses ancêtres)."""
+        by_name = {stage.name: stage for stage in self.stages}
+        required, pending = set(), [target]
+        while pending:
+            name = pending.pop()
+            if name not in by_name:
+                raise ValueError(f"Étape inconnue : {name}")
+            if name not in required:
+                required.add(name)
+                pending.extend(by_name[name].after)
+        return required
+
+    def run(self, force=(), until=None):
+        """Exécute les étapes nécessaires, dans l'ordre ; `force` relance des étapes nommées.
+
+        Avec `until`, seules l'étape nommée et celles dont elle dépend sont considérées.
+        """
+        required = self._required(until) if until else {stage.name for stage in self.stages}
+        self.report = []
+        for stage in self.stages:
+            if stage.name not in required:
+                continue
+            inputs = stage.resolve(stage.inputs)
+            key = self._stage_key(stage, inputs)
+            outputs = stage.resolve(stage.outputs)
+
+            if stage.name not in force and self._is_up_to_date(stage, key, outputs):
+                progress(f"[{stage.name}] à jour")
+                count('stages_cached')
+                self.report.append({'stage': stage.name, 'status': 'cached', 'seconds': 0.0})
+            else:
+                progress(f"[{stage.name}] exécution...")
+                started = time.perf_counter()
+                status = 'done'
+                with span(stage.name, kind='stage') as stage_span:
+                    try:
+                        stage.run(stage)
+                    except Exception as e:
+                        if not stage.optional:
+                            raise
+                        # Comme build_graph.py : sans MNT, on continue sans élévation
+                        progress(f"[{stage.name}] échec : {e}")
+                        self._discard_outputs(stage.resolve(stage.outputs))
+                        if stage.name == 'elevation':
+                            progress("Utilisation du réseau sans information d'élévation.")
+                        status = 'failed'
+                    stage_span.set(status=status)
+                seconds = time.perf_counter() - started
+                outputs = stage.resolve(stage.outputs)
+                self.manifest.stages[stage.name] = {
+                    'status': status,
+                    'key': key,
+                    'params': stage.params,
+                    'outputs': {str(path): self.manifest.fingerprint(path) for path in outputs},
+                    'seconds': seconds,
+                    'completed': datetime.now().isoformat(timespec='seconds'),
+                }
+                self.manifest.save()
+                self.report.append({'stage': stage.name, 'status': status, 'seconds': seconds})
+                progress(f"[{stage.name}] terminé en {seconds:.1f} s")
+
+        return self.report
+
+    def load_graph(self):
+        """Graphe compact final (mappé en mémoire) et son index d'accrochage."""
+        builder = GraphBuilder(self.processed_data_dir, cost_model=self.cost_model)
+        graph = builder.load_compact_graph(self.processed_data_dir / "routing_graph")
+        return graph, SnapIndex.load(self.processed_data_dir / "routing_graph", graph)
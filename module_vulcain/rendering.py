@@ -0,0 +1,444 @@
+# rando_sim/rendering.py
+import argparse
+import json
+import math
+import os
+from pathlib import Path
+
+import matplotlib
+import matplotlib.image
+import matplotlib.pyplot as plt
+import numpy as np
+import shapely
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_hex, to_rgba
+from matplotlib.lines import Line2D
+from pyproj import Transformer
+
+from compact_graph import CompactGraph, LazyGeometries
+from instrumentation import count, progress, span
+
+TILE_SIZE = 256
+# Demi-côté du monde en Web Mercator (EPSG:3857), origine des tuiles XYZ en haut à gauche
+WEB_MERCATOR_EXTENT = 20037508.342789244
+# Les tuiles sont rendues par blocs de BLOCK_TILES x BLOCK_TILES (mémoire bornée par bloc)
+BLOCK_TILES = 4
+# Une grande image est rendue par bandes de BAND_ROWS lignes (mémoire bornée par bande)
+BAND_ROWS = 512
+# Segments décodés / projetés par lot, et échantillons de pixels accumulés par lot
+CHUNK_SEGMENTS = 100_000
+CHUNK_SAMPLES = 1_000_000
+
+# Couleurs des types de surface de surface_rules.json (les autres prennent la palette tab10)
+SURFACE_COLORS = {
+    'sentier_balisé': '#c0392b',
+    'chemin': '#d68910',
+    'piste': '#7d6608',
+    'route': '#2c3e50',
+    'hors_sentier': '#a569bd',
+    'zone_rocheuse': '#7f8c8d',
+    'cours_eau': '#2e86c1',
+}
+MISSING_COLOR = '#b3b3b3'
+# Colonnes numériques particulières : (colonne source, palette, min, max, unité)
+SLOPE_STYLE = ('slope_percent', 'magma_r', 0.0, 30.0, '%')
+# Colonnes de coût, ramenées au kilomètre pour être comparables d'une arête à l'autre
+COST_PREFIXES = ('time', 'effort')
+DEFAULT_CMAP = 'viridis_r'
+
+
+def _rgba_bytes(color):
+    return np.array([round(255 * channel) for channel in to_rgba(color)], dtype=np.uint8)
+
+
+class Canvas:
+    """Image accumulée segment par segment : couleur moyenne des segments passant par chaque pixel.
+
+    Les segments (coordonnées relatives à l'origine de la mise en page) sont échantillonnés
+    à raison d'un point par pixel traversé ; seules les sommes par pixel sont gardées, en
+    entiers 32 bits (les couleurs sont des octets). Chaque lot n'écrit que les pixels qu'il
+    touche : les pages des zones vides de l'image ne sont jamais allouées.
+
+    Avec `first_row`, le canevas ne couvre qu'une bande de l'image commençant à cette ligne
+    (les lignes restent calculées depuis `top`, comme pour l'image entière).
+    """
+
+    def __init__(self, left, top, pixel, width, height, first_row=0):
+        self.left = left
+        self.top = top
+        self.pixel = pixel
+        self.width = width
+        self.height = height
+        self.first_row = first_row
+        self.sums = np.zeros((3, width * height), dtype=np.uint32)
+        self.counts = np.zeros(width * height, dtype=np.uint32)
+
+    def add(self, x0, y0, x1, y1, colors):
+        col0, row0 = (x0 - self.left) / self.pixel, (self.top - y0) / self.pixel
+        dcol, drow = (x1 - x0) / self.pixel, (y0 - y1) / self.pixel
+        # Un échantillon par pixel de longueur (au moins les deux extrémités)
+        n = np.ceil(np.maximum(np.abs(dcol), np.abs(drow))).astype(np.int64) + 1
+        ends = np.cumsum(n)
+        start = 0
+        while start < len(n):
+            # Lots d'au plus CHUNK_SAMPLES échantillons (au moins un segment)
+            stop = max(int(np.searchsorted(ends, ends[start] - n[start] + CHUNK_SAMPLES, side='right')), start + 1)
+            self._add_samples(col0[start:stop], row0[start:stop], dcol[start:stop], drow[start:stop],
+                              n[start:stop], colors[start:stop])
+            start = stop
+
+    def _add_samples(self, col0, row0, dcol, drow, n, colors):
+        segment = np.repeat(np.arange(len(n)), n)
+        first = np.repeat(np.cumsum(n) - n, n)
+        t = (np.arange(len(segment)) - first) / np.maximum(n - 1, 1)[segment]
+        cols = np.floor(col0[segment] + t * dcol[segment]).astype(np.int64)
+        rows = np.floor(row0[segment] + t * drow[segment]).astype(np.int64) - self.first_row
+        inside = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+        pixels, segment = rows[inside] * self.width + cols[inside], segment[inside]
+        # Réduction sur les seuls pixels touchés par le lot (pas de tableau de la taille de l'image)
+        hit, sample_pixel = np.unique(pixels, return_inverse=True)
+        for channel in range(3):
+            self.sums[channel, hit] += np.bincount(sample_pixel, weights=colors[segment, channel],
+                                                   minlength=len(hit)).astype(np.uint32)
+        self.counts[hit] += np.bincount(sample_pixel, minlength=len(hit)).astype(np.uint32)
+        count('render_samples', len(pixels))
+
+    def to_rgba(self, line_width=1):
+        hit = np.flatnonzero(self.counts)
+        counts = self.counts[hit]
+        rgba = np.zeros((self.width * self.height, 4), dtype=np.uint8)
+        for channel in range(3):
+            # Moyenne arrondie en arithmétique entière
+            rgba[hit, channel] = (self.sums[channel, hit] + counts // 2) // counts
+        rgba[hit, 3] = 255
+        rgba = rgba.reshape(self.height, self.width, 4)
+        # Épaississement : les pixels vides prennent la couleur d'un voisin tracé
+        for _ in range(max(int(line_width), 1) - 1):
+            filled = rgba.copy()
+            for source, target in (((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+                                   ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                                   ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+                                   ((slice(None, -1), slice(None)), (slice(1, None), slice(None)))):
+                empty = filled[target][..., 3] == 0
+                filled[target][empty] = rgba[source][empty]
+            rgba = filled
+        return rgba
+
+
+class NetworkRenderer:
+    """Rendu du réseau complet (ou d'une emprise) à partir des tableaux du graphe compact.
+
+    Chaque segment est coloré selon une colonne des arêtes de son sens aller : colonne
+    catégorielle (`surface_type`), `slope` (pente nette absolue), coût (`time`, `effort`,
+    `time_<profil>`..., ramené au kilomètre) ou toute autre colonne numérique.
+    """
+
+    def __init__(self, graph, color_by='surface_type', crs='EPSG:2154', cmap=None, vmin=None, vmax=None):
+        self.graph = graph
+        self.color_by = color_by
+        self.crs = crs
+        self.colors, self.legend = self._segment_colors(cmap, vmin, vmax)
+        self._layouts = {}
+
+    @classmethod
+    def load(cls, directory, **kwargs):
+        return cls(CompactGraph.load(directory), **kwargs)
+
+    # --- Couleurs ----------------------------------------------------------------------
+
+    def _segment_edges(self):
+        """Arête représentant chaque segment : le sens aller, à défaut le sens retour (-1 sans arête)."""
+        graph = self.graph
+        edges = np.full(len(graph.segment_labels), -1, dtype=np.int64)
+        reversed_edges = np.flatnonzero(graph.edge_reversed)
+        edges[graph.segment_ids[reversed_edges]] = reversed_edges
+        forward_edges = np.flatnonzero(~np.asarray(graph.edge_reversed))
+        edges[graph.segment_ids[forward_edges]] = forward_edges
+        return edges
+
+    def _segment_values(self, edges):
+        data = self.graph.edge_data
+        if self.color_by == 'slope':
+            column, cmap, vmin, vmax, unit = SLOPE_STYLE
+            if column not in data:
+                raise ValueError("Le graphe n'a pas de pente (construit sans MNT)")
+            return np.abs(data[column][edges].astype(np.float64)), cmap, vmin, vmax, unit
+        if self.color_by not in data:
+            raise ValueError(f"Colonne inconnue pour la coloration : {self.color_by}")
+        values = data[self.color_by][edges].astype(np.float64)
+        unit = None
+        if self.color_by.startswith(COST_PREFIXES) and 'distance' in data:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = values * 1000.0 / data['distance'][edges]
+            unit = '/km'
+        return values, DEFAULT_CMAP, None, None, unit
+
+    def _segment_colors(self, cmap=None, vmin=None, vmax=None):
+        """Couleur RGBA (octets) de chaque segment, et légende correspondante."""
+        edges = self._segment_edges()
+        valid = edges >= 0
+        colors = np.zeros((len(edges), 4), dtype=np.uint8)
+
+        if self.color_by in self.graph.edge_categories:
+            codes, labels = self.graph.edge_categories[self.color_by]
+            tab10 = matplotlib.colormaps['tab10']
+            legend = {label: SURFACE_COLORS.get(label, to_hex(tab10(i % 10))) for i, label in enumerate(labels)}
+            # Le code -1 (valeur manquante) pointe sur la dernière couleur
+            palette = np.array([_rgba_bytes(color) for color in legend.values()] + [_rgba_bytes(MISSING_COLOR)])
+            colors[valid] = palette[np.asarray(codes)[edges[valid]]]
+            return colors, {'column': self.color_by, 'categories': legend}
+
+        values, default_cmap, default_vmin, default_vmax, unit = self._segment_values(edges[valid])
+        finite = values[np.isfinite(values)]
+        # Sans bornes imposées, les percentiles 2 et 98 écartent les valeurs extrêmes
+        if vmin is None:
+            vmin = default_vmin if default_vmin is not None else float(np.percentile(finite, 2)) if len(finite) else 0.0
+        if vmax is None:
+            vmax = default_vmax if default_vmax is not None else float(np.percentile(finite, 98)) if len(finite) else 1.0
+        cmap = cmap or default_cmap
+        # Les valeurs NaN prennent la couleur « bad » de la palette (transparente)
+        colors[valid] = matplotlib.colormaps[cmap]((values - vmin) / max(vmax - vmin, 1e-9), bytes=True)
+        return colors, {'column': self.color_by, 'cmap': cmap, 'vmin': vmin, 'vmax': vmax, 'unit': unit}
+
+    # --- Coordonnées -------------------------------------------------------------------
+
+    def _geometries(self, start, stop):
+        geometries = self.graph.geometries
+        if isinstance(geometries, LazyGeometries):
+            offsets = geometries.offsets[start:stop + 1]
+            chunks = [geometries.wkb_buffer[a:b].tobytes() if b > a else None
+                      for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+            return shapely.from_wkb(np.array(chunks, dtype=object))
+        # Géométries assemblées à la demande (chaînes contractées) : décodées une fois
+        if not hasattr(self, '_all_geometries'):
+            self._all_geometries = self.graph.geometry_array()
+        return self._all_geometries[start:stop]
+
+    def _layout(self, to_crs=None):
+        """Sommets de tous les segments, projetés dans `to_crs` (float32, relatifs à une origine).
+
+        Renvoie (origine, sommets (n, 2), offsets des sommets par segment, emprises des segments).
+        Décodage et projection par lots de CHUNK_SEGMENTS : seuls les tableaux finaux sont gardés.
+        """
+        key = to_crs or self.crs
+        if key in self._layouts:
+            return self._layouts[key]
+
+        transformer = Transformer.from_crs(self.crs, to_crs, always_xy=True) if key != self.crs else None
+        graph = self.graph
+        origin = (float(graph.x.min()), float(graph.y.min())) if graph.n_nodes else (0.0, 0.0)
+        if transformer is not None:
+            origin = tuple(float(value) for value in transformer.transform(*origin))
+
+        n_segments = len(self.colors)
+        vertex_counts = np.zeros(n_segments, dtype=np.int64)
+        bboxes = np.full((n_segments, 4), np.nan, dtype=np.float32)
+        chunks = []
+        with span('layout', crs=key, segments=n_segments):
+            for start in range(0, n_segments, CHUNK_SEGMENTS):
+                stop = min(start + CHUNK_SEGMENTS, n_segments)
+                coords, owner = shapely.get_coordinates(self._geometries(start, stop), return_index=True)
+                if transformer is not None:
+                    coords = np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+                coords = (coords - origin).astype(np.float32)
+                counts = np.bincount(owner, minlength=stop - start)
+                vertex_counts[start:stop] = counts
+                drawn = np.flatnonzero(counts)
+                if len(drawn):
+                    firsts = (np.cumsum(counts) - counts)[drawn]
+                    bboxes[start + drawn, :2] = np.minimum.reduceat(coords, firsts)
+                    bboxes[start + drawn, 2:] = np.maximum.reduceat(coords, firsts)
+                chunks.append(coords)
+        offsets = np.zeros(n_segments + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(vertex_counts)
+        vertices = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype=np.float32)
+        self._layouts[key] = (origin, vertices, offsets, bboxes)
+        return self._layouts[key]
+
+    @staticmethod
+    def _select(bboxes, candidates, left, bottom, right, top):
+        """Segments (parmi `candidates`) dont l'emprise touche le rectangle (coordonnées relatives)."""
+        boxes = bboxes[candidates]
+        keep = (boxes[:, 0] <= right) & (boxes[:, 2] >= left) & (boxes[:, 1] <= top) & (boxes[:, 3] >= bottom)
+        return candidates[keep]
+
+    def _pairs(self, layout, segments):
+        """Sommets consécutifs des segments donnés : (x0, y0, x1, y1, couleurs), en coordonnées relatives."""
+        _, vertices, offsets, _ = layout
+        segments = segments[self.colors[segments, 3] > 0]
+        starts = offsets[segments]
+        n_pairs = np.maximum(offsets[segments + 1] - starts - 1, 0)
+        first = np.repeat(starts - (np.cumsum(n_pairs) - n_pairs), n_pairs) + np.arange(n_pairs.sum())
+        a, b = vertices[first].astype(np.float64), vertices[first + 1].astype(np.float64)
+        return a[:, 0], a[:, 1], b[:, 0], b[:, 1], np.repeat(self.colors[segments], n_pairs, axis=0)
+
+    def _paint(self, canvas, layout, segments):
+        for start in range(0, len(segments), CHUNK_SEGMENTS):
+            canvas.add(*self._pairs(layout, segments[start:start + CHUNK_SEGMENTS]))
+
+    def bounds(self, to_crs=None):
+        """Emprise (xmin, ymin, xmax, ymax) du réseau dans `to_crs` (par défaut, celui du graphe)."""
+        origin, _, _, bboxes = self._layout(to_crs)
+        if not np.isfinite(bboxes).any():
+            raise ValueError("Le graphe n'a aucune géométrie à dessiner")
+        return (float(np.nanmin(bboxes[:, 0])) + origin[0], float(np.nanmin(bboxes[:, 1])) + origin[1],
+                float(np.nanmax(bboxes[:, 2])) + origin[0], float(np.nanmax(bboxes[:, 3])) + origin[1])
+
+    # --- Rendus ------------------------------------------------------------------------
+
+    def render(self, output_file=None, bounds=None, width=2048, line_width=1, background=None):
+        """Image RGBA du réseau (ou de l'emprise `bounds`, dans le système du graphe), écrite en PNG si demandé.
+
+        Le coût est proportionnel au nombre de sommets et de pixels. L'image est accumulée par
+        bandes de BAND_ROWS lignes : au-delà de l'image RGBA elle-même, la mémoire est celle d'une bande.
+        """
+        layout = self._layout()
+        origin, _, _, bboxes = layout
+        xmin, ymin, xmax, ymax = bounds if bounds is not None else self.bounds()
+        pixel = max(xmax - xmin, ymax - ymin, 1e-9) / width
+        width, height = max(1, math.ceil((xmax - xmin) / pixel)), max(1, math.ceil((ymax - ymin) / pixel))
+
+        with span('render', color_by=self.color_by, width=width, height=height):
+            left, bottom = xmin - origin[0], ymin - origin[1]
+            top = bottom + height * pixel
+            right = left + width * pixel
+            segments = self._select(bboxes, np.arange(len(bboxes)), left, bottom, right, top)
+            rgba = np.zeros((height, width, 4), dtype=np.uint8)
+            if background is not None:
+                # Fond opaque : les pixels vides gardent la couleur de fond
+                rgba[...] = _rgba_bytes(background)
+            # Marge en lignes autour de chaque bande pour que l'épaississement ne coupe pas les traits
+            margin = max(int(line_width), 1)
+            for row0 in range(0, height, BAND_ROWS):
+                rows = min(BAND_ROWS, height - row0)
+                band_top, band_bottom = top - (row0 - margin) * pixel, top - (row0 + rows + margin) * pixel
+                band_segments = self._select(bboxes, segments, left, band_bottom, right, band_top)
+                if len(band_segments) == 0:
+                    continue
+                canvas = Canvas(left, top, pixel, width, rows + 2 * margin, first_row=row0 - margin)
+                self._paint(canvas, layout, band_segments)
+                band = canvas.to_rgba(line_width)[margin:margin + rows]
+                np.copyto(rgba[row0:row0 + rows], band, where=band[..., 3:] > 0)
+        if output_file:
+            matplotlib.image.imsave(output_file, rgba)
+            progress(f"Réseau dessiné dans {output_file} ({len(segments)} segments, {width} x {height} px)")
+        return rgba
+
+    def plot(self, ax=None, bounds=None, linewidth=0.8, legend=True):
+        """Dessin vectoriel (LineCollection) des segments de l'emprise ; adapté aux vues locales et exports SVG/PDF."""
+        layout = self._layout()
+        origin, _, _, bboxes = layout
+        xmin, ymin, xmax, ymax = bounds if bounds is not None else self.bounds()
+        segments = self._select(bboxes, np.arange(len(bboxes)), xmin - origin[0], ymin - origin[1],
+                                xmax - origin[0], ymax - origin[1])
+        x0, y0, x1, y1, colors = self._pairs(layout, segments)
+        lines = np.stack([np.column_stack([x0, y0]), np.column_stack([x1, y1])], axis=1) + origin
+
+        if ax is None:
+            _, ax = plt.subplots(figsize=(12, 10))
+        ax.add_collection(LineCollection(lines, colors=colors / 255.0, linewidths=linewidth))
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
+        ax.set_aspect('equal')
+        if legend and 'categories' in self.legend:
+            ax.legend(handles=[Line2D([], [], color=color, label=label)
+                               for label, color in self.legend['categories'].items()], loc='lower right')
+        elif legend:
+            norm = matplotlib.colors.Normalize(self.legend['vmin'], self.legend['vmax'])
+            label = f"{self.legend['column']} ({self.legend['unit']})" if self.legend['unit'] else self.legend['column']
+            ax.figure.colorbar(matplotlib.cm.ScalarMappable(norm=norm, cmap=self.legend['cmap']), ax=ax, label=label)
+        return ax
+
+    def write_tiles(self, directory, min_zoom=8, max_zoom=15, line_width=1, block_tiles=BLOCK_TILES):
+        """Écrit une pyramide de tuiles PNG XYZ (EPSG:3857) : directory/{z}/{x}/{y}.png.
+
+        Les tuiles sont rendues par blocs de `block_tiles` x `block_tiles` ; les segments candidats
+        d'un bloc sont cherchés parmi ceux du bloc parent, et les tuiles vides ne sont pas écrites.
+        Un fichier tiles.json décrit la pyramide (zooms, emprise en degrés, légende).
+        """
+        directory = Path(directory)
+        layout = self._layout('EPSG:3857')
+        origin, _, _, bboxes = layout
+        xmin, ymin, xmax, ymax = self.bounds('EPSG:3857')
+        # Marge en pixels autour de chaque bloc pour que l'épaississement ne coupe pas les traits
+        margin = max(int(line_width), 1)
+        block_pixels = block_tiles * TILE_SIZE
+        written = 0
+
+        def render_block(zoom, bx, by, candidates):
+            nonlocal written
+            tile = 2 * WEB_MERCATOR_EXTENT / 2 ** zoom
+            pixel = tile / TILE_SIZE
+            left = -WEB_MERCATOR_EXTENT + bx * block_tiles * tile - origin[0]
+            top = WEB_MERCATOR_EXTENT - by * block_tiles * tile - origin[1]
+            right, bottom = left + block_tiles * tile, top - block_tiles * tile
+            candidates = self._select(bboxes, candidates, left - margin * pixel, bottom - margin * pixel,
+                                      right + margin * pixel, top + margin * pixel)
+            if len(candidates) == 0:
+                return
+
+            canvas = Canvas(left - margin * pixel, top + margin * pixel, pixel,
+                            block_pixels + 2 * margin, block_pixels + 2 * margin)
+            self._paint(canvas, layout, candidates)
+            image = canvas.to_rgba(line_width)[margin:-margin, margin:-margin]
+            n_tiles = 0
+            for i in range(block_tiles):
+                for j in range(block_tiles):
+                    x, y = bx * block_tiles + i, by * block_tiles + j
+                    if not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+                        continue
+                    pixels = image[j * TILE_SIZE:(j + 1) * TILE_SIZE, i * TILE_SIZE:(i + 1) * TILE_SIZE]
+                    if not pixels[..., 3].any():
+                        continue
+                    path = directory / str(zoom) / str(x) / f"{y}.png"
+                    os.makedirs(path.parent, exist_ok=True)
+                    matplotlib.image.imsave(path, pixels)
+                    n_tiles += 1
+            written += n_tiles
+            count('tiles_written', n_tiles)
+
+            # Un bloc couvre quatre blocs de même taille au zoom suivant
+            if zoom < max_zoom:
+                for child_x in (2 * bx, 2 * bx + 1):
+                    for child_y in (2 * by, 2 * by + 1):
+                        render_block(zoom + 1, child_x, child_y, candidates)
+
+        with span('tiles', color_by=self.color_by, min_zoom=min_zoom, max_zoom=max_zoom):
+            tile = 2 * WEB_MERCATOR_EXTENT / 2 ** min_zoom
+            block = block_tiles * tile
+            all_segments = np.arange(len(bboxes))
+            for bx in range(int((xmin + WEB_MERCATOR_EXTENT) // block), int((xmax + WEB_MERCATOR_EXTENT) // block) + 1):
+                for by in range(int((WEB_MERCATOR_EXTENT - ymax) // block),
+                                int((WEB_MERCATOR_EXTENT - ymin) // block) + 1):
+                    render_block(min_zoom, bx, by, all_segments)
+
+        to_degrees = Transformer.from_crs('EPSG:3857', 'EPSG:4326', always_xy=True)
+        (lon0, lon1), (lat0, lat1) = to_degrees.transform([xmin, xmax], [ymin, ymax])
+        os.makedirs(directory, exist_ok=True)
+        with open(directory / "tiles.json", 'w') as f:
+            json.dump({'min_zoom': min_zoom, 'max_zoom': max_zoom, 'bounds': [lon0, lat0, lon1, lat1],
+                       'tiles': written, 'legend': self.legend}, f, ensure_ascii=False, indent=2)
+        progress(f"{written} tuiles écrites dans {directory} (zooms {min_zoom} à {max_zoom})")
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendu du réseau : image d'ensemble et pyramide de tuiles")
+    parser.add_argument('--graph', default="./data/processed/routing_graph")
+    parser.add_argument('--color-by', nargs='+', default=['surface_type'],
+                        help="surface_type, slope, time, effort, time_<profil>... (un rendu par valeur)")
+    parser.add_argument('--image', action='store_true', help="Écrit network_<couleur>.png à côté du graphe")
+    parser.add_argument('--width', type=int, default=4096)
+    parser.add_argument('--bounds', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'))
+    parser.add_argument('--tiles', help="Répertoire de la pyramide (un sous-répertoire par coloration)")
+    parser.add_argument('--min-zoom', type=int, default=8)
+    parser.add_argument('--max-zoom', type=int, default=15)
+    args = parser.parse_args()
+
+    graph = CompactGraph.load(args.graph)
+    for color_by in args.color_by:
+        renderer = NetworkRenderer(graph, color_by=color_by)
+        if args.image:
+            renderer.render(Path(args.graph).parent / f"network_{color_by}.png", bounds=args.bounds, width=args.width)
+        if args.tiles:
+            renderer.write_tiles(Path(args.tiles) / color_by, min_zoom=args.min_zoom, max_zoom=args.max_zoom)
@@ -0,0 +1,251 @@
+# rando_sim/routing.py
+import heapq
+import math
+
+import numpy as np
+import shapely
+
+from cost_model import CostModel
+
+# Colonnes de coûts totalisées le long d'un itinéraire
+ROUTE_TOTALS = ('distance', 'time', 'effort')
+
+
+def dijkstra(offsets, targets, weights, sources, cutoff=None, stop_at=None):
+    """Dijkstra multi-sources sur un graphe CSR donné sous forme de listes Python.
+
+    `sources` est une liste de nœuds (coût initial nul) ou un dictionnaire nœud -> coût initial.
+    Renvoie (coûts des nœuds fixés, arête prédécesseur de chaque nœud atteint).
+    """
+    cutoff = math.inf if cutoff is None else cutoff
+    remaining = set(stop_at) if stop_at is not None else None
+
+    if isinstance(sources, dict):
+        dist = dict(sources)
+    else:
+        dist = {source: 0.0 for source in np.atleast_1d(sources).tolist()}
+    heap = [(d, node) for node, d in dist.items()]
+    heapq.heapify(heap)
+    pred_edge = {}
+    settled = {}
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled[u] = d
+        if remaining is not None:
+            remaining.discard(u)
+            if not remaining:
+                break
+        for edge in range(offsets[u], offsets[u + 1]):
+            v = targets[edge]
+            candidate = d + weights[edge]
+            if candidate <= cutoff and candidate < dist.get(v, math.inf):
+                dist[v] = candidate
+                pred_edge[v] = edge
+                heapq.heappush(heap, (candidate, v))
+    return settled, pred_edge
+
+
+class Route:
+    """Itinéraire calculé : nœuds, arêtes parcourues, coût total et géométrie fusionnée."""
+
+    def __init__(self, graph, nodes, edges, weight, cost):
+        self.graph = graph
+        self.nodes = nodes
+        self.edges = edges
+        self.weight = weight
+        self.cost = cost
+
+    @property
+    def totals(self):
+        """Totaux de distance, temps et effort (et du poids utilisé) le long de l'itinéraire."""
+        edges = np.asarray(self.edges, dtype=np.int64)
+        totals = {}
+        for name in ROUTE_TOTALS + (self.weight,):
+            if name in self.graph.edge_data:
+                totals[name] = float(self.graph.edge_data[name][edges].astype(np.float64).sum())
+        return totals
+
+    @property
+    def geometry(self):
+        """Géométrie de l'itinéraire : segments orientés dans le sens de parcours et mis bout à bout."""
+        coords = []
+        for edge in self.edges:
+            geometry = self.graph.geometry(edge)
+            if geometry is None:
+                # Sans géométrie, on relie directement les deux nœuds
+                u, v = self.graph.sources[edge], self.graph.targets[edge]
+                part = [(self.graph.x[u], self.graph.y[u]), (self.graph.x[v], self.graph.y[v])]
+            else:
+                part = shapely.get_coordinates(geometry).tolist()
+                if self.graph.edge_reversed[edge]:
+                    part.reverse()
+            # Le premier point d'une arête est le dernier de la précédente
+            coords.extend(part[1:] if coords else part)
+        if len(coords) < 2:
+            node = self.nodes[0]
+            return shapely.Point(self.graph.x[node], self.graph.y[node])
+        return shapely.LineString(coords)
+
+
+class Router:
+    """Calcul d'itinéraires point à point (A* et Dijkstra bidirectionnel) sur un CompactGraph."""
+
+    def __init__(self, graph, cost_model=None):
+        self.graph = graph
+        self.cost_model = cost_model or CostModel()
+
+        # Listes Python : l'accès élément par élément y est bien plus rapide que sur un tableau NumPy
+        self._offsets = graph.offsets.tolist()
+        self._targets = graph.targets.tolist()
+        self._x = graph.x.tolist()
+        self._y = graph.y.tolist()
+        self._weights = {}
+        self._reverse = None
+
+    def weights(self, weight):
+        """Poids des arêtes sous forme de liste (mise en cache par colonne)."""
+        if weight not in self._weights:
+            if weight not in self.graph.edge_data:
+                raise ValueError(f"Poids inconnu : {weight}")
+            self._weights[weight] = self.graph.edge_data[weight].astype(np.float64).tolist()
+        return self._weights[weight]
+
+    def reverse_adjacency(self):
+        """Arêtes entrantes de chaque nœud (CSR inverse) : offsets, sources, indices d'arêtes."""
+        if self._reverse is None:
+            order = np.argsort(self.graph.targets, kind='stable')
+            in_offsets = np.zeros(self.graph.n_nodes + 1, dtype=np.int64)
+            in_offsets[1:] = np.cumsum(np.bincount(self.graph.targets, minlength=self.graph.n_nodes))
+            self._reverse = (in_offsets.tolist(), self.graph.sources[order].tolist(), order.tolist())
+        return self._reverse
+
+    def heuristic_scale(self, weight):
+        """Coût minimal par mètre à vol d'oiseau pour un poids donné (0 si aucun minorant n'est connu).
+
+        Le temps ne peut être inférieur à la distance parcourue à la vitesse maximale du
+        profil ; les fonctions d'effort fournies majorent le temps, ce minorant vaut donc
+        aussi pour l'effort.
+        """
+        if weight == 'distance':
+            return 1.0
+        for name in self.cost_model.profiles:
+            if weight in self.cost_model.column_names(name):
+                max_speed = self.cost_model.max_speed(name)
+                return 1.0 / max_speed if max_speed > 0 else 0.0
+        return 0.0
+
+    def _route(self, source, target, pred_edge, weight, cost):
+        """Reconstruit l'itinéraire à partir des arêtes prédécesseurs."""
+        edges = []
+        node = target
+        while node != source:
+            edge = pred_edge[node]
+            edges.append(edge)
+            node = self._edge_source(edge)
+        edges.reverse()
+        nodes = [source] + [self._targets[edge] for edge in edges]
+        return Route(self.graph, nodes, edges, weight, cost)
+
+    def _edge_source(self, edge):
+        """Nœud de départ d'une arête (recherche dichotomique dans les offsets)."""
+        return int(np.searchsorted(self.graph.offsets, edge, side='right') - 1)
+
+    def astar(self, source, target, weight='time'):
+        """Plus court chemin par A*, guidé par la distance à vol d'oiseau jusqu'à la cible."""
+        offsets, targets, xs, ys = self._offsets, self._targets, self._x, self._y
+        w = self.weights(weight)
+        scale = self.heuristic_scale(weight)
+        tx, ty = xs[target], ys[target]
+
+        dist = {source: 0.0}
+        pred_edge = {}
+        closed = set()
+        heap = [(scale * math.hypot(xs[source] - tx, ys[source] - ty), 0.0, source)]
+        while heap:
+            _, g, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            if u == target:
+                return self._route(source, target, pred_edge, weight, g)
+            closed.add(u)
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = targets[edge]
+                candidate = g + w[edge]
+                if candidate < dist.get(v, math.inf):
+                    dist[v] = candidate
+                    pred_edge[v] = edge
+                    heapq.heappush(heap, (candidate + scale * math.hypot(xs[v] - tx, ys[v] - ty), candidate, v))
+
+        raise ValueError(f"Aucun itinéraire entre les nœuds {source} et {target}")
+
+    def bidirectional_dijkstra(self, source, target, weight='time'):
+        """Plus court chemin par Dijkstra bidirectionnel (recherche avant et arrière alternées)."""
+        if source == target:
+            return Route(self.graph, [source], [], weight, 0.0)
+
+        offsets, targets = self._offsets, self._targets
+        in_offsets, in_sources, in_edges = self.reverse_adjacency()
+        w = self.weights(weight)
+
+        dist = ({source: 0.0}, {target: 0.0})
+        pred = ({}, {})
+        closed = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meeting = math.inf, None
+
+        while heaps[0] and heaps[1]:
+            # Arrêt dès que les deux fronts ne peuvent plus améliorer le meilleur chemin
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, u = heapq.heappop(heaps[side])
+            if u in closed[side]:
+                continue
+            closed[side].add(u)
+
+            if side == 0:
+                neighbours = ((targets[e], e) for e in range(offsets[u], offsets[u + 1]))
+            else:
+                neighbours = ((in_sources[i], in_edges[i]) for i in range(in_offsets[u], in_offsets[u + 1]))
+
+            own, other = dist[side], dist[1 - side]
+            for v, edge in neighbours:
+                candidate = d + w[edge]
+                if candidate < own.get(v, math.inf):
+                    own[v] = candidate
+                    pred[side][v] = edge
+                    heapq.heappush(heaps[side], (candidate, v))
+                if v in other and candidate + other[v] < best:
+                    best, meeting = candidate + other[v], v
+
+        if meeting is None:
+            raise ValueError(f"Aucun itinéraire entre les nœuds {source} et {target}")
+
+        # Demi-chemin avant jusqu'au point de rencontre, puis demi-chemin arrière
+        forward = self._route(source, meeting, pred[0], weight, dist[0][meeting])
+        backward = []
+        node = meeting
+        while node != target:
+            edge = pred[1][node]
+            backward.append(edge)
+            node = targets[edge]
+        edges = forward.edges + backward
+        nodes = [source] + [targets[edge] for edge in edges]
+        return Route(self.graph, nodes, edges, weight, best)
+
+    def dijkstra(self, sources, weight='time', cutoff=None, targets=None):
+        """Dijkstra (multi-sources) : renvoie les coûts et arêtes prédécesseurs des nœuds atteints.
+
+        La recherche s'arrête au-delà de `cutoff`, ou dès que tous les `targets` sont fixés.
+        """
+        return dijkstra(self._offsets, self._targets, self.weights(weight), sources, cutoff, targets)
+
+    def route(self, source, target, weight='time', method='astar'):
+        """Calcule un itinéraire avec la méthode demandée ('astar' ou 'bidirectional')."""
+        if method == 'astar':
+            return self.astar(source, target, weight)
+        if method == 'bidirectional':
+            return self.bidirectional_dijkstra(source, target, weight)
+        raise ValueError(f"Méthode de routage inconnue : {method}")
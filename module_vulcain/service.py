@@ -0,0 +1,539 @@
+# rando_sim/service.py
+import asyncio
+import io
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from compact_graph import CompactGraph
+from cost_model import CostModel
+from isochrone import IsochroneBuilder
+from routing import Router
+from snapping import GPX_CRS, EdgeSnap, SnapIndex, read_gpx, write_gpx
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+CRITERIA = ('time', 'effort', 'distance')
+FOOTPRINTS = ('buffer', 'concave', 'convex')
+SNAP_FIELDS = ('point', 'segment', 'fraction', 'distance', 'x', 'y',
+               'start_node', 'end_node', 'forward_edge', 'reverse_edge')
+
+# Les fractions sont arrondies dans les clés de cache : deux clics à quelques centimètres
+# l'un de l'autre le long d'un même segment partagent le même résultat
+FRACTION_DIGITS = 4
+# Fenêtre de regroupement des demandes d'accrochage simultanées
+SNAP_BATCH_WINDOW_S = 0.002
+MAX_BODY_BYTES = 16 * 1024 ** 2
+
+
+# --- Processus de calcul -------------------------------------------------------------
+# Chaque processus du pool charge le graphe une fois (tableaux mappés en mémoire, donc
+# partagés par le cache du système) et garde son Router et son IsochroneBuilder.
+
+_worker = {}
+
+
+def _init_worker(directory, cost_model, graph=None, index=None):
+    graph = graph if graph is not None else CompactGraph.load(directory)
+    router = Router(graph, cost_model)
+    _worker.update(graph=graph, index=index if index is not None else SnapIndex.load(directory, graph),
+                   router=router, isochrones=IsochroneBuilder(graph, router))
+
+
+def _run_task(kind, params):
+    """Calcul d'un itinéraire ou d'une isochrone (exécuté dans le pool, résultat sérialisable)."""
+    if kind == 'route':
+        origin = EdgeSnap(*(np.atleast_1d(params['origin'][name]) for name in SNAP_FIELDS))
+        destination = EdgeSnap(*(np.atleast_1d(params['destination'][name]) for name in SNAP_FIELDS))
+        route = _worker['index'].route(_worker['router'], origin, destination, params['weight'])
+        return {'coords': shapely.get_coordinates(route.geometry), 'cost': float(route.cost), 'totals': route.totals}
+    if kind == 'isochrone':
+        isochrones = _worker['isochrones'].compute(params['origins'], params['thresholds'], weight=params['weight'],
+                                                   footprint=params['footprint'],
+                                                   buffer_distance=params['buffer_distance'])
+        return [{'threshold': float(row.threshold), 'n_nodes': int(row.n_nodes), 'n_edges': int(row.n_edges),
+                 'wkb': shapely.to_wkb(row.geometry)} for row in isochrones.itertuples()]
+    raise ValueError(f"Tâche inconnue : {kind}")
+
+
+class RequestError(ValueError):
+    """Requête invalide (réponse HTTP 400, ou `status`)."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+# --- Service -------------------------------------------------------------------------
+
+class RoutingService:
+    """Service HTTP local (asyncio, bibliothèque standard) d'itinéraires, d'isochrones et d'accrochage.
+
+    Le graphe binaire est chargé une fois au démarrage. Les points (WGS84) sont accrochés
+    dans la boucle d'événements, par lots : les demandes arrivées dans la même fenêtre de
+    quelques millisecondes partagent une seule requête vectorisée. Les recherches, coûteuses
+    en CPU, tournent dans un pool de processus (ou de threads). Les résultats sont gardés
+    dans un cache LRU indexé par les points accrochés et le profil ; une requête identique
+    à une requête en cours attend le même calcul au lieu d'en relancer un.
+
+    Points d'entrée (GET avec paramètres, ou POST d'un GPX / GeoJSON) :
+      /route      from=lon,lat&to=lon,lat (ou points=lon,lat;lon,lat;...) : itinéraire
+      /isochrone  at=lon,lat&thresholds=600,1200 : zones atteignables
+      /snap       points=lon,lat;... : points accrochés au réseau
+      /stats      compteurs du service
+    Paramètres communs : profile (pieton...), criterion (time, effort, distance), format (geojson, gpx).
+    """
+
+    def __init__(self, directory, cost_model=None, workers=None, executor='process', cache_size=1024,
+                 max_snap_distance=500.0):
+        self.directory = Path(directory)
+        self.cost_model = cost_model or CostModel()
+        self.graph = CompactGraph.load(self.directory)
+        self.index = SnapIndex.load(self.directory, self.graph)
+        self.max_snap_distance = max_snap_distance
+        self.cache_size = cache_size
+
+        workers = workers or os.cpu_count() or 1
+        if executor == 'process':
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(str(self.directory), self.cost_model))
+        elif executor == 'thread':
+            _init_worker(self.directory, self.cost_model, self.graph, self.index)
+            self.executor = ThreadPoolExecutor(workers)
+        else:
+            raise ValueError(f"Type de pool inconnu : {executor}")
+
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._pending_snaps = []
+        self._to_wgs84 = Transformer.from_crs(self.index.crs, GPX_CRS, always_xy=True)
+        self.latencies = deque(maxlen=10_000)
+        self.stats = {'requests': 0, 'errors': 0, 'cache_hits': 0, 'coalesced': 0, 'computed': 0,
+                      'snap_batches': 0, 'snapped_points': 0}
+
+    # --- Paramètres ------------------------------------------------------------------
+
+    def weight_for(self, profile=None, criterion='time'):
+        """Colonne de coût d'un profil et d'un critère (time, effort, distance)."""
+        if criterion not in CRITERIA:
+            raise RequestError(f"Critère inconnu : {criterion} (attendu : {', '.join(CRITERIA)})")
+        if criterion == 'distance':
+            return 'distance'
+        profile = profile or self.cost_model.default_profile
+        if profile not in self.cost_model.profiles:
+            raise RequestError(f"Profil inconnu : {profile} (attendu : {', '.join(self.cost_model.profiles)})")
+        time_column, effort_column = self.cost_model.column_names(profile)
+        weight = time_column if criterion == 'time' else effort_column
+        if weight not in self.graph.edge_data:
+            raise RequestError(f"Le graphe n'a pas de colonne {weight}")
+        return weight
+
+    @staticmethod
+    def _parse_points(text):
+        """'lon,lat;lon,lat' -> liste de (lon, lat)."""
+        try:
+            points = [tuple(float(value) for value in item.split(',')) for item in text.split(';') if item.strip()]
+        except ValueError:
+            raise RequestError(f"Coordonnées invalides : {text}")
+        if any(len(point) != 2 for point in points):
+            raise RequestError(f"Coordonnées invalides (lon,lat attendu) : {text}")
+        return points
+
+    @staticmethod
+    def _body_points(body, content_type):
+        """Points d'un document GPX (waypoints, sinon trace) ou GeoJSON (Points, sinon LineString)."""
+        text = body.lstrip()
+        if 'gpx' in content_type or 'xml' in content_type or text.startswith(b'<'):
+            try:
+                gpx = read_gpx(io.BytesIO(body))
+            except Exception as error:
+                raise RequestError(f"GPX illisible : {error}")
+            if len(gpx['waypoints']) >= 2 or not gpx['tracks']:
+                return [(lon, lat) for _, lon, lat in gpx['waypoints']]
+            return [tuple(point) for point in gpx['tracks'][0][1].tolist()]
+
+        try:
+            document = json.loads(body)
+        except ValueError as error:
+            raise RequestError(f"GeoJSON illisible : {error}")
+        features = document.get('features', [document]) if isinstance(document, dict) else []
+        if not isinstance(features, list):
+            raise RequestError("GeoJSON invalide : `features` doit être une liste")
+        geometries = [feature.get('geometry', feature) for feature in features if isinstance(feature, dict)]
+        points, lines = [], []
+        for geometry in geometries:
+            if not isinstance(geometry, dict):
+                continue
+            if geometry.get('type') == 'Point':
+                points.append(RoutingService._position(geometry.get('coordinates')))
+            elif geometry.get('type') == 'LineString':
+                coordinates = geometry.get('coordinates')
+                if not isinstance(coordinates, list):
+                    raise RequestError(f"LineString GeoJSON invalide : {coordinates!r}")
+                lines.append([RoutingService._position(position) for position in coordinates])
+        if len(points) >= 2:
+            return points
+        return lines[0] if lines else points
+
+    @staticmethod
+    def _position(position):
+        """Position GeoJSON [lon, lat(, alt)] -> (lon, lat)."""
+        if (not isinstance(position, list) or len(position) < 2
+                or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in position[:2])):
+            raise RequestError(f"Position GeoJSON invalide : {position!r}")
+        return float(position[0]), float(position[1])
+
+    def _points(self, query, body, content_type, names=('points',)):
+        points = []
+        for name in names:
+            for value in query.get(name, []):
+                points += self._parse_points(value)
+        if not points and body:
+            points = self._body_points(body, content_type)
+        return points
+
+    # --- Accrochage par lots ---------------------------------------------------------
+
+    async def snap(self, points):
+        """Accroche des points (lon, lat) ; renvoie un EdgeSnap par point (erreur si trop loin du réseau)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_snaps.append((points, future))
+        if len(self._pending_snaps) == 1:
+            loop.call_later(SNAP_BATCH_WINDOW_S, self._flush_snaps)
+        return await future
+
+    def _flush_snaps(self):
+        batch, self._pending_snaps = self._pending_snaps, []
+        coords = np.array([point for points, _ in batch for point in points], dtype=np.float64).reshape(-1, 2)
+        try:
+            snap = self.index.nearest_edge(coords[:, 0], coords[:, 1], crs=GPX_CRS,
+                                           max_distance=self.max_snap_distance)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.stats['snap_batches'] += 1
+        self.stats['snapped_points'] += len(coords)
+
+        # Un seul résultat par point (le premier en cas d'égalité), rangé par point d'entrée
+        by_point = np.full(len(coords), -1, dtype=np.int64)
+        by_point[snap.point[::-1]] = np.arange(len(snap))[::-1]
+        start = 0
+        for points, future in batch:
+            rows = by_point[start:start + len(points)]
+            start += len(points)
+            if future.done():
+                continue
+            if (rows < 0).any():
+                far = int(np.flatnonzero(rows < 0)[0])
+                future.set_exception(RequestError(
+                    f"Le point {points[far]} est à plus de {self.max_snap_distance:g} m du réseau"))
+            else:
+                future.set_result([snap[int(row)] for row in rows])
+
+    # --- Cache et regroupement des calculs -------------------------------------------
+
+    async def _compute(self, key, kind, params):
+        """Résultat d'une tâche : depuis le cache, depuis un calcul identique en cours, ou calculé dans le pool."""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return self._cache[key]
+        if key in self._inflight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, _run_task, kind, params)
+        self._inflight[key] = future
+        try:
+            # shield : un client qui se déconnecte n'annule pas le calcul attendu par les autres
+            result = await asyncio.shield(future)
+        finally:
+            del self._inflight[key]
+        self.stats['computed'] += 1
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _snap_key(snap):
+        return int(snap.segment[0]), round(float(snap.fraction[0]), FRACTION_DIGITS)
+
+    @staticmethod
+    def _snap_params(snap):
+        return {name: getattr(snap, name)[0].item() for name in SNAP_FIELDS}
+
+    def _wgs84(self, coords):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        lon, lat = self._to_wgs84.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack([lon, lat])
+
+    # --- Points d'entrée -------------------------------------------------------------
+
+    async def route(self, points, profile=None, criterion='time'):
+        """Itinéraire passant par les points (lon, lat) dans l'ordre : coordonnées WGS84 et totaux."""
+        if len(points) < 2:
+            raise RequestError("Un itinéraire demande au moins deux points")
+        weight = self.weight_for(profile, criterion)
+        snaps = await self.snap(points)
+
+        async def leg(origin, destination):
+            key = ('route', weight) + self._snap_key(origin) + self._snap_key(destination)
+            params = {'weight': weight, 'origin': self._snap_params(origin),
+                      'destination': self._snap_params(destination)}
+            try:
+                return await self._compute(key, 'route', params)
+            except ValueError as error:
+                raise RequestError(str(error), HTTPStatus.NOT_FOUND)
+
+        legs = await asyncio.gather(*(leg(a, b) for a, b in zip(snaps[:-1], snaps[1:])))
+        coords = np.concatenate([legs[0]['coords']] + [part['coords'][1:] for part in legs[1:]])
+        totals = {}
+        for part in legs:
+            for name, value in part['totals'].items():
+                totals[name] = totals.get(name, 0.0) + value
+        return {'coords': self._wgs84(coords), 'cost': sum(part['cost'] for part in legs), 'weight': weight,
+                'totals': totals, 'snapped': [(float(s.x[0]), float(s.y[0])) for s in snaps]}
+
+    async def isochrone(self, points, thresholds, profile=None, criterion='time', footprint='buffer',
+                        buffer_distance=50.0):
+        """Isochrones depuis les nœuds les plus proches des points (lon, lat), pour plusieurs seuils."""
+        if not points:
+            raise RequestError("Une isochrone demande au moins un point de départ")
+        if not thresholds:
+            raise RequestError("Aucun seuil demandé")
+        if footprint not in FOOTPRINTS:
+            raise RequestError(f"Emprise inconnue : {footprint} (attendu : {', '.join(FOOTPRINTS)})")
+        weight = self.weight_for(profile, criterion)
+        coords = np.array(points, dtype=np.float64)
+        nodes, distances = self.index.nearest_node(coords[:, 0], coords[:, 1], crs=GPX_CRS,
+                                                   max_distance=self.max_snap_distance)
+        if (nodes < 0).any():
+            raise RequestError(f"Point à plus de {self.max_snap_distance:g} m du réseau")
+
+        origins = sorted(set(nodes.tolist()))
+        thresholds = tuple(sorted(set(float(t) for t in thresholds)))
+        key = ('isochrone', weight, tuple(origins), thresholds, footprint, float(buffer_distance))
+        rows = await self._compute(key, 'isochrone', {'origins': origins, 'thresholds': list(thresholds),
+                                                      'weight': weight, 'footprint': footprint,
+                                                      'buffer_distance': float(buffer_distance)})
+        to_wgs84 = self._to_wgs84
+        return [{**{name: row[name] for name in ('threshold', 'n_nodes', 'n_edges')}, 'weight': weight,
+                 'geometry': shapely.transform(shapely.from_wkb(row['wkb']),
+                                               lambda c: np.column_stack(to_wgs84.transform(c[:, 0], c[:, 1])))}
+                for row in rows]
+
+    # --- Formats de sortie -----------------------------------------------------------
+
+    @staticmethod
+    def _geojson(features):
+        return json.dumps({'type': 'FeatureCollection', 'features': features}, ensure_ascii=False)
+
+    def _route_response(self, result, fmt):
+        if fmt == 'gpx':
+            return 'application/gpx+xml', write_gpx(tracks=[(f"Itinéraire ({result['weight']})", result['coords'])])
+        feature = {
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': np.round(result['coords'], 7).tolist()},
+            'properties': {'weight': result['weight'], 'cost': result['cost'], **result['totals']},
+        }
+        return 'application/geo+json', self._geojson([feature])
+
+    def _isochrone_response(self, rows, fmt):
+        if fmt == 'gpx':
+            raise RequestError("Les isochrones ne sont disponibles qu'en GeoJSON")
+        features = [{'type': 'Feature', 'geometry': json.loads(shapely.to_geojson(row['geometry'])),
+                     'properties': {name: row[name] for name in ('threshold', 'weight', 'n_nodes', 'n_edges')}}
+                    for row in rows]
+        return 'application/geo+json', self._geojson(features)
+
+    def _snap_response(self, points, snaps, fmt):
+        snapped = self._wgs84([(float(s.x[0]), float(s.y[0])) for s in snaps])
+        if fmt == 'gpx':
+            return 'application/gpx+xml', write_gpx(waypoints=[(f"WP{i + 1}", lon, lat)
+                                                               for i, (lon, lat) in enumerate(snapped.tolist())])
+        features = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [round(lon, 7), round(lat, 7)]},
+                     'properties': {'input': list(point), 'segment': int(s.segment[0]),
+                                    'segment_label': str(self.graph.segment_labels[int(s.segment[0])]),
+                                    'fraction': float(s.fraction[0]), 'distance_m': float(s.distance[0])}}
+                    for point, s, (lon, lat) in zip(points, snaps, snapped.tolist())]
+        return 'application/geo+json', self._geojson(features)
+
+    def stats_report(self):
+        latencies = np.array(self.latencies, dtype=np.float64)
+        report = dict(self.stats, cache_size=len(self._cache), inflight=len(self._inflight),
+                      n_nodes=self.graph.n_nodes, n_edges=self.graph.n_edges)
+        if len(latencies):
+            report.update(latency_ms_p50=float(np.percentile(latencies, 50) * 1000),
+                          latency_ms_p99=float(np.percentile(latencies, 99) * 1000))
+        # Emprise du graphe en WGS84 (utile aux clients de test)
+        lon, lat = self._to_wgs84.transform([self.graph.x.min(), self.graph.x.max()],
+                                            [self.graph.y.min(), self.graph.y.max()])
+        report['bounds'] = [lon[0], lat[0], lon[1], lat[1]]
+        return report
+
+    # --- HTTP ------------------------------------------------------------------------
+
+    async def dispatch(self, method, target, headers, body):
+        """Traite une requête : renvoie (statut, type de contenu, corps)."""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        content_type = headers.get('content-type', '')
+
+        def param(name, default=None):
+            return query.get(name, [default])[-1]
+
+        fmt = param('format') or ('gpx' if 'gpx' in headers.get('accept', '') else 'geojson')
+        if fmt not in ('geojson', 'gpx'):
+            raise RequestError(f"Format inconnu : {fmt}")
+        profile, criterion = param('profile'), param('criterion', 'time')
+
+        if url.path == '/route':
+            points = self._points(query, body, content_type, names=('from', 'points', 'to'))
+            result = await self.route(points, profile, criterion)
+            return (HTTPStatus.OK,) + self._route_response(result, fmt)
+        if url.path == '/isochrone':
+            points = self._points(query, body, content_type, names=('at', 'points'))
+            try:
+                thresholds = [float(value) for value in param('thresholds', '').split(',') if value]
+                buffer_distance = float(param('buffer', 50.0))
+            except ValueError:
+                raise RequestError("Seuils ou tampon invalides")
+            rows = await self.isochrone(points, thresholds, profile, criterion, param('footprint', 'buffer'),
+                                        buffer_distance)
+            return (HTTPStatus.OK,) + self._isochrone_response(rows, fmt)
+        if url.path == '/snap':
+            points = self._points(query, body, content_type)
+            if not points:
+                raise RequestError("Aucun point à accrocher")
+            snaps = await self.snap(points)
+            return (HTTPStatus.OK,) + self._snap_response(points, snaps, fmt)
+        if url.path in ('/stats', '/health'):
+            return HTTPStatus.OK, 'application/json', json.dumps(self.stats_report())
+        raise RequestError(f"Point d'entrée inconnu : {url.path}", HTTPStatus.NOT_FOUND)
+
+    async def _respond(self, method, target, headers, body):
+        started = time.perf_counter()
+        self.stats['requests'] += 1
+        if method == 'OPTIONS':
+            return HTTPStatus.NO_CONTENT, 'text/plain', ''
+        try:
+            if method not in ('GET', 'POST'):
+                raise RequestError(f"Méthode non prise en charge : {method}", HTTPStatus.METHOD_NOT_ALLOWED)
+            response = await self.dispatch(method, target, headers, body)
+        except RequestError as error:
+            self.stats['errors'] += 1
+            response = error.status, 'application/json', json.dumps({'error': str(error)}, ensure_ascii=False)
+        except Exception as error:
+            self.stats['errors'] += 1
+            traceback.print_exc()
+            response = (HTTPStatus.INTERNAL_SERVER_ERROR, 'application/json',
+                        json.dumps({'error': f"{type(error).__name__}: {error}"}, ensure_ascii=False))
+        self.latencies.append(time.perf_counter() - started)
+        return response
+
+    async def handle_connection(self, reader, writer):
+        """Connexion HTTP/1.1 (keep-alive) : requêtes traitées l'une après l'autre."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    length = None
+                if length is None:
+                    # Corps illisible : la connexion ne peut pas être réutilisée
+                    self.stats['requests'] += 1
+                    self.stats['errors'] += 1
+                    status, content_type = HTTPStatus.BAD_REQUEST, 'application/json'
+                    payload = json.dumps({'error': f"Content-Length invalide : {headers['content-length']}"},
+                                         ensure_ascii=False)
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, content_type, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'text/plain', ''
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, content_type, payload = await self._respond(method.upper(), target, headers, body)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                data = payload.encode('utf-8')
+                head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                        f"Content-Type: {content_type}; charset=utf-8",
+                        f"Content-Length: {len(data)}",
+                        # La page de dessin est servie depuis un fichier ou un autre port
+                        "Access-Control-Allow-Origin: *",
+                        "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+                        "Access-Control-Allow-Headers: Content-Type",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Arrêt du service avec des connexions persistantes encore ouvertes
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Démarre le serveur (port 0 : port libre choisi par le système) ; renvoie l'asyncio.Server."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.address = server.sockets[0].getsockname()[:2]
+        print(f"Service d'itinéraires à l'écoute sur http://{self.address[0]}:{self.address[1]} "
+              f"({self.graph.n_nodes} nœuds, {self.graph.n_edges} arêtes)")
+        return server
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(directory, host=DEFAULT_HOST, port=DEFAULT_PORT, **kwargs):
+    """Lance le service jusqu'à interruption."""
+    service = RoutingService(directory, **kwargs)
+    server = await service.start(host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    processed_data_dir = Path("./data/processed")
+    try:
+        asyncio.run(serve(processed_data_dir / "routing_graph",
+                          port=int(os.environ.get('POSEIDON_PORT', DEFAULT_PORT))))
+    except KeyboardInterrupt:
+        pass
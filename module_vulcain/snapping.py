@@ -0,0 +1,372 @@
+# rando_sim/snapping.py
+import hashlib
+import math
+import pickle
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+from shapely.ops import substring
+
+from instrumentation import progress
+from routing import Route, dijkstra
+
+# Système de coordonnées du graphe (Lambert-93) et des traces GPX (WGS84)
+GRAPH_CRS = 'EPSG:2154'
+GPX_CRS = 'EPSG:4326'
+
+SNAP_INDEX_FILE = "snap_index.pkl"
+SNAP_INDEX_VERSION = 2
+
+
+def read_gpx(path):
+    """Lit un fichier GPX (waypoints et traces) tel qu'exporté par dessin_sur_carte_IGN.html.
+
+    Renvoie {'waypoints': [(nom, lon, lat)], 'tracks': [(nom, tableau (n, 2) lon/lat)]}.
+    """
+    root = ET.parse(path).getroot()
+    # Espace de noms GPX éventuel ({http://www.topografix.com/GPX/1/1})
+    ns = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+
+    waypoints = []
+    for i, wpt in enumerate(root.iter(f"{ns}wpt")):
+        name = wpt.findtext(f"{ns}name") or f"WP{i + 1}"
+        waypoints.append((name, float(wpt.get('lon')), float(wpt.get('lat'))))
+
+    tracks = []
+    for i, trk in enumerate(root.iter(f"{ns}trk")):
+        name = trk.findtext(f"{ns}name") or f"Trace {i + 1}"
+        points = [(float(pt.get('lon')), float(pt.get('lat'))) for pt in trk.iter(f"{ns}trkpt")]
+        tracks.append((name, np.array(points, dtype=np.float64).reshape(-1, 2)))
+
+    return {'waypoints': waypoints, 'tracks': tracks}
+
+
+def write_gpx(waypoints=(), tracks=(), creator="Poseidon"):
+    """Écrit un document GPX 1.1 (même structure que celui de dessin_sur_carte_IGN.html).
+
+    `waypoints` : [(nom, lon, lat)] ; `tracks` : [(nom, tableau (n, 2) lon/lat)]. Renvoie une chaîne.
+    """
+    root = ET.Element('gpx', {'version': '1.1', 'creator': creator, 'xmlns': 'http://www.topografix.com/GPX/1/1'})
+    for name, lon, lat in waypoints:
+        wpt = ET.SubElement(root, 'wpt', {'lat': f"{lat:.7f}", 'lon': f"{lon:.7f}"})
+        ET.SubElement(wpt, 'name').text = str(name)
+    for name, coords in tracks:
+        trk = ET.SubElement(root, 'trk')
+        ET.SubElement(trk, 'name').text = str(name)
+        segment = ET.SubElement(trk, 'trkseg')
+        for lon, lat in np.asarray(coords, dtype=np.float64).reshape(-1, 2).tolist():
+            ET.SubElement(segment, 'trkpt', {'lat': f"{lat:.7f}", 'lon': f"{lon:.7f}"})
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding='unicode')
+
+
+class EdgeSnap:
+    """Projection de points sur les segments du graphe (résultat vectorisé).
+
+    `point` est l'indice du point d'entrée projeté, `fraction` la position le long de la
+    géométrie du segment (0 : nœud de départ, 1 : nœud d'arrivée) ; `forward_edge` /
+    `reverse_edge` valent -1 si le sens n'existe pas.
+    """
+
+    def __init__(self, point, segment, fraction, distance, x, y, start_node, end_node, forward_edge, reverse_edge):
+        self.point = point
+        self.segment = segment
+        self.fraction = fraction
+        self.distance = distance
+        self.x = x
+        self.y = y
+        self.start_node = start_node
+        self.end_node = end_node
+        self.forward_edge = forward_edge
+        self.reverse_edge = reverse_edge
+
+    def __len__(self):
+        return len(self.segment)
+
+    def __getitem__(self, i):
+        return EdgeSnap(*(np.atleast_1d(value[i]) for value in (
+            self.point, self.segment, self.fraction, self.distance, self.x, self.y,
+            self.start_node, self.end_node, self.forward_edge, self.reverse_edge)))
+
+    @property
+    def points(self):
+        return shapely.points(self.x, self.y)
+
+
+class SnapIndex:
+    """Index spatial d'accrochage au graphe : nœud le plus proche, k plus proches, point le plus proche sur une arête.
+
+    Le KD-tree des nœuds est construit une fois et sauvegardé avec le graphe ; l'arbre
+    des segments (STRtree) est reconstruit à la demande depuis les géométries.
+    """
+
+    def __init__(self, graph, tree=None, crs=GRAPH_CRS):
+        self.graph = graph
+        self.crs = crs
+        self.tree = tree if tree is not None else cKDTree(np.column_stack([graph.x, graph.y]))
+        self._segments = None
+        self._transformers = {}
+
+    # --- Coordonnées -----------------------------------------------------------------
+
+    def to_graph_crs(self, xs, ys, crs=None):
+        """Reprojette des coordonnées vers le système du graphe (sans effet si `crs` est déjà le sien)."""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if crs is None or crs == self.crs:
+            return xs, ys
+        if crs not in self._transformers:
+            self._transformers[crs] = Transformer.from_crs(crs, self.crs, always_xy=True)
+        return self._transformers[crs].transform(xs, ys)
+
+    # --- Nœuds -----------------------------------------------------------------------
+
+    def nearest_node(self, xs, ys, crs=None, max_distance=np.inf):
+        """Nœud le plus proche de chaque point : (nœuds, distances), -1 au-delà de `max_distance`."""
+        xs, ys = self.to_graph_crs(xs, ys, crs)
+        distances, nodes = self.tree.query(np.column_stack([np.ravel(xs), np.ravel(ys)]),
+                                           distance_upper_bound=max_distance)
+        nodes = np.where(np.isfinite(distances), nodes, -1)
+        return nodes, distances
+
+    def k_nearest_nodes(self, xs, ys, k=5, crs=None):
+        """Les `k` nœuds les plus proches de chaque point : tableaux (n, k) de nœuds et de distances."""
+        xs, ys = self.to_graph_crs(xs, ys, crs)
+        k = min(k, self.graph.n_nodes)
+        distances, nodes = self.tree.query(np.column_stack([np.ravel(xs), np.ravel(ys)]), k=k)
+        return nodes.reshape(-1, k), distances.reshape(-1, k)
+
+    # --- Segments --------------------------------------------------------------------
+
+    def _segment_table(self):
+        """Géométries, nœuds extrêmes et arêtes de chaque segment, avec leur STRtree."""
+        if self._segments is None:
+            graph = self.graph
+            n_segments = len(graph.segment_labels)
+            edges = np.arange(graph.n_edges)
+            reversed_ = graph.edge_reversed.astype(bool)
+
+            forward_edge = np.full(n_segments, -1, dtype=np.int64)
+            reverse_edge = np.full(n_segments, -1, dtype=np.int64)
+            forward_edge[graph.segment_ids[~reversed_]] = edges[~reversed_]
+            reverse_edge[graph.segment_ids[reversed_]] = edges[reversed_]
+
+            # Le nœud de départ du segment est la source de l'arête directe, ou la cible de l'arête inverse
+            sources, targets = graph.sources, graph.targets
+            start_node = np.where(forward_edge >= 0, sources[forward_edge], targets[reverse_edge])
+            end_node = np.where(forward_edge >= 0, targets[forward_edge], sources[reverse_edge])
+
+            geometries = graph.geometry_array()
+            missing = shapely.is_missing(geometries)
+            if missing.any():
+                # Sans géométrie, le segment est le tronçon droit entre ses deux nœuds
+                geometries = geometries.copy()
+                geometries[missing] = shapely.linestrings(np.stack([
+                    np.column_stack([graph.x[start_node[missing]], graph.y[start_node[missing]]]),
+                    np.column_stack([graph.x[end_node[missing]], graph.y[end_node[missing]]]),
+                ], axis=1))
+
+            self._segments = {
+                'geometries': geometries,
+                'tree': shapely.STRtree(geometries),
+                'start_node': start_node.astype(np.int64),
+                'end_node': end_node.astype(np.int64),
+                'forward_edge': forward_edge,
+                'reverse_edge': reverse_edge,
+            }
+        return self._segments
+
+    def nearest_edge(self, xs, ys, crs=None, max_distance=None):
+        """Projette chaque point sur le segment le plus proche (requête vectorisée).
+
+        Les points sans segment à moins de `max_distance` sont absents du résultat (voir
+        `EdgeSnap.point`) ; en cas d'égalité, seule la première projection est gardée.
+        """
+        xs, ys = self.to_graph_crs(xs, ys, crs)
+        table = self._segment_table()
+        points = shapely.points(np.ravel(xs), np.ravel(ys))
+
+        (point_idx, segments), distances = table['tree'].query_nearest(
+            points, max_distance=max_distance, return_distance=True, all_matches=False)
+
+        lines = table['geometries'][segments]
+        fraction = shapely.line_locate_point(lines, points[point_idx], normalized=True)
+        projected = shapely.line_interpolate_point(lines, fraction, normalized=True)
+        coords = shapely.get_coordinates(projected)
+
+        return EdgeSnap(point_idx, segments, fraction, distances, coords[:, 0], coords[:, 1],
+                        table['start_node'][segments], table['end_node'][segments],
+                        table['forward_edge'][segments], table['reverse_edge'][segments])
+
+    def snap_track(self, xs, ys, crs=None, mode='edge', max_distance=None):
+        """Accroche une trace entière en une passe : nœuds (mode='node') ou points sur arêtes (mode='edge')."""
+        if mode == 'node':
+            return self.nearest_node(xs, ys, crs, np.inf if max_distance is None else max_distance)
+        if mode == 'edge':
+            return self.nearest_edge(xs, ys, crs, max_distance)
+        raise ValueError(f"Mode d'accrochage inconnu : {mode}")
+
+    def snap_gpx(self, path, mode='edge', max_distance=None):
+        """Accroche les waypoints et les points de trace d'un fichier GPX (WGS84) au graphe."""
+        gpx = read_gpx(path)
+        result = {'waypoints': [], 'tracks': []}
+        if gpx['waypoints']:
+            names, lons, lats = zip(*gpx['waypoints'])
+            result['waypoints'] = (list(names), self.snap_track(lons, lats, GPX_CRS, mode, max_distance))
+        for name, coords in gpx['tracks']:
+            result['tracks'].append((name, self.snap_track(coords[:, 0], coords[:, 1], GPX_CRS, mode, max_distance)))
+        return result
+
+    # --- Découpage virtuel -----------------------------------------------------------
+
+    @staticmethod
+    def _edge_cost(weights, edge, part):
+        """Coût de la fraction `part` d'une arête (inf si l'arête n'existe pas)."""
+        return part * weights[edge] if edge >= 0 else math.inf
+
+    def departure_costs(self, snap, weights):
+        """Coût pour rejoindre depuis le point accroché chaque extrémité de son segment."""
+        f = float(snap.fraction[0])
+        return {
+            int(snap.end_node[0]): self._edge_cost(weights, int(snap.forward_edge[0]), 1 - f),
+            int(snap.start_node[0]): self._edge_cost(weights, int(snap.reverse_edge[0]), f),
+        }
+
+    def arrival_costs(self, snap, weights):
+        """Coût pour atteindre le point accroché depuis chaque extrémité de son segment."""
+        f = float(snap.fraction[0])
+        return {
+            int(snap.start_node[0]): self._edge_cost(weights, int(snap.forward_edge[0]), f),
+            int(snap.end_node[0]): self._edge_cost(weights, int(snap.reverse_edge[0]), 1 - f),
+        }
+
+    def route(self, router, origin, destination, weight='time'):
+        """Itinéraire entre deux points accrochés sur des arêtes (un élément d'`EdgeSnap` chacun).
+
+        Le segment de chaque point est coupé virtuellement en deux : le graphe n'est pas modifié.
+        """
+        weights = router.weights(weight)
+        sources = {node: cost for node, cost in self.departure_costs(origin, weights).items() if cost < math.inf}
+        arrivals = self.arrival_costs(destination, weights)
+
+        settled, pred_edge = dijkstra(router._offsets, router._targets, weights, sources,
+                                      stop_at=[node for node, cost in arrivals.items() if cost < math.inf])
+        candidates = [(settled[node] + cost, node) for node, cost in arrivals.items() if node in settled]
+        best, end = min(candidates, default=(math.inf, None))
+
+        # Deux points sur le même segment : le trajet direct le long du segment peut être meilleur
+        if int(origin.segment[0]) == int(destination.segment[0]):
+            fa, fb = float(origin.fraction[0]), float(destination.fraction[0])
+            edge = int(origin.forward_edge[0] if fb >= fa else origin.reverse_edge[0])
+            direct = self._edge_cost(weights, edge, abs(fb - fa))
+            if direct <= best:
+                return SnappedRoute(self.graph, [], [], weight, direct, origin, destination)
+
+        if end is None or not math.isfinite(best):
+            raise ValueError("Aucun itinéraire entre les deux points")
+
+        edges = []
+        node = end
+        # Un nœud de départ sans arête prédécesseur est l'une des extrémités du segment d'origine
+        while node in pred_edge:
+            edge = pred_edge[node]
+            edges.append(edge)
+            node = router._edge_source(edge)
+        edges.reverse()
+        nodes = [node] + [router._targets[edge] for edge in edges]
+        return SnappedRoute(self.graph, nodes, edges, weight, best, origin, destination)
+
+    # --- Persistance -----------------------------------------------------------------
+
+    @staticmethod
+    def _fingerprint(graph):
+        """Empreinte des coordonnées des nœuds : un arbre sauvegardé n'est réutilisé que pour ces nœuds."""
+        digest = hashlib.sha256()
+        for values in (graph.x, graph.y):
+            digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def save(self, directory):
+        """Sauvegarde le KD-tree des nœuds dans le répertoire du graphe."""
+        path = Path(directory) / SNAP_INDEX_FILE
+        with open(path, 'wb') as f:
+            pickle.dump({'version': SNAP_INDEX_VERSION, 'n_nodes': self.graph.n_nodes,
+                         'fingerprint': self._fingerprint(self.graph), 'crs': self.crs, 'tree': self.tree},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @classmethod
+    def load(cls, directory, graph):
+        """Recharge l'index sauvegardé avec le graphe, ou le reconstruit s'il est absent ou périmé."""
+        path = Path(directory) / SNAP_INDEX_FILE
+        if path.exists():
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if (data.get('version') == SNAP_INDEX_VERSION and data.get('n_nodes') == graph.n_nodes
+                    and data.get('fingerprint') == cls._fingerprint(graph)):
+                return cls(graph, tree=data['tree'], crs=data['crs'])
+            progress(f"Index d'accrochage {path} périmé, reconstruction")
+        return cls(graph)
+
+
+class SnappedRoute(Route):
+    """Itinéraire entre deux points accrochés : la géométrie inclut les portions d'arêtes aux extrémités."""
+
+    def __init__(self, graph, nodes, edges, weight, cost, origin, destination):
+        super().__init__(graph, nodes, edges, weight, cost)
+        self.origin = origin
+        self.destination = destination
+
+    def _partial_edges(self):
+        """Portions d'arêtes parcourues aux extrémités : [(arête, fraction)], comme dans le calcul du coût."""
+        origin, destination = self.origin, self.destination
+        fa, fb = float(origin.fraction[0]), float(destination.fraction[0])
+        if not self.edges and not self.nodes:
+            return [(int(origin.forward_edge[0] if fb >= fa else origin.reverse_edge[0]), abs(fb - fa))]
+        first, last = self.nodes[0], self.nodes[-1]
+        head = (int(origin.forward_edge[0]), 1 - fa) if first == int(origin.end_node[0]) \
+            else (int(origin.reverse_edge[0]), fa)
+        tail = (int(destination.forward_edge[0]), fb) if last == int(destination.start_node[0]) \
+            else (int(destination.reverse_edge[0]), 1 - fb)
+        return [head, tail]
+
+    @property
+    def totals(self):
+        """Totaux de l'itinéraire, portions d'arêtes de départ et d'arrivée comprises."""
+        totals = super().totals
+        for edge, part in self._partial_edges():
+            if edge < 0 or part <= 0:
+                continue
+            for name in totals:
+                totals[name] += part * float(self.graph.edge_data[name][edge])
+        return totals
+
+    def _segment_part(self, snap, start, end):
+        """Portion du segment d'un point accroché entre deux fractions (orientée de start vers end)."""
+        geometry = self.graph.geometries[int(snap.segment[0])]
+        if geometry is None:
+            return []
+        part = shapely.get_coordinates(substring(geometry, min(start, end), max(start, end), normalized=True)).tolist()
+        return part[::-1] if start > end else part
+
+    @property
+    def geometry(self):
+        fa, fb = float(self.origin.fraction[0]), float(self.destination.fraction[0])
+        if not self.edges and not self.nodes:
+            coords = self._segment_part(self.origin, fa, fb)
+        else:
+            first, last = self.nodes[0], self.nodes[-1]
+            head = self._segment_part(self.origin, fa, 1.0 if first == int(self.origin.end_node[0]) else 0.0)
+            tail = self._segment_part(self.destination, 0.0 if last == int(self.destination.start_node[0]) else 1.0, fb)
+            middle = shapely.get_coordinates(super().geometry).tolist()
+            coords = head + middle + tail
+        coords = [(float(self.origin.x[0]), float(self.origin.y[0]))] + coords + \
+                 [(float(self.destination.x[0]), float(self.destination.y[0]))]
+        # Supprime les points consécutifs confondus
+        coords = [c for i, c in enumerate(coords) if i == 0 or c != coords[i - 1]]
+        if len(coords) < 2:
+            return shapely.Point(coords[0])
+        return shapely.LineString(coords)
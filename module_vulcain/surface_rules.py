@@ -0,0 +1,78 @@
+# rando_sim/surface_rules.py
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Table de règles par défaut, livrée avec le module
+DEFAULT_RULES_PATH = Path(__file__).with_name("surface_rules.json")
+
+
+class SurfaceClassifier:
+    """Classification des types de surface par une table de règles déclarative.
+
+    Chaque règle associe un `network_type` (absent : tous) et un motif recherché dans
+    `nature` (absent : toute valeur ; sous-chaîne, ou expression régulière avec
+    `"regex": true`) à un `surface_type`. La première règle satisfaite l'emporte ; sans
+    règle satisfaite, la surface vaut `default`.
+
+    Le résultat est un pd.Categorical dont les catégories (et donc les codes) suivent
+    l'ordre de `surface_types` : ajouter un type de surface ne demande que la table.
+    """
+
+    def __init__(self, rules, default='chemin', surface_types=None):
+        self.rules = [dict(rule) for rule in rules]
+        self.default = default
+
+        # Catégories déclarées, complétées par celles qui n'apparaissent que dans les règles
+        categories = list(surface_types or [])
+        for surface_type in [rule['surface_type'] for rule in self.rules] + [default]:
+            if surface_type not in categories:
+                categories.append(surface_type)
+        self.categories = categories
+
+    @classmethod
+    def from_file(cls, path=None):
+        """Charge une table de règles JSON (celle du module par défaut)."""
+        with open(path or DEFAULT_RULES_PATH, encoding='utf-8') as f:
+            table = json.load(f)
+        return cls(table['rules'], default=table.get('default', 'chemin'),
+                   surface_types=table.get('surface_types'))
+
+    def to_dict(self):
+        return {'surface_types': self.categories, 'default': self.default, 'rules': self.rules}
+
+    def classify(self, network_type, nature):
+        """Classe toutes les lignes en une passe vectorisée (pd.Categorical).
+
+        Les règles ne sont évaluées que sur les couples (network_type, nature) distincts,
+        quelques centaines même pour un département entier.
+        """
+        pairs = pd.DataFrame({'network_type': pd.Series(network_type, dtype=object).to_numpy(),
+                              'nature': pd.Series(nature, dtype=object).to_numpy()})
+        codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs), use_na_sentinel=False)
+        unique_types = pd.Series(uniques.get_level_values(0), dtype=object)
+        # Comme str() : une nature manquante devient 'None' ou 'nan' et ne correspond à aucun motif
+        unique_natures = pd.Series([str(value) for value in uniques.get_level_values(1)], dtype=object)
+
+        result = np.full(len(uniques), self.categories.index(self.default), dtype=np.int64)
+        unresolved = np.ones(len(uniques), dtype=bool)
+        for rule in self.rules:
+            match = unresolved.copy()
+            if 'network_type' in rule:
+                match &= (unique_types == rule['network_type']).to_numpy()
+            if 'nature' in rule:
+                match &= unique_natures.str.contains(rule['nature'], regex=rule.get('regex', False)).to_numpy()
+            result[match] = self.categories.index(rule['surface_type'])
+            unresolved &= ~match
+
+        return pd.Categorical.from_codes(result[codes], categories=self.categories)
+
+    def categorical(self, values):
+        """Convertit des libellés de surface (lus d'un GeoPackage par exemple) en pd.Categorical."""
+        if isinstance(values, pd.Categorical):
+            return values
+        values = pd.Series(values, dtype=object)
+        extra = [value for value in pd.unique(values.dropna()) if value not in self.categories]
+        return pd.Categorical(values, categories=self.categories + extra)
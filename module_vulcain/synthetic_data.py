@@ -0,0 +1,194 @@
+# rando_sim/synthetic_data.py
+import os
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from data_loader import BD_TOPO_LAYERS
+
+CRS = 'EPSG:2154'
+# Coin sud-ouest du territoire généré (Lambert-93, dans les Alpes comme la carte de démonstration)
+DEFAULT_ORIGIN = (950000.0, 6500000.0)
+# Pas de la grille du réseau (m) : ~2 segments par nœud, donc ~ (côté / pas)² * 2 segments
+NETWORK_STEP = 100.0
+# Part des segments de la grille retirés pour casser sa régularité
+NETWORK_DROP = 0.1
+# Dalles RGEALTI : 1000 x 1000 mailles
+DEM_TILE_CELLS = 1000
+DEM_NODATA = -99999.0
+
+ROAD_TYPES = ['Route départementale', 'Route communale', 'Chemin']
+PATH_NATURES = ['Sentier', 'Sentier', 'Chemin', 'Piste cyclable', 'Escalier']
+VEGETATION_NATURES = ['Forêt fermée de feuillus', 'Forêt fermée de conifères', 'Forêt ouverte', 'Lande ligneuse',
+                      'Haie', 'Vigne', 'Verger', 'Bois']
+WATER_NATURES = ['Lac', 'Étang', 'Retenue']
+
+
+def terrain_elevation(x, y, origin=DEFAULT_ORIGIN, seed=0):
+    """Relief synthétique lisse (vallées et crêtes), vectorisé : altitude en m aux points (x, y)."""
+    rng = np.random.default_rng(seed)
+    u = (np.asarray(x, dtype=np.float64) - origin[0]) / 1000.0
+    v = (np.asarray(y, dtype=np.float64) - origin[1]) / 1000.0
+    z = np.full(np.broadcast(u, v).shape, 1200.0)
+    # Quelques ondulations de longueurs d'onde de 2 à 20 km
+    for wavelength, amplitude in ((20.0, 600.0), (8.0, 250.0), (3.0, 80.0), (1.2, 20.0)):
+        angle, phase = rng.uniform(0, np.pi), rng.uniform(0, 2 * np.pi, 2)
+        du, dv = np.cos(angle), np.sin(angle)
+        z += amplitude * np.sin(2 * np.pi * (u * du + v * dv) / wavelength + phase[0]) \
+            * np.cos(2 * np.pi * (u * dv - v * du) / wavelength + phase[1])
+    return z
+
+
+def network_side(n_segments, step=NETWORK_STEP, drop=NETWORK_DROP):
+    """Côté (m) du territoire carré dont la grille compte au moins `n_segments` segments."""
+    return (max(2, int(np.ceil(np.sqrt(n_segments / (2.0 * (1 - drop)))))) + 1) * step
+
+
+def network(n_segments, origin=DEFAULT_ORIGIN, step=NETWORK_STEP, road_share=0.25, drop=NETWORK_DROP, seed=0):
+    """Réseau en grille déformée : (routes, chemins), GeoDataFrames au schéma de la BD TOPO.
+
+    Chaque maille de la grille est un segment à trois sommets (milieu décalé au hasard) ;
+    une part `drop` des segments est retirée pour casser la régularité.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(round(network_side(n_segments, step, drop) / step))
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    i, j = i.ravel(), j.ravel()
+    # Segments horizontaux puis verticaux
+    starts = np.concatenate([np.column_stack([i[i < n - 1], j[i < n - 1]]), np.column_stack([i[j < n - 1], j[j < n - 1]])])
+    ends = starts + np.concatenate([np.tile([1, 0], (int((i < n - 1).sum()), 1)),
+                                    np.tile([0, 1], (int((j < n - 1).sum()), 1))])
+    keep = rng.random(len(starts)) >= drop
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) > n_segments:
+        chosen = np.sort(rng.choice(len(starts), n_segments, replace=False))
+        starts, ends = starts[chosen], ends[chosen]
+
+    a = np.asarray(origin) + starts * step
+    b = np.asarray(origin) + ends * step
+    middle = (a + b) / 2 + rng.normal(0, step * 0.08, a.shape)
+    lines = shapely.linestrings(np.stack([a, middle, b], axis=1))
+
+    # Les routes suivent une ligne de grille sur quatre, le reste est en chemins et sentiers
+    on_road = (starts[:, 0] % 4 == 0) & (ends[:, 0] % 4 == 0) | (starts[:, 1] % 4 == 0) & (ends[:, 1] % 4 == 0)
+    on_road &= rng.random(len(lines)) < road_share * 2
+    roads = gpd.GeoDataFrame({'TYPE_ROUTE': rng.choice(ROAD_TYPES, int(on_road.sum()))},
+                             geometry=lines[on_road], crs=CRS)
+    n_paths = int((~on_road).sum())
+    # Quelques passerelles (POS_SOL = 1), pour les traversées de cours d'eau
+    level = np.where(rng.random(n_paths) < 0.02, 1, 0)
+    paths = gpd.GeoDataFrame({'NATURE': rng.choice(PATH_NATURES, n_paths), 'POS_SOL': level},
+                             geometry=lines[~on_road], crs=CRS)
+    return roads, paths
+
+
+def _blobs(centers, radii, quad_segs, rng):
+    """Polygones irréguliers : disques dont les sommets sont décalés radialement."""
+    circles = shapely.buffer(shapely.points(centers), radii, quad_segs=quad_segs)
+    coords, owner = shapely.get_coordinates(circles, return_index=True)
+    factor = rng.uniform(0.7, 1.1, len(coords))
+    # Anneaux fermés : le dernier sommet reprend le premier
+    counts = shapely.get_num_coordinates(circles)
+    last = np.cumsum(counts) - 1
+    factor[last] = factor[last - counts + 1]
+    return shapely.set_coordinates(circles.copy(), centers[owner] + (coords - centers[owner]) * factor[:, None])
+
+
+def area_layers(bounds, n_buildings=1000, n_vegetation=500, n_water=20, n_rivers=10, seed=0):
+    """Bâtiments, zones de végétation, plans d'eau et cours d'eau aléatoires dans l'emprise."""
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = bounds
+
+    def uniform(n):
+        return np.column_stack([rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n)])
+
+    # Bâtiments : rectangles de 6 à 20 m
+    centers = uniform(n_buildings)
+    half = rng.uniform(3, 10, (n_buildings, 2))
+    buildings = gpd.GeoDataFrame(geometry=shapely.box(*(centers - half).T, *(centers + half).T), crs=CRS)
+
+    # Végétation : surtout de petites zones, quelques massifs étendus et détaillés
+    large = rng.random(n_vegetation) < 0.05
+    radii = np.where(large, rng.uniform(800, 3000, n_vegetation), rng.uniform(50, 400, n_vegetation))
+    polygons = np.empty(n_vegetation, dtype=object)
+    centers = uniform(n_vegetation)
+    for mask, quad_segs in ((~large, 4), (large, 64)):
+        if mask.any():
+            polygons[mask] = _blobs(centers[mask], radii[mask], quad_segs, rng)
+    vegetation = gpd.GeoDataFrame({'NATURE': rng.choice(VEGETATION_NATURES, n_vegetation)}, geometry=polygons, crs=CRS)
+
+    water = gpd.GeoDataFrame({'NATURE': rng.choice(WATER_NATURES, n_water)},
+                             geometry=_blobs(uniform(n_water), rng.uniform(30, 300, n_water), 8, rng), crs=CRS)
+
+    # Cours d'eau : marches aléatoires de pas 50 m traversant l'emprise
+    n_steps = max(2, int(max(xmax - xmin, ymax - ymin) / 50.0))
+    heading = rng.uniform(0, 2 * np.pi, (n_rivers, 1)) + np.cumsum(rng.normal(0, 0.15, (n_rivers, n_steps)), axis=1)
+    steps = np.stack([np.cos(heading), np.sin(heading)], axis=2) * 50.0
+    coords = uniform(n_rivers)[:, None, :] + np.cumsum(steps, axis=1)
+    rivers = gpd.GeoDataFrame({'NATURE': ["Cours d'eau"] * n_rivers, 'POS_SOL': np.zeros(n_rivers, dtype=np.int64)},
+                              geometry=shapely.clip_by_rect(shapely.linestrings(coords), *bounds), crs=CRS)
+    rivers = rivers[~rivers.geometry.is_empty]
+    return {'buildings': buildings, 'land_use': vegetation, 'water': water, 'rivers': rivers}
+
+
+def write_dem_tiles(directory, bounds, cell=25.0, origin=DEFAULT_ORIGIN, seed=0):
+    """Écrit des dalles RGEALTI .asc (1000 x 1000 mailles) couvrant l'emprise ; renvoie leurs chemins."""
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+    tile = DEM_TILE_CELLS * cell
+    xmin, ymin, xmax, ymax = bounds
+    paths = []
+    for x0 in np.arange(np.floor(xmin / tile) * tile, xmax, tile):
+        for y0 in np.arange(np.floor(ymin / tile) * tile, ymax, tile):
+            # Centres des mailles, ligne du haut en premier comme dans le format ASCII Grid
+            xs = x0 + (np.arange(DEM_TILE_CELLS) + 0.5) * cell
+            ys = y0 + tile - (np.arange(DEM_TILE_CELLS) + 0.5) * cell
+            z = terrain_elevation(xs[None, :], ys[:, None], origin, seed)
+            path = directory / f"RGEALTI_FXX_{int(x0 / 1000):04d}_{int((y0 + tile) / 1000):04d}_MNT_LAMB93_IGN69.asc"
+            with open(path, 'w') as f:
+                f.write(f"ncols {DEM_TILE_CELLS}\nnrows {DEM_TILE_CELLS}\nxllcorner {x0:.1f}\nyllcorner {y0:.1f}\n"
+                        f"cellsize {cell}\nNODATA_value {DEM_NODATA:.0f}\n")
+                np.savetxt(f, z, fmt='%.2f')
+            paths.append(path)
+    return paths
+
+
+def generate(raw_data_dir, n_segments=10_000, n_buildings=None, n_vegetation=None, n_water=None, n_rivers=None,
+             dem_cell=25.0, origin=DEFAULT_ORIGIN, seed=0):
+    """Génère un jeu de données brutes complet (couches BD TOPO en shapefiles et dalles MNT).
+
+    Les nombres d'entités surfaciques sont par défaut proportionnels au nombre de segments.
+    Renvoie un résumé (emprise, nombre d'entités par couche, nombre de dalles).
+    """
+    raw_data_dir = Path(raw_data_dir)
+    roads, paths = network(n_segments, origin, seed=seed)
+    side = network_side(n_segments)
+    bounds = (origin[0], origin[1], origin[0] + side, origin[1] + side)
+    layers = area_layers(bounds,
+                         n_buildings=n_buildings if n_buildings is not None else max(10, n_segments // 10),
+                         n_vegetation=n_vegetation if n_vegetation is not None else max(5, n_segments // 50),
+                         n_water=n_water if n_water is not None else max(1, n_segments // 2000),
+                         n_rivers=n_rivers if n_rivers is not None else max(1, n_segments // 5000),
+                         seed=seed)
+    layers.update(roads=roads, paths=paths)
+
+    for name, gdf in layers.items():
+        path = raw_data_dir / BD_TOPO_LAYERS[name][0]
+        os.makedirs(path.parent, exist_ok=True)
+        gdf.to_file(path, engine="pyogrio")
+    tiles = write_dem_tiles(raw_data_dir / "RGEALTI", bounds, cell=dem_cell, origin=origin, seed=seed)
+
+    return {
+        'bounds': bounds,
+        'n_segments': len(roads) + len(paths),
+        'layers': {name: len(gdf) for name, gdf in layers.items()},
+        'dem_tiles': len(tiles),
+        'dem_cell': dem_cell,
+    }
+
+
+if __name__ == "__main__":
+    summary = generate(Path("./data/synthetic/raw"), n_segments=10_000)
+    print(summary)
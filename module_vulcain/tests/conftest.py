@@ -0,0 +1,42 @@
+# rando_sim/tests/conftest.py
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+# Les modules de module_vulcain s'importent par leur nom, comme depuis les scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from compact_graph import CompactGraph  # noqa: E402
+
+GRID_SIDE = 15
+GRID_STEP = 50.0
+
+
+@pytest.fixture(scope='session')
+def grid_graph():
+    """Grille irrégulière (segments retirés au hasard) avec des coûts différents à l'aller et au retour.
+
+    Les longueurs et temps ne sont jamais inférieurs à ce que suppose le minorant de l'A*
+    (distance à vol d'oiseau, vitesse maximale du profil piéton).
+    """
+    rng = np.random.default_rng(0)
+    rows, cols = np.divmod(np.arange(GRID_SIDE * GRID_SIDE), GRID_SIDE)
+    node_coords = np.column_stack([cols * GRID_STEP, rows * GRID_STEP])
+    node = np.arange(GRID_SIDE * GRID_SIDE).reshape(GRID_SIDE, GRID_SIDE)
+    pairs = np.concatenate([np.column_stack([node[:, :-1].ravel(), node[:, 1:].ravel()]),
+                            np.column_stack([node[:-1, :].ravel(), node[1:, :].ravel()])])
+    pairs = pairs[rng.random(len(pairs)) > 0.15]
+    start_nodes, end_nodes = pairs[:, 0], pairs[:, 1]
+
+    distance = GRID_STEP * rng.uniform(1.0, 1.5, len(pairs))
+    slope = rng.uniform(-0.2, 0.2, len(pairs))
+    forward = {'distance': distance, 'time': distance / 1.3 * (1 + 3 * np.maximum(slope, 0)),
+               'effort': distance * (1 + 10 * np.abs(slope))}
+    reverse = {'distance': distance, 'time': distance / 1.3 * (1 + 3 * np.maximum(-slope, 0)),
+               'effort': distance * (1 + 10 * np.abs(slope))}
+    geometries = [LineString([node_coords[a], node_coords[b]]) for a, b in pairs]
+    labels = [f"TRONROUT{i:06d}" for i in range(len(pairs))]
+    return CompactGraph.from_segments(node_coords, start_nodes, end_nodes, geometries, labels, forward, reverse)
@@ -0,0 +1,17 @@
+# rando_sim/tests/test_contraction.py
+import pytest
+
+from contraction import ContractionHierarchy, verify_against_dijkstra
+
+
+@pytest.mark.parametrize('weight', ['distance', 'time', 'effort'])
+def test_hierarchy_matches_dijkstra(grid_graph, weight):
+    hierarchy = ContractionHierarchy.build(grid_graph, weight)
+    assert verify_against_dijkstra(hierarchy, n_pairs=200) == []
+
+
+def test_saved_hierarchy_matches_dijkstra(grid_graph, tmp_path):
+    hierarchy = ContractionHierarchy.build(grid_graph, 'time')
+    hierarchy.save(tmp_path / "ch_time.npz")
+    loaded = ContractionHierarchy.load(tmp_path / "ch_time.npz", grid_graph)
+    assert verify_against_dijkstra(loaded, n_pairs=200) == []
@@ -0,0 +1,41 @@
+# rando_sim/tests/test_overlays.py
+import math
+
+import numpy as np
+import pytest
+
+from overlays import Overlay, OverlayRouter
+
+
+def _assert_astar_matches_dijkstra(router, weight, n_pairs=300, seed=0):
+    rng = np.random.default_rng(seed)
+    for source, target in rng.integers(0, router.graph.n_nodes, size=(n_pairs, 2)).tolist():
+        settled, _ = router.dijkstra(source, weight=weight, targets=[target])
+        expected = settled.get(target, math.inf)
+        try:
+            cost = router.route(source, target, weight=weight, method='astar').cost
+        except ValueError:
+            cost = math.inf
+        assert cost == pytest.approx(expected, rel=1e-9), (source, target)
+
+
+@pytest.mark.parametrize('weight', ['time', 'effort'])
+def test_stacked_speedups_match_dijkstra(grid_graph, weight):
+    router = OverlayRouter(grid_graph)
+    rng = np.random.default_rng(1)
+    edges = rng.choice(grid_graph.n_edges, size=grid_graph.n_edges // 2, replace=False)
+    # Deux accélérations sur les mêmes arêtes : x0.09 au total
+    router.add(Overlay(edges, multiplier=0.3, name='convoi'))
+    router.add(Overlay(edges, multiplier=0.3, name='escorte'))
+    router.add(Overlay(edges[:len(edges) // 4], multiplier=3.0, name='zone contaminée'))
+    _assert_astar_matches_dijkstra(router, weight)
+
+
+def test_closures_and_removal_match_dijkstra(grid_graph):
+    router = OverlayRouter(grid_graph)
+    rng = np.random.default_rng(2)
+    closure = router.add(Overlay(rng.choice(grid_graph.n_edges, size=40, replace=False), name='ponts'))
+    router.add(Overlay(rng.choice(grid_graph.n_edges, size=200, replace=False), multiplier=0.5))
+    _assert_astar_matches_dijkstra(router, 'time', n_pairs=100)
+    router.remove(closure)
+    _assert_astar_matches_dijkstra(router, 'time', n_pairs=100, seed=1)
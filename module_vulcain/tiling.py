@@ -0,0 +1,193 @@
+# rando_sim/tiling.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from dem_sampler import DEMSampler
+from elevation_profiles import ElevationProfiles, compute_elevation_profiles
+from instrumentation import progress
+from mnt_index import MNTTileIndex
+
+
+def partition_by_dem_tiles(geometries, index, block_tiles=1):
+    """Répartit les lignes en blocs alignés sur la grille des dalles RGEALTI.
+
+    Chaque ligne appartient au bloc de `block_tiles` x `block_tiles` dalles qui contient
+    son premier sommet ; le bloc reçoit les dalles intersectant l'emprise de ses lignes,
+    y compris celles des voisines traversées. Renvoie une liste de (lignes, dalles).
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    rows = np.flatnonzero(~shapely.is_missing(geometries) & ~shapely.is_empty(geometries))
+    if len(rows) == 0:
+        return []
+
+    # Pas de la grille : taille d'une dalle (les dalles RGEALTI sont jointives et de taille fixe)
+    bounds = np.array([record['bounds'] for record in index.records], dtype=np.float64).reshape(-1, 4)
+    if len(bounds):
+        tile_width = np.median(bounds[:, 2] - bounds[:, 0])
+        tile_height = np.median(bounds[:, 3] - bounds[:, 1])
+        origin_x, origin_y = bounds[:, 0].min(), bounds[:, 1].min()
+    else:
+        tile_width = tile_height = 1000.0
+        origin_x = origin_y = 0.0
+
+    start = shapely.get_coordinates(shapely.get_point(shapely.get_geometry(geometries[rows], 0), 0))
+    block_x = np.floor((start[:, 0] - origin_x) / (tile_width * block_tiles)).astype(np.int64)
+    block_y = np.floor((start[:, 1] - origin_y) / (tile_height * block_tiles)).astype(np.int64)
+
+    # Blocs dans un ordre fixe (lignes puis colonnes), lignes dans l'ordre du réseau
+    order = np.lexsort((rows, block_x, block_y))
+    rows, block_x, block_y = rows[order], block_x[order], block_y[order]
+    change = np.flatnonzero((np.diff(block_x) != 0) | (np.diff(block_y) != 0)) + 1
+
+    # Dalles nécessaires à chaque ligne : intersection de son emprise avec les dalles
+    line_idx, tile_idx = (index.tree.query(shapely.envelope(geometries[rows]), predicate='intersects')
+                          if len(index.records) else (np.zeros(0, dtype=np.int64),) * 2)
+    line_block = np.zeros(len(rows), dtype=np.int64)
+    line_block[change] = 1
+    line_block = np.cumsum(line_block)
+
+    partitions = []
+    for block, block_rows in enumerate(np.split(rows, change)):
+        tiles = np.unique(tile_idx[line_block[line_idx] == block])
+        partitions.append((block_rows, tiles))
+    return partitions
+
+
+def process_partition(records, cache_dir, geometries, network_type, nature, classifier, spacing, method):
+    """Traite un bloc : classification des surfaces, profils altimétriques et pente.
+
+    Seules les dalles `records` du bloc sont ouvertes. Exécuté dans un processus de calcul.
+    """
+    columns = {'surface_type': classifier.classify(network_type, nature)}
+
+    # Bloc hors MNT : aucune altitude, mais les profils gardent leurs distances
+    sampler = DEMSampler(MNTTileIndex.from_records(records, cache_dir=cache_dir)) if records else _NoDEM()
+    profiles, summary = compute_elevation_profiles(geometries, sampler, spacing=spacing, method=method)
+    columns.update({column: summary[column].to_numpy() for column in summary.columns})
+
+    length_m = shapely.length(geometries)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['length_m'] = length_m
+        columns['slope_percent'] = 100 * (columns['elevation_end'] - columns['elevation_start']) / length_m
+
+    return columns, np.diff(profiles.offsets), profiles.distances, profiles.elevations
+
+
+class _NoDEM:
+    """Échantillonneur sans MNT : altitude inconnue partout."""
+
+    def sample(self, xs, ys, method='nearest'):
+        return np.full(len(xs), np.nan)
+
+
+def merge_partitions(n_rows, partitions, results):
+    """Fusionne les résultats des blocs dans l'ordre des lignes du réseau (indépendant de l'ordre d'exécution)."""
+    columns = {}
+    for (rows, _), (block_columns, _, _, _) in zip(partitions, results):
+        for name, values in block_columns.items():
+            if isinstance(values, pd.Categorical):
+                # Colonnes catégorielles fusionnées par leurs codes (mêmes catégories dans tous les blocs)
+                if name not in columns:
+                    columns[name] = pd.Categorical.from_codes(np.full(n_rows, -1), categories=values.categories)
+                codes = columns[name].codes.copy()
+                codes[rows] = values.codes
+                columns[name] = pd.Categorical.from_codes(codes, categories=values.categories)
+                continue
+            if name not in columns:
+                columns[name] = np.full(n_rows, np.nan)
+            columns[name][rows] = values
+
+    # Profils : sommets regroupés par ligne (tri stable, l'ordre des sommets est conservé)
+    counts = np.zeros(n_rows, dtype=np.int64)
+    point_rows, distances, elevations = [], [], []
+    for (rows, _), (_, block_counts, block_distances, block_elevations) in zip(partitions, results):
+        counts[rows] = block_counts
+        point_rows.append(np.repeat(rows, block_counts))
+        distances.append(block_distances)
+        elevations.append(block_elevations)
+    point_rows = np.concatenate(point_rows) if point_rows else np.zeros(0, dtype=np.int64)
+    order = np.argsort(point_rows, kind='stable')
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    profiles = ElevationProfiles(offsets,
+                                 np.concatenate(distances)[order] if distances else np.zeros(0),
+                                 np.concatenate(elevations)[order] if elevations else np.zeros(0))
+    return columns, profiles
+
+
+def run_tiled(network, index, classifier, spacing=None, method='nearest', workers=None, block_tiles=1):
+    """Exécute classification, élévation et pente par blocs de dalles dans un pool de processus.
+
+    Renvoie (colonnes par ligne du réseau, profils altimétriques), identiques au traitement
+    en un seul bloc.
+    """
+    workers = workers or os.cpu_count() or 1
+    geometries = network.geometry.values
+    partitions = partition_by_dem_tiles(geometries, index, block_tiles=block_tiles)
+    network_type = network['network_type'].to_numpy(dtype=object)
+    nature = network['nature'].to_numpy(dtype=object)
+    cache_dir = index.cache_dir
+
+    tasks = [([index.records[tile] for tile in tiles.tolist()], cache_dir, np.asarray(geometries[rows]),
+              network_type[rows], nature[rows], classifier, spacing, method)
+             for rows, tiles in partitions]
+
+    if workers <= 1:
+        results = [process_partition(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Les plus gros blocs d'abord pour équilibrer la charge
+            sizes = [len(rows) for rows, _ in partitions]
+            futures = {i: executor.submit(process_partition, *tasks[i])
+                       for i in sorted(range(len(tasks)), key=lambda i: -sizes[i])}
+            results = [futures[i].result() for i in range(len(tasks))]
+
+    return merge_partitions(len(network), partitions, results)
+
+
+def _same_values(a, b):
+    """Égalité stricte de deux colonnes (codes pour les catégorielles, NaN égaux entre eux)."""
+    if isinstance(a, pd.Categorical):
+        return np.array_equal(a.codes, b.codes) and list(a.categories) == list(b.categories)
+    return np.array_equal(a, b, equal_nan=True)
+
+
+def benchmark_workers(network, index, classifier, worker_counts=(1, 2, 4, 8, 16, 32), **kwargs):
+    """Mesure le temps du traitement par dalles selon le nombre de processus (résultats comparés au premier)."""
+    results = []
+    reference = None
+    reference_columns = None
+    for workers in worker_counts:
+        started = time.perf_counter()
+        columns, profiles = run_tiled(network, index, classifier, workers=workers, **kwargs)
+        elapsed = time.perf_counter() - started
+        if reference is None:
+            reference, reference_columns = elapsed, (columns, profiles)
+        identical = all(_same_values(columns[name], reference_columns[0][name]) for name in columns) and \
+            np.array_equal(profiles.elevations, reference_columns[1].elevations, equal_nan=True)
+        results.append({'workers': workers, 'seconds': elapsed, 'speedup': reference / elapsed,
+                        'identical': identical})
+        progress(f"  {workers:>3} processus : {elapsed:.2f} s (x{reference / elapsed:.1f})"
+                 f"{'' if identical else ' ÉCART'}")
+    return results
+
+
+if __name__ == "__main__":
+    import geopandas as gpd
+    from data_processor import DataProcessor
+
+    processed_data_dir = Path("./data/processed")
+    processor = DataProcessor(processed_data_dir)
+    processor.load_processed_data(layers=[])
+    network = gpd.read_file(processed_data_dir / "unified_network.gpkg")
+    index = MNTTileIndex.from_records(processor.mnt_metadata, cache_dir=processed_data_dir / "mnt_cache")
+
+    print(f"Traitement par dalles de {len(network)} lignes :")
+    benchmark_workers(network, index, processor.surface_classifier,
+                      worker_counts=[n for n in (1, 2, 4, 8, 16, 32) if n <= (os.cpu_count() or 1)])